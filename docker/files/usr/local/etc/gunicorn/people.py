@@ -1,4 +1,6 @@
 # Gunicorn-django settings
+import os
+
 bind = ["0.0.0.0:8000"]
 name = "people"
 python_path = "/app"
@@ -7,6 +9,7 @@ python_path = "/app"
 graceful_timeout = 90
 timeout = 90
 workers = 3
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
 
 # Logging
 # Using '-' for the access log file makes gunicorn log accesses to stdout
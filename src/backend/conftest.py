@@ -0,0 +1,13 @@
+"""Fixtures shared by all the test suites of the project."""
+
+from django.core.cache import cache
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with an empty cache to keep tests isolated."""
+    cache.clear()
+    yield
+    cache.clear()
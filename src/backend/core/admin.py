@@ -153,6 +153,21 @@ class TeamAccessAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(models.WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    """Admin interface to follow the delivery of webhook events."""
+
+    list_display = (
+        "webhook",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = ("webhook", "operations", "created_at", "updated_at")
+
+
 @admin.register(models.Invitation)
 class InvitationAdmin(admin.ModelAdmin):
     """Admin interface to handle invitations."""
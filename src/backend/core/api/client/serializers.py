@@ -1,5 +1,7 @@
 """Client serializers for the People core app."""
 
+from django.db import IntegrityError, transaction
+
 from rest_framework import exceptions, serializers
 from timezone_field.rest_framework import TimeZoneSerializerField
 
@@ -247,6 +249,120 @@ class TeamAccessReadOnlySerializer(TeamAccessSerializer):
         ]
 
 
+class TeamAccessBulkItemSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Validate an access to create in bulk, checked against the team as a whole."""
+
+    user = serializers.UUIDField()
+    role = serializers.ChoiceField(
+        choices=models.RoleChoices.choices, default=models.RoleChoices.MEMBER
+    )
+
+
+class TeamAccessBulkCreateSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """
+    Create accesses to a team for several users at once, with a constant number of
+    queries whatever the number of users.
+    """
+
+    accesses = TeamAccessBulkItemSerializer(
+        many=True, allow_empty=False, max_length=1000
+    )
+
+    def validate(self, attrs):
+        """Check access rights of the logged-in user and the users to add, once."""
+        request = self.context.get("request")
+        user = getattr(request, "user", None)
+        team_id = self.context["team_id"]
+        accesses = attrs["accesses"]
+
+        user_access = (
+            models.TeamAccess.objects.select_related("team")
+            .filter(team=team_id, user=user)
+            .first()
+        )
+        if not user_access or user_access.role not in [
+            models.RoleChoices.OWNER,
+            models.RoleChoices.ADMIN,
+        ]:
+            raise exceptions.PermissionDenied(
+                "You are not allowed to manage accesses for this team."
+            )
+
+        if user_access.role != models.RoleChoices.OWNER and any(
+            access["role"] == models.RoleChoices.OWNER for access in accesses
+        ):
+            raise exceptions.PermissionDenied(
+                "Only owners of a team can assign other users as owners."
+            )
+
+        user_ids = [access["user"] for access in accesses]
+        if len(set(user_ids)) != len(user_ids):
+            raise exceptions.ValidationError(
+                {"accesses": "Each user can only be given one access."}
+            )
+
+        users = models.User.objects.in_bulk(user_ids)
+        if unknown_ids := [str(pk) for pk in user_ids if pk not in users]:
+            raise exceptions.ValidationError(
+                {"accesses": f"Unknown users: {', '.join(unknown_ids)}."}
+            )
+
+        self._check_not_members(team_id, user_ids)
+
+        attrs["team"] = user_access.team
+        attrs["user_role"] = user_access.role
+        attrs["users"] = users
+        return attrs
+
+    @staticmethod
+    def _check_not_members(team_id, user_ids):
+        """Raise a validation error if any of the users is already in the team."""
+        if member_ids := list(
+            models.TeamAccess.objects.filter(
+                team=team_id, user__in=user_ids
+            ).values_list("user_id", flat=True)
+        ):
+            raise exceptions.ValidationError(
+                {
+                    "accesses": [
+                        "These users are already in this team: "
+                        f"{', '.join(str(pk) for pk in member_ids)}."
+                    ]
+                }
+            )
+
+    def create(self, validated_data):
+        """Create the accesses and synchronize them with the team webhooks at once."""
+        team = validated_data["team"]
+        try:
+            with transaction.atomic():
+                accesses = models.TeamAccess.objects.bulk_create(
+                    [
+                        models.TeamAccess(
+                            team=team,
+                            user=validated_data["users"][access["user"]],
+                            role=access["role"],
+                        )
+                        for access in validated_data["accesses"]
+                    ]
+                )
+        except IntegrityError:
+            # Users were added to the team by another request since the validation
+            self._check_not_members(
+                team.pk, [access["user"] for access in validated_data["accesses"]]
+            )
+            raise
+
+        # Annotate accesses to compute their abilities without a query per access
+        owners_count = models.TeamAccess.objects.filter(
+            team=team, role=models.RoleChoices.OWNER
+        ).count()
+        for access in accesses:
+            access.user_role = validated_data["user_role"]
+            access.owners_count = owners_count
+        return accesses
+
+
 class TeamSerializer(serializers.ModelSerializer):
     """Serialize teams."""
 
@@ -1,13 +1,16 @@
 """API endpoints"""
 
+import base64
 import datetime
-import operator
-from functools import reduce
+import json
+import uuid
 
 from django.conf import settings
-from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models import Count, OuterRef, Q, Subquery, Value
 from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.utils.decorators import method_decorator
+from django.utils.translation import gettext_lazy as _
 from django.views.decorators.cache import cache_page
 
 from rest_framework import (
@@ -22,11 +25,14 @@ from rest_framework import (
     viewsets,
 )
 from rest_framework.permissions import AllowAny
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 
 from core import models
 from core.api import permissions
 from core.api.client import serializers
-from core.utils.raw_sql import gen_sql_filter_json_array
+from core.utils.search import search_filter
 
 from mailbox_manager import models as domains_models
 
@@ -117,6 +123,148 @@ class Pagination(pagination.PageNumberPagination):
     page_size_query_param = "page_size"
 
 
+class ContactPagination(pagination.BasePagination):  # pylint: disable=abstract-method
+    """
+    Keyset pagination for contacts, sorted by full name then id.
+
+    The cursor holds the full name and the id of the contact it follows, or
+    precedes: pages are filtered on both fields, which keeps listing them cheap however
+    deep they are, and contacts sharing a full name are neither skipped nor repeated.
+    """
+
+    cursor_query_param = "cursor"
+    cursor_query_description = _("The pagination cursor value.")
+    invalid_cursor_message = _("Invalid cursor")
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    page_size_query_description = _("Number of results to return per page.")
+
+    def __init__(self):
+        """Initialize the links of the page, set once it is paginated."""
+        self.base_url = None
+        self.next_key = self.previous_key = None
+
+    def get_page_size(self, request):
+        """Return the page size asked for, within the maximum page size."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        """Return the full name and the id of the cursor, and whether it goes back."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            full_name, contact_id = cursor["k"]
+            return (str(full_name), uuid.UUID(contact_id)), bool(cursor["r"])
+        except (TypeError, ValueError, KeyError, AttributeError) as error:
+            raise exceptions.NotFound(self.invalid_cursor_message) from error
+
+    def encode_cursor(self, key, reverse):
+        """Return the URL of the page following, or preceding, a key if any."""
+        if key is None:
+            return None
+        cursor = json.dumps({"k": [key[0], str(key[1])], "r": reverse})
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def order_from_key(queryset, key, reverse):
+        """Return the contacts after a key in order, or before it in reverse order."""
+        if key is not None:
+            full_name, contact_id = key
+            lookup = "lt" if reverse else "gt"
+            queryset = queryset.filter(
+                Q(**{f"full_name__{lookup}": full_name})
+                | Q(full_name=full_name, **{f"id__{lookup}": contact_id})
+            )
+        ordering = ("-full_name", "-id") if reverse else ("full_name", "id")
+        return queryset.order_by(*ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return the contacts following the key of the cursor, or preceding it when the
+        cursor goes back, fetching one more contact to know whether there are others.
+        """
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        key, reverse = self.decode_cursor(request)
+
+        page = list(self.order_from_key(queryset, key, reverse)[: page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+
+        # Contacts were on the other side of the cursor when it was built
+        if reverse:
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = key is not None, has_more
+        first_key = (page[0].full_name, page[0].id) if page else key
+        last_key = (page[-1].full_name, page[-1].id) if page else key
+        self.previous_key = first_key if has_previous else None
+        self.next_key = last_key if has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        """Return the contacts of the page with the links to the pages around."""
+        return response.Response(
+            {
+                "next": self.encode_cursor(self.next_key, False),
+                "previous": self.encode_cursor(self.previous_key, True),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        """Describe the paginated contacts in the API schema."""
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                    "example": 'http://api.example.org/accounts/?cursor=cD00ODY%3D"',
+                },
+                "previous": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                    "example": "http://api.example.org/accounts/?cursor=cj0xJnA9NDg3",
+                },
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        """Describe the cursor and page size query parameters in the API schema."""
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": str(self.cursor_query_description),
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": str(self.page_size_query_description),
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
 class BurstRateThrottle(throttling.UserRateThrottle):
     """
     Throttle rate for minutes. See DRF section in settings for default value.
@@ -146,12 +294,20 @@ class ContactViewSet(
     permission_classes = [permissions.AccessPermission]
     queryset = models.Contact.objects.select_related("user").all()
     serializer_class = serializers.ContactSerializer
+    pagination_class = ContactPagination
     throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
     ordering_fields = ["full_name", "short_name", "created_at"]
     ordering = ["full_name"]
+    stream_chunk_size = 2000
 
     def list(self, request, *args, **kwargs):
-        """Limit listed users by a query with throttle protection."""
+        """
+        Limit listed users by a query with throttle protection.
+
+        Contacts are paginated, unless the `stream` query parameter is set: all
+        contacts are then streamed as a JSON array, fetched from the database
+        by chunks so that memory usage does not depend on their number.
+        """
         user = self.request.user
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -173,20 +329,33 @@ class ContactViewSet(
         # - email (from data `emails` field)
         if query := self.request.GET.get("q", ""):
             queryset = queryset.filter(
-                Q(full_name__unaccent__icontains=query)
-                | Q(short_name__unaccent__icontains=query)
-                | Q(
-                    id__in=gen_sql_filter_json_array(
-                        queryset.model,
-                        "data->'emails'",
-                        "value",
-                        query,
-                    )
-                )
+                search_filter(query, "full_name", "short_name", "search_emails")
             )
 
-        serializer = self.get_serializer(queryset, many=True)
-        return response.Response(serializer.data)
+        if self.request.GET.get("stream", "").lower() in {"1", "true"}:
+            # JsonResponse can't stream: the content type must be set here
+            return StreamingHttpResponse(  # pylint: disable=http-response-with-content-type-json
+                self._stream_contacts(queryset.order_by("full_name", "id")),
+                content_type="application/json",
+            )
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def _stream_contacts(self, queryset):
+        """Serialize contacts one by one to yield them as a JSON array."""
+        serializer = self.get_serializer()
+        encoder = JSONEncoder()
+
+        yield "["
+        for i, contact in enumerate(
+            queryset.iterator(chunk_size=self.stream_chunk_size)
+        ):
+            if i:
+                yield ","
+            yield encoder.encode(serializer.to_representation(contact))
+        yield "]"
 
     def perform_create(self, serializer):
         """Set the current user as owner of the newly created contact."""
@@ -272,10 +441,7 @@ class UserViewSet(
 
             # Search by case-insensitive and accent-insensitive
             if query := self.request.GET.get("q", ""):
-                queryset = queryset.filter(
-                    Q(name__unaccent__icontains=query)
-                    | Q(email__unaccent__icontains=query)
-                )
+                queryset = queryset.filter(search_filter(query, "name", "email"))
 
         return queryset
 
@@ -313,39 +479,14 @@ class TeamViewSet(
 
     def get_queryset(self):
         """Custom queryset to get user related teams."""
-        teams_queryset = models.Team.objects.filter(
-            accesses__user=self.request.user,
-        )
-        depth_path = teams_queryset.values("depth", "path")
-
-        if not depth_path:
-            return models.Team.objects.none()
-
         user_role_query = models.TeamAccess.objects.filter(
             user=self.request.user, team=OuterRef("pk")
         ).values("role")[:1]
 
         return (
-            models.Team.objects.prefetch_related("accesses", "service_providers")
-            .filter(
-                reduce(
-                    operator.or_,
-                    (
-                        Q(
-                            # The team the user has access to
-                            depth=d["depth"],
-                            path=d["path"],
-                        )
-                        | Q(
-                            # The parent team the user has access to
-                            depth__lt=d["depth"],
-                            path__startswith=d["path"][: models.Team.steplen],
-                            organization_id=self.request.user.organization_id,
-                        )
-                        for d in depth_path
-                    ),
-                ),
-            )
+            # The teams the user has access to and their parent teams
+            models.Team.objects.visible_to(self.request.user)
+            .prefetch_related("accesses", "service_providers")
             # Abilities are computed based on logged-in user's role for the team
             # and if the user does not have access, it's ok to consider them as a member
             # because it's a parent team.
@@ -394,6 +535,10 @@ class TeamAccessViewSet(
         - role: str [owner|admin|member]
         Return partially updated team access
 
+    POST /api/v1.0/teams/<team_id>/accesses/bulk/ with expected data:
+        - accesses: list of objects with user: str and role: str [owner|admin|member]
+        Return newly created team accesses
+
     DELETE /api/v1.0/teams/<team_id>/accesses/<team_access_id>/
         Delete targeted team access
     """
@@ -430,6 +575,8 @@ class TeamAccessViewSet(
         """Chooses list or detail serializer according to the action."""
         if self.action in {"list", "retrieve"}:
             return self.list_serializer_class
+        if self.action == "bulk":
+            return serializers.TeamAccessBulkCreateSerializer
         return self.detail_serializer_class
 
     def get_queryset(self):
@@ -440,14 +587,21 @@ class TeamAccessViewSet(
         if self.action in {"list", "retrieve"}:
             if query := self.request.GET.get("q", ""):
                 queryset = queryset.filter(
-                    Q(user__email__unaccent__icontains=query)
-                    | Q(user__name__unaccent__icontains=query)
+                    search_filter(query, "user__email", "user__name")
                 )
 
             # Determine which role the logged-in user has in the team
             user_role_query = models.TeamAccess.objects.filter(
                 user=self.request.user, team=self.kwargs["team_id"]
             ).values("role")[:1]
+            owners_count_query = (
+                models.TeamAccess.objects.filter(
+                    team=self.kwargs["team_id"], role=models.RoleChoices.OWNER
+                )
+                .values("team")
+                .annotate(count=Count("pk"))
+                .values("count")
+            )
 
             queryset = (
                 # The logged-in user should be part of a team to see its accesses
@@ -458,12 +612,29 @@ class TeamAccessViewSet(
                 # the user role on each team access
                 .annotate(
                     user_role=Subquery(user_role_query),
+                    owners_count=Coalesce(Subquery(owners_count_query), 0),
                 )
                 .select_related("user")
                 .distinct()
             )
         return queryset
 
+    @decorators.action(detail=False, methods=["post"])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Create accesses for several users at once: permissions are checked once and
+        the team webhooks are called once with all the new members.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        accesses = serializer.save()
+        return response.Response(
+            self.list_serializer_class(
+                accesses, many=True, context=self.get_serializer_context()
+            ).data,
+            status=201,
+        )
+
     def destroy(self, request, *args, **kwargs):
         """Forbid deleting the last owner access"""
         instance = self.get_object()
@@ -1,11 +1,30 @@
 """People Core application"""
-# from django.apps import AppConfig
-# from django.utils.translation import gettext_lazy as _
 
+import logging
 
-# class CoreConfig(AppConfig):
-#     """Configuration class for the People core app."""
+from django.apps import AppConfig
+from django.conf import settings
 
-#     name = "core"
-#     app_label = "core"
-#     verbose_name = _("People core application")
+logger = logging.getLogger(__name__)
+
+
+class CoreConfig(AppConfig):
+    """Configuration class for the People core app."""
+
+    name = "core"
+
+    def ready(self):
+        """
+        Load and validate the resource server private key once, at startup, when the
+        resource server is configured: an invalid key stops the startup.
+        """
+        # pylint: disable=import-outside-toplevel
+        from core.resource_server import utils
+
+        if not settings.OIDC_RS_PRIVATE_KEY_STR:
+            logger.info(
+                "Resource server is not configured, its private key is not loaded."
+            )
+            return
+
+        utils.import_private_key_from_settings()
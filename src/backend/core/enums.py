@@ -1,3 +1,4 @@
+# pylint: disable=too-many-ancestors
 """
 Core application enums declaration
 """
@@ -23,3 +24,12 @@ class WebhookStatusChoices(models.TextChoices):
     FAILURE = "failure", _("Failure")
     PENDING = "pending", _("Pending")
     SUCCESS = "success", _("Success")
+
+
+class WebhookEventStatusChoices(models.TextChoices):
+    """Defines the possible statuses in which a webhook event can be."""
+
+    PENDING = "pending", _("Pending")
+    DELIVERED = "delivered", _("Delivered")
+    # Dead letters are kept to be replayed manually
+    DEAD = "dead", _("Dead")
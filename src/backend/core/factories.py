@@ -243,6 +243,18 @@ class TeamWebhookFactory(factory.django.DjangoModelFactory):
     url = factory.Sequence(lambda n: f"https://example.com/Groups/{n!s}")
 
 
+class WebhookEventFactory(factory.django.DjangoModelFactory):
+    """Create fake webhook events for testing."""
+
+    class Meta:
+        model = models.WebhookEvent
+
+    webhook = factory.SubFactory(TeamWebhookFactory)
+    operations = factory.LazyFunction(
+        lambda: [{"op": "add", "user_id": fake.uuid4(), "email": fake.email()}]
+    )
+
+
 class InvitationFactory(factory.django.DjangoModelFactory):
     """A factory to create invitations for a user"""
 
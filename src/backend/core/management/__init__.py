@@ -0,0 +1 @@
+"Core management module."
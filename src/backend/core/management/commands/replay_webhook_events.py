@@ -0,0 +1,70 @@
+"""Management command to replay webhook events"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.enums import WebhookEventStatusChoices
+from core.models import WebhookEvent
+from core.tasks import deliver_webhook_events, drain_webhook_events
+
+
+class Command(BaseCommand):
+    """
+    Management command to replay dead webhook events and deliver pending ones
+    """
+
+    help = (
+        "This command puts dead webhook events back in the queue, then delivers all "
+        "pending events that are due. Use it to catch up after a service provider "
+        "outage once it is fixed."
+    )
+
+    def add_arguments(self, parser):
+        """Add arguments to filter the events to replay."""
+        parser.add_argument(
+            "--team",
+            help="Only replay events of the webhooks of this team (id).",
+        )
+        parser.add_argument(
+            "--webhook",
+            help="Only replay events of this webhook (id).",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only replay events created since this ISO 8601 date and time.",
+        )
+
+    def handle(self, *args, **options):
+        """Handling of the management command."""
+        events = WebhookEvent.objects.filter(status=WebhookEventStatusChoices.DEAD)
+        if options["team"]:
+            events = events.filter(webhook__team_id=options["team"])
+        if options["webhook"]:
+            events = events.filter(webhook_id=options["webhook"])
+        if options["since"]:
+            events = events.filter(created_at__gte=options["since"])
+
+        replayed = events.update(
+            status=WebhookEventStatusChoices.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        self.stdout.write(f"Replaying {replayed} dead webhook event(s)...")
+
+        if retry_at := drain_webhook_events():
+            deliver_webhook_events.apply_async(eta=retry_at)
+
+        counts = {
+            status: WebhookEvent.objects.filter(status=status).count()
+            for status in [
+                WebhookEventStatusChoices.PENDING,
+                WebhookEventStatusChoices.DEAD,
+            ]
+        }
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {counts[WebhookEventStatusChoices.PENDING]} event(s) to retry "
+                f"later, {counts[WebhookEventStatusChoices.DEAD]} dead event(s)."
+            )
+        )
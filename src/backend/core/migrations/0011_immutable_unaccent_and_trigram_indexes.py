@@ -0,0 +1,38 @@
+import core.utils.search
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_team_depth_team_numchild_team_path_and_more'),
+    ]
+
+    operations = [
+        # `unaccent` is only stable because its dictionary can change: pinning the
+        # dictionary makes it safe to use in indexes.
+        migrations.RunSQL(
+            "CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text "
+            "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$ "
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;",
+            "DROP FUNCTION IF EXISTS immutable_unaccent(text);",
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('full_name')), name='gin_trgm_ops'), name='contact_full_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('short_name')), name='gin_trgm_ops'), name='contact_short_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('name')), name='gin_trgm_ops'), name='user_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('email')), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:52
+
+import core.utils.search
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_immutable_unaccent_and_trigram_indexes'),
+    ]
+
+    operations = [
+        # Join the values matched by a JSON path as plain text, so that searching them
+        # does not match the punctuation of the JSON document.
+        migrations.RunSQL(
+            "CREATE OR REPLACE FUNCTION jsonb_path_query_join(jsonb, jsonpath, text) "
+            "RETURNS text AS $$ SELECT string_agg(value #>> '{}', $3) "
+            "FROM jsonb_path_query($1, $2) AS value $$ "
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;",
+            "DROP FUNCTION IF EXISTS jsonb_path_query_join(jsonb, jsonpath, text);",
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='search_emails',
+            field=models.GeneratedField(db_persist=True, expression=models.Func('data', models.Value('$.emails[*].value'), models.Value('\n'), function='jsonb_path_query_join', output_field=models.TextField()), output_field=models.TextField()),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('search_emails')), name='gin_trgm_ops'), name='contact_emails_trgm_idx'),
+        ),
+    ]
@@ -1,11 +1,12 @@
 """
 Declare and configure the models for the People core application
 """
+# pylint: disable=too-many-lines
 
 import json
 import os
-import smtplib
 import uuid
+from collections import defaultdict
 from contextlib import suppress
 from datetime import timedelta
 from logging import getLogger
@@ -15,11 +16,9 @@ from django.conf import settings
 from django.contrib.auth import models as auth_models
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.postgres.fields import ArrayField
-from django.contrib.sites.models import Site
 from django.core import exceptions, mail, validators
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import override
@@ -28,9 +27,12 @@ import jsonschema
 from timezone_field import TimeZoneField
 from treebeard.mp_tree import MP_Node, MP_NodeManager
 
-from core.enums import WebhookStatusChoices
+from core.enums import WebhookEventStatusChoices, WebhookStatusChoices
 from core.plugins.loader import organization_plugins_run_after_create
-from core.utils.webhooks import scim_synchronizer
+from core.utils.mail import mail_queue, render_static_email
+from core.utils.raw_sql import gen_sql_team_ancestors_paths
+from core.utils.search import trigram_search_index
+from core.utils.webhooks import CurrentTransactionId, scim_synchronizer
 from core.validators import get_field_validators_from_setting
 
 logger = getLogger(__name__)
@@ -132,16 +134,28 @@ class Contact(BaseModel):
         help_text=_("A JSON object containing the contact information"),
         blank=True,
     )
+    # Email addresses from the `data` field, denormalized one per line so that
+    # searching them is served by a trigram index (see migration
+    # `core.0014_contact_search_emails_lines` for the `jsonb_path_query_join` function)
+    search_emails = models.GeneratedField(
+        expression=models.Func(
+            "data",
+            models.Value("$.emails[*].value"),
+            models.Value("\n"),
+            function="jsonb_path_query_join",
+            output_field=models.TextField(),
+        ),
+        output_field=models.TextField(),
+        db_persist=True,
+    )
 
     class Meta:
         db_table = "people_contact"
-        # indexes = [
-        #     GinIndex(
-        #         fields=["full_name", "short_name"],
-        #         name="names_gin_trgm_idx",
-        #         opclasses=['gin_trgm_ops', 'gin_trgm_ops']
-        #     ),
-        # ]
+        indexes = [
+            trigram_search_index("full_name", name="contact_full_name_trgm_idx"),
+            trigram_search_index("short_name", name="contact_short_name_trgm_idx"),
+            trigram_search_index("search_emails", name="contact_emails_trgm_idx"),
+        ]
         ordering = ("full_name", "short_name")
         verbose_name = _("contact")
         verbose_name_plural = _("contacts")
@@ -203,10 +217,12 @@ class Contact(BaseModel):
         )
 
         return {
-            "get": is_owner or is_profile_member_or_same_organization or not self.owner,
+            "get": is_owner
+            or is_profile_member_or_same_organization
+            or not self.owner_id,
             "patch": is_owner,
             "put": is_owner,
-            "delete": is_owner and not self.user,  # Can't delete a profile contact
+            "delete": is_owner and not self.user_id,  # Can't delete a profile contact
         }
 
 
@@ -487,6 +503,10 @@ class User(AbstractBaseUser, BaseModel, auth_models.PermissionsMixin):
         db_table = "people_user"
         verbose_name = _("user")
         verbose_name_plural = _("users")
+        indexes = [
+            trigram_search_index("name", name="user_name_trgm_idx"),
+            trigram_search_index("email", name="user_email_trgm_idx"),
+        ]
 
     def __str__(self):
         return self.name if self.name else self.email or f"User {self.sub}"
@@ -660,6 +680,19 @@ class TeamManager(MP_NodeManager):
         # Beware the N+1 here.
         return self.get(pk=parent_id).add_child(**kwargs)
 
+    def visible_to(self, user):
+        """
+        Return the teams a user can see, in a single query: the teams they have
+        access to, and the ancestors of these teams within their organization.
+        """
+        return self.filter(
+            models.Q(pk__in=TeamAccess.objects.filter(user=user).values("team_id"))
+            | models.Q(
+                organization_id=user.organization_id,
+                path__in=gen_sql_team_ancestors_paths(self.model, TeamAccess, user.pk),
+            )
+        )
+
 
 class Team(MP_Node, BaseModel):
     """
@@ -736,6 +769,26 @@ class Team(MP_Node, BaseModel):
         }
 
 
+class TeamAccessManager(models.Manager):
+    """
+    Custom manager for the TeamAccess model, to synchronize accesses created in bulk.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Create team accesses at once and synchronize them with the webhooks of their
+        team, as `bulk_create` does not call `save`: the accesses to each team are
+        recorded at once, in the transaction creating them.
+        """
+        with transaction.atomic(using=self.db):
+            accesses = super().bulk_create(objs, *args, **kwargs)
+            operations = defaultdict(list)
+            for access in accesses:
+                operations[access.team].append(("add", access.user))
+            scim_synchronizer.record_operations(operations)
+        return accesses
+
+
 class TeamAccess(BaseModel):
     """Link table between teams and contacts."""
 
@@ -753,6 +806,8 @@ class TeamAccess(BaseModel):
         max_length=20, choices=RoleChoices.choices, default=RoleChoices.MEMBER
     )
 
+    objects = TeamAccessManager()
+
     class Meta:
         db_table = "people_team_access"
         verbose_name = _("Team/user relation")
@@ -770,32 +825,40 @@ class TeamAccess(BaseModel):
 
     def save(self, *args, **kwargs):
         """
-        Override save function to fire webhooks on any addition or update
-        to a team access.
+        Override save function to fire webhooks on any addition of a team access.
+        Webhooks are called in Celery tasks once the transaction is committed,
+        with all the membership changes of the transaction.
         """
 
-        if self._state.adding:
-            self.team.webhooks.update(status=WebhookStatusChoices.PENDING)
-            with transaction.atomic():
-                instance = super().save(*args, **kwargs)
-                scim_synchronizer.add_user_to_group(self.team, self.user)
-        else:
+        adding = self._state.adding
+        with transaction.atomic():
             instance = super().save(*args, **kwargs)
+            if adding:
+                scim_synchronizer.add_user_to_group(self.team, self.user)
 
         return instance
 
     def delete(self, *args, **kwargs):
         """
-        Override delete method to fire webhooks on  to team accesses.
-        Don't allow deleting a team access until it is successfully synchronized with all
-        its webhooks.
+        Override delete method to fire webhooks on deletion of team accesses.
         """
-        self.team.webhooks.update(status=WebhookStatusChoices.PENDING)
+        arguments = self.team, self.user
         with transaction.atomic():
-            arguments = self.team, self.user
             super().delete(*args, **kwargs)
             scim_synchronizer.remove_user_from_group(*arguments)
 
+    def get_owners_count(self):
+        """
+        Return the number of owners of the team, from the `owners_count` queryset
+        annotation if available to avoid a query per access when listing them.
+        """
+        try:
+            return self.owners_count
+        except AttributeError:
+            return self._meta.model.objects.filter(
+                team=self.team_id, role=RoleChoices.OWNER
+            ).count()
+
     def get_abilities(self, user):
         """
         Compute and return abilities for a given user taking into account
@@ -818,10 +881,7 @@ class TeamAccess(BaseModel):
             is_team_owner_or_admin = role in [RoleChoices.OWNER, RoleChoices.ADMIN]
 
         if self.role == RoleChoices.OWNER:
-            can_delete = (
-                user.id == self.user_id
-                and self.team.accesses.filter(role=RoleChoices.OWNER).count() > 1
-            )
+            can_delete = user.id == self.user_id and self.get_owners_count() > 1
             set_role_to = [RoleChoices.ADMIN, RoleChoices.MEMBER] if can_delete else []
         else:
             can_delete = is_team_owner_or_admin
@@ -874,6 +934,53 @@ class TeamWebhook(BaseModel):
         return headers
 
 
+class WebhookEvent(BaseModel):
+    """
+    Membership changes to send to a team webhook, kept until they are delivered so
+    that they are not lost if the distant application is unavailable.
+    """
+
+    webhook = models.ForeignKey(
+        TeamWebhook, related_name="events", on_delete=models.CASCADE
+    )
+    operations = models.JSONField(
+        _("operations"),
+        help_text=_("SCIM operations on the members of the group of the team"),
+    )
+    status = models.CharField(
+        max_length=10,
+        default=WebhookEventStatusChoices.PENDING,
+        choices=WebhookEventStatusChoices.choices,
+    )
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    next_attempt_at = models.DateTimeField(_("next attempt at"), default=timezone.now)
+    # Coalesce the membership changes made to a team during a transaction
+    transaction_id = models.BigIntegerField(
+        _("transaction id"), db_default=CurrentTransactionId(), editable=False
+    )
+
+    class Meta:
+        db_table = "people_webhook_event"
+        verbose_name = _("Webhook event")
+        verbose_name_plural = _("Webhook events")
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status=WebhookEventStatusChoices.PENDING),
+                name="webhook_event_pending_idx",
+            ),
+            models.Index(
+                fields=["transaction_id"],
+                condition=models.Q(status=WebhookEventStatusChoices.PENDING),
+                name="webhook_event_transaction_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Event {self.status} for {self.webhook.url}"
+
+
 class Invitation(BaseModel):
     """User invitation to teams."""
 
@@ -958,23 +1065,16 @@ class Invitation(BaseModel):
         }
 
     def email_invitation(self):
-        """Email invitation to the user."""
-        try:
-            with override(self.issuer.language):
-                template_vars = {
-                    "title": _("Invitation to join Desk!"),
-                    "site": Site.objects.get_current(),
-                }
-                msg_html = render_to_string("mail/html/invitation.html", template_vars)
-                msg_plain = render_to_string("mail/text/invitation.txt", template_vars)
-                mail.send_mail(
-                    _("Invitation to join Desk!"),
-                    msg_plain,
-                    settings.EMAIL_FROM,
-                    [self.email],
-                    html_message=msg_html,
-                    fail_silently=False,
-                )
-
-        except smtplib.SMTPException as exception:
-            logger.error("invitation to %s was not sent: %s", self.email, exception)
+        """Email invitation to the user, once the invitation is committed."""
+        with override(self.issuer.language):
+            # Invitations are the same for all the users invited in a language
+            msg_html, msg_plain = render_static_email(
+                "invitation", title=_("Invitation to join Desk!")
+            )
+            mail_queue.send_mail(
+                _("Invitation to join Desk!"),
+                msg_plain,
+                settings.EMAIL_FROM,
+                [self.email],
+                html_message=msg_html,
+            )
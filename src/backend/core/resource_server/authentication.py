@@ -3,11 +3,15 @@
 import base64
 import binascii
 import logging
+from functools import lru_cache
 
 from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 from mozilla_django_oidc.contrib.drf import OIDCAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 
 from .backend import ResourceServerBackend, ResourceServerImproperlyConfiguredBackend
 from .clients import AuthorizationServerClient
@@ -15,28 +19,52 @@ from .clients import AuthorizationServerClient
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def get_resource_server_backend():
+    """Build the resource server backend, once per process.
+
+    The backend, its authorization server client and their connection pool only
+    depend on settings, and the backend keeps no per-request state: it is safely
+    shared by all requests and threads.
+    """
+    try:
+        authorization_server_client = AuthorizationServerClient(
+            url=settings.OIDC_OP_URL,
+            verify_ssl=settings.OIDC_VERIFY_SSL,
+            timeout=settings.OIDC_TIMEOUT,
+            proxy=settings.OIDC_PROXY,
+            url_jwks=settings.OIDC_OP_JWKS_ENDPOINT,
+            url_introspection=settings.OIDC_OP_INTROSPECTION_ENDPOINT,
+            jwks_cache_timeout=settings.OIDC_OP_JWKS_CACHE_TIMEOUT,
+            jwks_min_refresh_interval=settings.OIDC_OP_JWKS_MIN_REFRESH_INTERVAL,
+            pool_maxsize=settings.OIDC_OP_POOL_MAXSIZE,
+            max_retries=settings.OIDC_OP_MAX_RETRIES,
+        )
+        return ResourceServerBackend(authorization_server_client)
+
+    except ImproperlyConfigured as err:
+        message = "Resource Server authentication is disabled"
+        logger.debug("%s. Exception: %s", message, err)
+        return ResourceServerImproperlyConfiguredBackend()
+
+
+@receiver(setting_changed)
+def reset_resource_server_backend(setting, **kwargs):  # pylint: disable=unused-argument
+    """Build the resource server backend again when its settings change (in tests)."""
+    if setting.startswith("OIDC_"):
+        get_resource_server_backend.cache_clear()
+
+
 class ResourceServerAuthentication(OIDCAuthentication):
     """Authenticate clients using the token received from the authorization server."""
 
     def __init__(self):
-        """Require authentication to be configured in order to instantiate."""
-        super().__init__()
-
-        try:
-            authorization_server_client = AuthorizationServerClient(
-                url=settings.OIDC_OP_URL,
-                verify_ssl=settings.OIDC_VERIFY_SSL,
-                timeout=settings.OIDC_TIMEOUT,
-                proxy=settings.OIDC_PROXY,
-                url_jwks=settings.OIDC_OP_JWKS_ENDPOINT,
-                url_introspection=settings.OIDC_OP_INTROSPECTION_ENDPOINT,
-            )
-            self.backend = ResourceServerBackend(authorization_server_client)
+        """Use the resource server backend shared by all requests.
 
-        except ImproperlyConfigured as err:
-            message = "Resource Server authentication is disabled"
-            logger.debug("%s. Exception: %s", message, err)
-            self.backend = ResourceServerImproperlyConfiguredBackend()
+        DRF instantiates authentication classes on every request, so this must stay
+        cheap: the backend is only built once per process.
+        """
+        super().__init__(backend=get_resource_server_backend())
 
     def get_access_token(self, request):
         """Retrieve and decode the access token from the request.
@@ -61,12 +89,23 @@ class ResourceServerAuthentication(OIDCAuthentication):
         We override the 'authenticate' method from the parent class to store
         the introspected token audience inside the request.
         """
-        result = super().authenticate(request)  # Might raise AuthenticationFailed
+        access_token = self.get_access_token(request)
 
-        if result is None:  # Case when there is no access token
+        if not access_token:  # Case when there is no access token
             return None
 
+        try:
+            user, audience = self.backend.get_user(access_token)
+        except SuspiciousOperation as exc:
+            logger.info("Login failed: %s", exc)
+            raise AuthenticationFailed("Login failed") from exc
+
+        if not user:
+            raise AuthenticationFailed(
+                "Login failed: No user found for the given access token."
+            )
+
         # Note: at this stage, the request is a "drf_request" object
-        request.resource_server_token_audience = self.backend.token_origin_audience
+        request.resource_server_token_audience = audience
 
-        return result
+        return user, access_token
@@ -1,12 +1,16 @@
 """Resource Server Backend"""
 
+import hashlib
 import logging
+import time
 
 from django.conf import settings
 from django.contrib import auth
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
 
 from joserfc import jwe as jose_jwe
+from joserfc import jws as jose_jws
 from joserfc import jwt as jose_jwt
 from joserfc.errors import InvalidClaimError, InvalidTokenError
 from requests.exceptions import HTTPError
@@ -17,6 +21,12 @@ from . import utils
 logger = logging.getLogger(__name__)
 
 
+def get_introspection_cache_key(access_token):
+    """Get the cache key of an access token introspection, based on its hash."""
+    token_hash = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+    return f"resource_server:introspection:{token_hash}"
+
+
 class ResourceServerBackend:
     """Backend of an OAuth 2.0 resource server.
 
@@ -43,6 +53,10 @@ class ResourceServerBackend:
         self._encryption_algorithm = settings.OIDC_RS_ENCRYPTION_ALGO
         self._signing_algorithm = settings.OIDC_RS_SIGNING_ALGO
         self._scopes = settings.OIDC_RS_SCOPES
+        self._introspection_cache_timeout = settings.OIDC_RS_INTROSPECTION_CACHE_TIMEOUT
+        self._introspection_negative_cache_timeout = (
+            settings.OIDC_RS_INTROSPECTION_NEGATIVE_CACHE_TIMEOUT
+        )
 
         if (
             not self._client_id
@@ -61,10 +75,6 @@ class ResourceServerBackend:
             token_introspection={"essential": True},
         )
 
-        # Declare the token origin audience: to know where the token comes from
-        # and store it for further use in the application
-        self.token_origin_audience = None
-
     # pylint: disable=unused-argument
     def get_or_create_user(self, access_token, id_token, payload):
         """Maintain API compatibility with OIDCAuthentication class from mozilla-django-oidc
@@ -73,7 +83,8 @@ class ResourceServerBackend:
         support 'get_user', not 'get_or_create_user'.
         """
 
-        return self.get_user(access_token)
+        user, _audience = self.get_user(access_token)
+        return user
 
     def get_user(self, access_token):
         """Get user from an access token emitted by the authorization server.
@@ -88,12 +99,15 @@ class ResourceServerBackend:
         Its introspection response is a plain JSON object. Therefore, we use the draft RFC
         that extends RFC 7662 by returning a signed and encrypted JWT for stronger assurance that
         the authorization server issued the token introspection response.
-        """
-        self.token_origin_audience = None  # Reset the token origin audience
 
-        jwt = self._introspect(access_token)
-        claims = self._verify_claims(jwt)
-        user_info = self._verify_user_info(claims["token_introspection"])
+        The backend is shared between requests and threads, so it keeps no state:
+        the token origin audience, which tells where the token comes from, is returned
+        along with the user.
+
+        Returns:
+            tuple: The user, or None if not found, and the token origin audience.
+        """
+        user_info = self._get_user_info(access_token)
 
         sub = user_info.get("sub")
         if sub is None:
@@ -104,11 +118,61 @@ class ResourceServerBackend:
             user = self.UserModel.objects.get(sub=sub)
         except self.UserModel.DoesNotExist:
             logger.debug("Login failed: No user with %s found", sub)
-            return None
+            return None, None
 
-        self.token_origin_audience = str(user_info["aud"])
+        return user, str(user_info["aud"])
 
-        return user
+    def _get_user_info(self, access_token):
+        """Get the verified user info of an access token, from cache when possible.
+
+        Service providers usually send the same access token many times, so the
+        verified introspection response is cached until the token expires, within
+        the limit of OIDC_RS_INTROSPECTION_CACHE_TIMEOUT. Tokens rejected by the
+        verification are also cached for OIDC_RS_INTROSPECTION_NEGATIVE_CACHE_TIMEOUT,
+        to avoid introspecting them again and again.
+
+        Only the hash of the access token is used as cache key, so that tokens are
+        never stored in the cache.
+        """
+        cache_key = get_introspection_cache_key(access_token)
+
+        cached_user_info = cache.get(cache_key)
+        if cached_user_info is False:
+            message = "Token was rejected by a previous introspection."
+            logger.debug(message)
+            raise SuspiciousOperation(message)
+        if cached_user_info is not None:
+            return cached_user_info
+
+        jwt = self._introspect(access_token)
+
+        try:
+            claims = self._verify_claims(jwt)
+            user_info = self._verify_user_info(claims["token_introspection"])
+        except SuspiciousOperation:
+            if self._introspection_negative_cache_timeout:
+                cache.set(cache_key, False, self._introspection_negative_cache_timeout)
+            raise
+
+        timeout = self._get_introspection_cache_timeout(user_info)
+        if timeout > 0:
+            cache.set(cache_key, user_info, timeout)
+
+        return user_info
+
+    def _get_introspection_cache_timeout(self, introspection_response):
+        """Get how long an introspection response can be cached, in seconds.
+
+        The response must not outlive the token it describes: the timeout is bounded
+        by the token expiration time, when provided.
+        """
+        timeout = self._introspection_cache_timeout
+
+        expiration = introspection_response.get("exp")
+        if expiration is not None:
+            timeout = min(timeout, int(expiration - time.time()))
+
+        return timeout
 
     def _verify_user_info(self, introspection_response):
         """Verify the 'introspection_response' to get valid and relevant user info.
@@ -159,16 +223,54 @@ class ResourceServerBackend:
         private_key = utils.import_private_key_from_settings()
         jws = self._decrypt(jwe, private_key=private_key)
 
+        public_key_set = self._get_public_key_set(jws)
+
+        jwt = self._decode(jws, public_key_set)
+
+        return jwt
+
+    def _get_public_key_set(self, signed_token):
+        """Get the Authorization Server (AS) public keys able to verify the token.
+
+        The AS JWKS is cached, so when the token is signed with a key we don't know
+        yet, the AS probably rotated its keys: the JWKS is then fetched again once.
+        """
         try:
             public_key_set = self._authorization_server_client.import_public_keys()
+
+            kid = self._get_signing_key_id(signed_token)
+            if kid is not None and not self._has_key(public_key_set, kid):
+                logger.debug("Unknown signing key %s, refreshing JWKS", kid)
+                public_key_set = self._authorization_server_client.import_public_keys(
+                    force_refresh=True
+                )
         except (TypeError, ValueError, AttributeError, HTTPError) as err:
             message = "Could get authorization server JWKS"
             logger.debug("%s. Exception:", message, exc_info=True)
             raise SuspiciousOperation(message) from err
 
-        jwt = self._decode(jws, public_key_set)
+        return public_key_set
 
-        return jwt
+    @staticmethod
+    def _get_signing_key_id(signed_token):
+        """Extract the 'kid' header of the decrypted token, if any."""
+        try:
+            headers = jose_jws.extract_compact(signed_token.plaintext).headers()
+        except (TypeError, ValueError, AttributeError):
+            # Let the decoding step report invalid tokens
+            return None
+
+        return headers.get("kid")
+
+    @staticmethod
+    def _has_key(public_key_set, kid):
+        """Check whether the key set contains a key with the given 'kid'."""
+        try:
+            public_key_set.get_by_kid(kid)
+        except ValueError:
+            return False
+
+        return True
 
     def _decrypt(self, encrypted_token, private_key):
         """Decrypt the token encrypted by the Authorization Server (AS).
@@ -233,8 +335,10 @@ class ResourceServerBackend:
 class ResourceServerImproperlyConfiguredBackend:
     """Fallback backend for improperly configured Resource Servers."""
 
-    token_origin_audience = None
-
     def get_or_create_user(self, access_token, id_token, payload):
         """Indicate that the Resource Server is improperly configured."""
         raise AuthenticationFailed("Resource Server is improperly configured")
+
+    def get_user(self, access_token):
+        """Indicate that the Resource Server is improperly configured."""
+        raise AuthenticationFailed("Resource Server is improperly configured")
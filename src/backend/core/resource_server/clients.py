@@ -1,9 +1,18 @@
 """Resource Server Clients classes"""
 
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 
 import requests
 from joserfc.jwk import KeySet
+from urllib3.util import Retry
+
+logger = logging.getLogger(__name__)
 
 
 class AuthorizationServerClient:
@@ -15,11 +24,16 @@ class AuthorizationServerClient:
 
     This client facilitates communication with the authorization server, including:
     - Fetching token introspection responses.
-    - Fetching JSON Web Key Sets (JWKS) for token validation.
+    - Fetching JSON Web Key Sets (JWKS) for token validation, cached in the Django
+      cache to be shared between all workers.
     - Setting appropriate headers for secure communication as recommended by RFC drafts.
+
+    Requests go through a pooled keep-alive session owned by the client, retried on
+    connection errors and gateway errors, and counted per endpoint in 'stats'.
     """
 
     # ruff: noqa: PLR0913 PLR0917
+    # pylint: disable=too-many-instance-attributes
     # pylint: disable=too-many-positional-arguments
     # pylint: disable=too-many-arguments
     def __init__(
@@ -30,6 +44,10 @@ class AuthorizationServerClient:
         verify_ssl,
         timeout,
         proxy,
+        jwks_cache_timeout=3600,
+        jwks_min_refresh_interval=60,
+        pool_maxsize=10,
+        max_retries=2,
     ):
         """Require at a minimum url, url_jwks and url_introspection."""
 
@@ -44,6 +62,52 @@ class AuthorizationServerClient:
         self._verify_ssl = verify_ssl
         self._timeout = timeout
         self._proxy = proxy
+        self._jwks_cache_timeout = jwks_cache_timeout
+        self._jwks_min_refresh_interval = jwks_min_refresh_interval
+
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.1,
+                status_forcelist=[502, 503, 504],
+                # Introspection does not change the token state, it is safe to retry
+                allowed_methods=["GET", "POST"],
+                raise_on_status=False,
+            ),
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._stats = defaultdict(Counter)
+        self._stats_lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """Get the number of requests, errors and total latency for each endpoint."""
+        with self._stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """Send a request through the session, and record its latency and outcome."""
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self._session.request(method, url, **kwargs)
+            response.raise_for_status()
+            error = False
+        finally:
+            duration = time.perf_counter() - start
+            with self._stats_lock:
+                self._stats[endpoint]["requests"] += 1
+                self._stats[endpoint]["errors"] += int(error)
+                self._stats[endpoint]["duration"] += duration
+            logger.debug(
+                "Authorization server %s request took %.3fs", endpoint, duration
+            )
+
+        return response
 
     @property
     def _introspection_headers(self):
@@ -62,7 +126,9 @@ class AuthorizationServerClient:
 
     def get_introspection(self, client_id, client_secret, token):
         """Retrieve introspection response about a token."""
-        response = requests.post(
+        response = self._request(
+            "introspection",
+            "POST",
             self._url_introspection,
             data={
                 "client_id": client_id,
@@ -74,24 +140,55 @@ class AuthorizationServerClient:
             timeout=self._timeout,
             proxies=self._proxy,
         )
-        response.raise_for_status()
         return response.text
 
     def get_jwks(self):
         """Retrieve Authorization Server JWKS."""
-        response = requests.get(
+        response = self._request(
+            "jwks",
+            "GET",
             self._url_jwks,
             verify=self._verify_ssl,
             timeout=self._timeout,
             proxies=self._proxy,
         )
-        response.raise_for_status()
         return response.json()
 
-    def import_public_keys(self):
-        """Retrieve and import Authorization Server JWKS."""
+    @property
+    def _jwks_cache_key(self):
+        """Get the cache key under which the Authorization Server JWKS is stored."""
+        return f"resource_server:jwks:{self._url_jwks}"
+
+    @property
+    def _jwks_refresh_cache_key(self):
+        """Get the cache key held while a forced refresh of the JWKS is too recent."""
+        return f"{self._jwks_cache_key}:refreshed"
+
+    def import_public_keys(self, force_refresh=False):
+        """Retrieve and import Authorization Server JWKS.
+
+        The JWKS is served from the cache when available, and fetched from the
+        authorization server otherwise. Use 'force_refresh' to bypass the cache,
+        for instance when the authorization server rotated its keys.
+
+        Forced refreshes are triggered by tokens signed with an unknown key, which
+        anyone can forge: they happen at most once per 'jwks_min_refresh_interval'
+        seconds, the cached JWKS being served in between.
+        """
+
+        if force_refresh and not cache.add(
+            self._jwks_refresh_cache_key, True, self._jwks_min_refresh_interval
+        ):
+            force_refresh = False
+
+        jwks = None if force_refresh else cache.get(self._jwks_cache_key)
+        if jwks is not None:
+            return KeySet.import_key_set(jwks)
 
         jwks = self.get_jwks()
         public_keys = KeySet.import_key_set(jwks)
 
+        # Only cache the JWKS once we know it can be imported
+        cache.set(self._jwks_cache_key, jwks, self._jwks_cache_timeout)
+
         return public_keys
@@ -1,9 +1,30 @@
 """Resource Server utils functions"""
 
+import hashlib
+import json
+from functools import lru_cache
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
-from joserfc.jwk import JWKRegistry
+from joserfc.jwk import JWKRegistry, KeySet
+
+
+@lru_cache(maxsize=None)
+def _import_private_key(private_key_str, key_type, algorithm):
+    """Parse the private key PEM, once per process and per configuration.
+
+    Importing an RSA key is expensive, while the settings it depends on never
+    change for a running process: the parsed key is kept in memory.
+    """
+    try:
+        return JWKRegistry.import_key(
+            private_key_str.encode(),
+            key_type=key_type,
+            parameters={"alg": algorithm, "use": "enc"},
+        )
+    except ValueError as err:
+        raise ImproperlyConfigured("OIDC_RS_PRIVATE_KEY_STR setting is wrong.") from err
 
 
 def import_private_key_from_settings():
@@ -16,6 +37,8 @@ def import_private_key_from_settings():
     By default, we recommend using RSAKey for asymmetric encryption,
     known for its strong security features.
 
+    The key is parsed only once per process, subsequent calls reuse it.
+
     Note:
         - The function requires the 'OIDC_RS_PRIVATE_KEY_STR' setting to be configured.
         - The 'OIDC_RS_ENCRYPTION_KEY_TYPE' and 'OIDC_RS_ENCRYPTION_ALGO' settings can be customized
@@ -34,15 +57,24 @@ def import_private_key_from_settings():
             "OIDC_RS_PRIVATE_KEY_STR setting is missing or empty."
         )
 
-    private_key_pem = private_key_str.encode()
+    return _import_private_key(
+        private_key_str,
+        settings.OIDC_RS_ENCRYPTION_KEY_TYPE,
+        settings.OIDC_RS_ENCRYPTION_ALGO,
+    )
 
-    try:
-        private_key = JWKRegistry.import_key(
-            private_key_pem,
-            key_type=settings.OIDC_RS_ENCRYPTION_KEY_TYPE,
-            parameters={"alg": settings.OIDC_RS_ENCRYPTION_ALGO, "use": "enc"},
-        )
-    except ValueError as err:
-        raise ImproperlyConfigured("OIDC_RS_PRIVATE_KEY_STR setting is wrong.") from err
 
-    return private_key
+@lru_cache(maxsize=None)
+def build_public_jwks(private_key):
+    """Build the public JWKS document exposing the resource server public key.
+
+    The private key is parsed once per process, so the document and its ETag are
+    computed once as well and reused for every JWKS request.
+
+    Returns:
+        tuple: The JWKS as a dictionary and its ETag.
+    """
+    jwks = KeySet([private_key]).as_dict(private=False)
+    etag = hashlib.sha256(json.dumps(jwks, sort_keys=True).encode()).hexdigest()
+
+    return jwks, f'"{etag}"'
@@ -1,8 +1,9 @@
 """Resource Server views"""
 
 from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 
-from joserfc.jwk import KeySet
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -13,12 +14,16 @@ class JWKSView(APIView):
     """
     API endpoint for retrieving a JSON Web Keys Set (JWKS).
 
+    The JWKS only changes when the resource server private key changes, so it is
+    computed once per process and served with an ETag and Cache-Control headers.
+
     Returns:
         Response: JSON response containing the JWKS data.
     """
 
     authentication_classes = []  # disable authentication
     permission_classes = []  # disable permission
+    cache_max_age = 3600
 
     def get(self, request):
         """Handle GET requests to retrieve JSON Web Keys Set (JWKS).
@@ -33,8 +38,16 @@ class JWKSView(APIView):
             return Response({"error": str(err)}, status=500)
 
         try:
-            jwk = KeySet([private_key]).as_dict(private=False)
+            jwks, etag = utils.build_public_jwks(private_key)
         except (TypeError, ValueError, AttributeError):
             return Response({"error": "Could not load key"}, status=500)
 
-        return Response(jwk)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=304)
+        else:
+            response = Response(jwks)
+
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+
+        return response
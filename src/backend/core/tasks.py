@@ -0,0 +1,226 @@
+"""Celery tasks of the People core application"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from core import models
+from core.enums import WebhookEventStatusChoices, WebhookStatusChoices
+from core.utils.mail import send_messages
+from core.utils.webhooks import call_webhooks
+
+from people.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_webhook_events(batch_size, now):
+    """
+    Claim a batch of webhooks with pending events due, leasing their first
+    WEBHOOKS_EVENTS_PER_CLAIM events until WEBHOOKS_LEASE_DURATION seconds from now.
+
+    Webhooks are selected with `SELECT ... FOR NO KEY UPDATE SKIP LOCKED` for the time
+    of this short transaction only: several workers can claim webhooks concurrently.
+    Once leased, the events are no longer due, so the webhook cannot be claimed by
+    another worker until the lease is released or expires. Contrary to `FOR UPDATE`,
+    this lock does not prevent recording new events for claimed webhooks meanwhile.
+
+    Return the events to deliver by webhook, and the end of the lease.
+    """
+    pending_events = models.WebhookEvent.objects.filter(
+        status=WebhookEventStatusChoices.PENDING
+    )
+    lease_until = now + timedelta(seconds=settings.WEBHOOKS_LEASE_DURATION)
+
+    with transaction.atomic():
+        webhooks = list(
+            models.TeamWebhook.objects.filter(
+                pk__in=pending_events.filter(next_attempt_at__lte=now).values(
+                    "webhook_id"
+                )
+            )
+            # Webhooks waiting to retry an event, or leased by another worker, must
+            # not deliver the next ones
+            .exclude(
+                pk__in=pending_events.filter(next_attempt_at__gt=now).values(
+                    "webhook_id"
+                )
+            )
+            .select_for_update(skip_locked=True, no_key=True)
+            .order_by("created_at")[:batch_size]
+        )
+        if not webhooks:
+            return {}, lease_until
+
+        events = defaultdict(list)
+        for event in (
+            pending_events.filter(webhook__in=webhooks, next_attempt_at__lte=now)
+            .annotate(
+                rank=Window(
+                    RowNumber(), partition_by="webhook_id", order_by="created_at"
+                )
+            )
+            .filter(rank__lte=settings.WEBHOOKS_EVENTS_PER_CLAIM)
+            .order_by("created_at")
+        ):
+            events[event.webhook_id].append(event)
+        models.WebhookEvent.objects.filter(
+            pk__in=[
+                event.pk
+                for webhook_events in events.values()
+                for event in webhook_events
+            ]
+        ).update(next_attempt_at=lease_until)
+
+    return {webhook: events[webhook.pk] for webhook in webhooks}, lease_until
+
+
+@transaction.atomic
+def _record_webhook_results(results, now, lease_until):
+    """
+    Record the results of calls to webhooks on their events and on the webhooks,
+    releasing the lease taken on their events.
+
+    Events that may succeed later are retried with an exponential backoff, the next
+    events of their webhook waiting for them. Events that failed for good or
+    exhausted their retries become dead letters, to be replayed manually.
+
+    Return the earliest time at which an event should be retried, if any.
+    """
+    # Events leased but not attempted are due again, unless postponed below
+    models.WebhookEvent.objects.filter(
+        webhook__in=list(results),
+        status=WebhookEventStatusChoices.PENDING,
+        next_attempt_at=lease_until,
+    ).update(next_attempt_at=now)
+
+    events = []
+    statuses = defaultdict(list)
+    retry_at = None
+    for webhook, attempted in results.items():
+        if not attempted:
+            continue
+        for event, result in attempted:
+            event.attempts += 1
+            event.updated_at = now
+            if result == WebhookStatusChoices.SUCCESS:
+                event.status = WebhookEventStatusChoices.DELIVERED
+                webhook_status = WebhookStatusChoices.SUCCESS
+            elif (
+                result == WebhookStatusChoices.PENDING
+                and event.attempts <= settings.WEBHOOKS_MAX_RETRIES
+            ):
+                event.next_attempt_at = now + timedelta(
+                    seconds=settings.WEBHOOKS_RETRY_DELAY * 2 ** (event.attempts - 1)
+                )
+                models.WebhookEvent.objects.filter(
+                    webhook=webhook,
+                    status=WebhookEventStatusChoices.PENDING,
+                    next_attempt_at__lt=event.next_attempt_at,
+                ).exclude(pk=event.pk).update(next_attempt_at=event.next_attempt_at)
+                retry_at = min(retry_at or event.next_attempt_at, event.next_attempt_at)
+                webhook_status = WebhookStatusChoices.PENDING
+            else:
+                webhook_status = WebhookStatusChoices.FAILURE
+                event.status = WebhookEventStatusChoices.DEAD
+            events.append(event)
+
+        # The webhook reflects the result of its last call
+        statuses[webhook_status].append(webhook.pk)
+
+    models.WebhookEvent.objects.bulk_update(
+        events, ["status", "attempts", "next_attempt_at", "updated_at"]
+    )
+    for status, webhook_ids in statuses.items():
+        models.TeamWebhook.objects.filter(pk__in=webhook_ids).update(status=status)
+
+    return retry_at
+
+
+def deliver_webhook_events_batch(batch_size):
+    """
+    Deliver the pending events of a batch of webhooks and record their results.
+
+    Webhooks are claimed and their results recorded in two short transactions, the
+    webhooks being called in between without holding any lock: the events of a
+    webhook are delivered in order by a single worker, thanks to their lease. The
+    events of a worker lost while delivering them are delivered again once their
+    lease expires.
+
+    Return the number of webhooks claimed and the earliest time at which an event
+    should be retried, if any.
+    """
+    events, lease_until = _claim_webhook_events(batch_size, timezone.now())
+    if not events:
+        return 0, None
+
+    # Calls must end while the events are leased, not to be delivered twice
+    results = call_webhooks(events, deadline=lease_until)
+    retry_at = _record_webhook_results(results, timezone.now(), lease_until)
+
+    return len(events), retry_at
+
+
+def drain_webhook_events():
+    """
+    Deliver pending webhook events by batches until none is due.
+
+    Return the earliest time at which an event should be retried, if any.
+    """
+    retry_at = None
+    while True:
+        claimed, batch_retry_at = deliver_webhook_events_batch(
+            settings.WEBHOOKS_BATCH_SIZE
+        )
+        if not claimed:
+            return retry_at
+        if batch_retry_at:
+            retry_at = min(retry_at or batch_retry_at, batch_retry_at)
+
+
+@app.task
+def deliver_webhook_events(schedule_retries=True):
+    """
+    Deliver pending webhook events, then schedule a new delivery for the events
+    that should be retried later.
+
+    Deliveries are also run periodically by celery beat, in case a scheduled one was
+    lost: these ones do not schedule retries, which are already scheduled or will be
+    picked by the next periodic delivery.
+    """
+    if (retry_at := drain_webhook_events()) and schedule_retries:
+        deliver_webhook_events.apply_async(eta=retry_at)
+
+
+@app.task(bind=True, max_retries=None)
+def send_emails(self, messages):
+    """
+    Send a batch of emails over a single connection to the mail relay.
+
+    Emails which failed for a temporary reason are sent again with an exponential
+    backoff, up to EMAIL_MAX_RETRIES times. Return the number of emails sent.
+    """
+    pending = send_messages(messages)
+    if not pending:
+        return len(messages)
+
+    if self.request.retries >= settings.EMAIL_MAX_RETRIES:
+        for message in pending:
+            logger.error(
+                "Email '%s' to %s was not sent after %s retries.",
+                message["subject"],
+                ", ".join(message["to"]),
+                self.request.retries,
+            )
+        return len(messages) - len(pending)
+
+    raise self.retry(
+        args=[pending],
+        countdown=settings.EMAIL_RETRY_DELAY * 2**self.request.retries,
+    )
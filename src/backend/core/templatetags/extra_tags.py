@@ -1,6 +1,8 @@
 """Custom template tags for the core application of People."""
 
 import base64
+import os
+from functools import lru_cache
 
 from django import template
 from django.contrib.staticfiles import finders
@@ -49,10 +51,23 @@ def image_to_base64(file_or_path, close=False):
             file.seek(file_pos)
 
 
+@lru_cache(maxsize=32)
+def static_image_to_base64(full_path, mtime):  # pylint: disable=unused-argument
+    """
+    Memoize the base64 encoding of a static image, which is read and parsed only
+    once per modification time of the file.
+    """
+    return image_to_base64(full_path, True)
+
+
 @register.simple_tag
 def base64_static(path):
     """Return a static file into a base64."""
     full_path = finders.find(path)
     if full_path:
-        return image_to_base64(full_path, True)
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+        except OSError:
+            return ""
+        return static_image_to_base64(full_path, mtime)
     return ""
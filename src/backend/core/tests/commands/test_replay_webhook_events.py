@@ -0,0 +1,66 @@
+"""Test the `replay_webhook_events` management command"""
+
+import re
+from io import StringIO
+
+from django.core.management import call_command
+
+import pytest
+import responses
+
+from core import factories
+
+pytestmark = pytest.mark.django_db
+
+
+def test_replay_webhook_events():
+    """Dead events should be delivered again, along with pending ones."""
+    dead_event = factories.WebhookEventFactory(status="dead", attempts=6)
+    pending_event = factories.WebhookEventFactory()
+    delivered_event = factories.WebhookEventFactory(status="delivered", attempts=1)
+
+    output = StringIO()
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        call_command("replay_webhook_events", stdout=output)
+
+        assert {call.request.url for call in rsps.calls} == {
+            dead_event.webhook.url,
+            pending_event.webhook.url,
+        }
+
+    assert "Replaying 1 dead webhook event(s)..." in output.getvalue()
+    assert "Done: 0 event(s) to retry later, 0 dead event(s)." in output.getvalue()
+
+    for event in [dead_event, pending_event, delivered_event]:
+        event.refresh_from_db()
+        assert event.status == "delivered"
+    dead_event.refresh_from_db()
+    assert dead_event.attempts == 1
+
+
+def test_replay_webhook_events_team():
+    """Only the dead events of the given team should be replayed."""
+    dead_event, other_dead_event = factories.WebhookEventFactory.create_batch(
+        2, status="dead"
+    )
+
+    output = StringIO()
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, dead_event.webhook.url, status=404)
+
+        call_command(
+            "replay_webhook_events",
+            "--team",
+            str(dead_event.webhook.team_id),
+            stdout=output,
+        )
+
+        assert len(rsps.calls) == 1
+
+    assert "Done: 0 event(s) to retry later, 2 dead event(s)." in output.getvalue()
+    dead_event.refresh_from_db()
+    assert dead_event.attempts == 1
+    other_dead_event.refresh_from_db()
+    assert other_dead_event.attempts == 0
@@ -2,10 +2,12 @@
 Test contacts API endpoints in People's core app.
 """
 
+import json
+
 import pytest
 from rest_framework.test import APIClient
 
-from core import factories
+from core import factories, models
 
 pytestmark = pytest.mark.django_db
 
@@ -61,7 +63,7 @@ def test_api_contacts_list_authenticated_no_query(django_assert_num_queries):
         response = client.get("/api/v1.0/contacts/")
 
     assert response.status_code == 200
-    assert response.json() == [
+    assert response.json()["results"] == [
         {
             "id": str(user_profile_contact.pk),
             "abilities": {"delete": False, "get": True, "patch": True, "put": True},
@@ -114,26 +116,26 @@ def test_api_contacts_list_authenticated_by_full_name():
     response = client.get("/api/v1.0/contacts/?q=David%20Bowman")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
     # Partial query should work
     response = client.get("/api/v1.0/contacts/?q=ank")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(frank.id)]
 
     response = client.get("/api/v1.0/contacts/?q=ole")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(frank.id), str(nicole.id)]
 
     response = client.get("/api/v1.0/contacts/?q=ool")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(frank.id), str(nicole.id)]
 
 
@@ -186,26 +188,26 @@ def test_api_contacts_list_authenticated_by_email():
     response = client.get("/api/v1.0/contacts/?q=david.bowman@example.com")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.pk)]
 
     # Partial query should work
     response = client.get("/api/v1.0/contacts/?q=anc")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(frank.pk)]
 
     response = client.get("/api/v1.0/contacts/?q=olé")  # accented
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(nicole.pk), str(frank.pk)]
 
     response = client.get("/api/v1.0/contacts/?q=oOl")  # mixed case
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(nicole.pk), str(frank.pk)]
 
 
@@ -222,14 +224,14 @@ def test_api_contacts_list_authenticated_uppercase_content():
     response = client.get("/api/v1.0/contacts/?q=eee")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
     # Unaccented short name
     response = client.get("/api/v1.0/contacts/?q=aaa")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
 
@@ -246,14 +248,14 @@ def test_api_contacts_list_authenticated_capital_query():
     response = client.get("/api/v1.0/contacts/?q=EEE")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
     # Unaccented short name
     response = client.get("/api/v1.0/contacts/?q=AAA")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
 
@@ -270,14 +272,14 @@ def test_api_contacts_list_authenticated_accented_content():
     response = client.get("/api/v1.0/contacts/?q=eee")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
     # Unaccented short name
     response = client.get("/api/v1.0/contacts/?q=aaa")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
 
@@ -294,12 +296,172 @@ def test_api_contacts_list_authenticated_accented_query():
     response = client.get("/api/v1.0/contacts/?q=ééé")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
 
     # Unaccented short name
     response = client.get("/api/v1.0/contacts/?q=ààà")
 
     assert response.status_code == 200
-    contact_ids = [contact["id"] for contact in response.json()]
+    contact_ids = [contact["id"] for contact in response.json()["results"]]
     assert contact_ids == [str(dave.id)]
+
+
+def test_api_contacts_list_authenticated_cursor_pagination():
+    """
+    Contacts should be paginated with a cursor, sorted by full name then id so
+    that contacts sharing a full name are neither skipped nor repeated.
+    """
+    user = factories.UserFactory()
+    contacts = [
+        factories.BaseContactFactory(full_name=full_name, data={})
+        for full_name in ["Frank Poole", "David Bowman", "Frank Poole", "Heywood Floyd"]
+    ]
+    expected_ids = [
+        str(contact.id)
+        for contact in sorted(contacts, key=lambda c: (c.full_name, str(c.id)))
+    ]
+
+    client = APIClient()
+    client.force_login(user)
+
+    response = client.get("/api/v1.0/contacts/?page_size=3")
+
+    assert response.status_code == 200
+    content = response.json()
+    assert content["previous"] is None
+    assert [contact["id"] for contact in content["results"]] == expected_ids[:3]
+
+    response = client.get(content["next"])
+
+    assert response.status_code == 200
+    content = response.json()
+    assert content["next"] is None
+    assert [contact["id"] for contact in content["results"]] == expected_ids[3:]
+
+
+def test_api_contacts_list_authenticated_cursor_pagination_duplicates():
+    """
+    Paginating back and forth over contacts sharing full names, or without a full
+    name, should list each contact once, whatever the page size.
+    """
+    user = factories.UserFactory()
+    contacts = [
+        factories.BaseContactFactory(full_name=full_name, data={})
+        for full_name in ["Frank Poole"] * 4 + ["David Bowman", "Heywood Floyd"] * 2
+    ]
+    # Full names can be left empty in the database, which the validation forbids
+    models.Contact.objects.filter(pk__in=[c.pk for c in contacts[:2]]).update(
+        full_name=""
+    )
+    expected_ids = [
+        str(contact_id)
+        for contact_id in models.Contact.objects.order_by(
+            "full_name", "id"
+        ).values_list("id", flat=True)
+    ]
+
+    client = APIClient()
+    client.force_login(user)
+
+    for page_size in (2, 3):
+        pages = []
+        response = client.get(f"/api/v1.0/contacts/?page_size={page_size}")
+        while True:
+            assert response.status_code == 200
+            content = response.json()
+            pages.append([contact["id"] for contact in content["results"]])
+            if content["next"] is None:
+                break
+            response = client.get(content["next"])
+        assert sum(pages, []) == expected_ids
+
+        # And back to the first page
+        while content["previous"] is not None:
+            pages.pop()
+            response = client.get(content["previous"])
+            assert response.status_code == 200
+            content = response.json()
+            assert [contact["id"] for contact in content["results"]] == pages[-1]
+        assert len(pages) == 1
+
+
+def test_api_contacts_list_authenticated_cursor_pagination_invalid_cursor():
+    """A cursor which was not built by the API should be rejected."""
+    user = factories.UserFactory()
+    factories.BaseContactFactory(data={})
+
+    client = APIClient()
+    client.force_login(user)
+
+    # Base64 encoded "p=Frank Poole", the position of a cursor on full names only
+    response = client.get("/api/v1.0/contacts/?cursor=cD1GcmFuaytQb29sZQ==")
+
+    assert response.status_code == 404
+
+    # Base64 encoded '{"k": ["Frank Poole", 1], "r": false}', an id which is no uuid
+    response = client.get(
+        "/api/v1.0/contacts/?cursor=eyJrIjogWyJGcmFuayBQb29sZSIsIDFdLCAiciI6IGZhbHNlfQ=="
+    )
+
+    assert response.status_code == 404
+
+
+def test_api_contacts_list_authenticated_stream(django_assert_num_queries):
+    """
+    Authenticated users should be able to stream all their contacts at once,
+    fetched from the database by chunks.
+    """
+    user = factories.UserFactory()
+    contacts = factories.BaseContactFactory.create_batch(3, data={})
+    expected_ids = [
+        str(contact.id)
+        for contact in sorted(contacts, key=lambda c: (c.full_name, str(c.id)))
+    ]
+
+    client = APIClient()
+    client.force_login(user)
+
+    response = client.get("/api/v1.0/contacts/?stream=true")
+
+    assert response.status_code == 200
+    assert response.streaming is True
+    assert response["Content-Type"] == "application/json"
+
+    with django_assert_num_queries(1):
+        content = json.loads(b"".join(response.streaming_content))
+
+    assert [contact["id"] for contact in content] == expected_ids
+    assert content[0]["abilities"] == {
+        "delete": False,
+        "get": True,
+        "patch": False,
+        "put": False,
+    }
+
+
+def test_api_contacts_list_authenticated_stream_query():
+    """The streamed contacts should be filtered by the query."""
+    user = factories.UserFactory()
+    frank = factories.BaseContactFactory(full_name="Frank Poole", data={})
+    factories.BaseContactFactory(full_name="David Bowman", data={})
+
+    client = APIClient()
+    client.force_login(user)
+
+    response = client.get("/api/v1.0/contacts/?stream=1&q=frank")
+
+    assert response.status_code == 200
+    content = json.loads(b"".join(response.streaming_content))
+    assert [contact["id"] for contact in content] == [str(frank.id)]
+
+
+def test_api_contacts_list_authenticated_stream_empty():
+    """Streaming without any contact should return an empty JSON array."""
+    client = APIClient()
+    client.force_login(factories.UserFactory())
+
+    response = client.get("/api/v1.0/contacts/?stream=true")
+
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"[]"
@@ -17,6 +17,10 @@ from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED
 from core.factories import UserFactory
 from core.models import ServiceProvider
 from core.resource_server.authentication import ResourceServerAuthentication
+from core.resource_server.backend import (
+    ResourceServerBackend,
+    ResourceServerImproperlyConfiguredBackend,
+)
 
 pytestmark = pytest.mark.django_db
 
@@ -176,3 +180,27 @@ def test_resource_server_authentication_class(client, settings):
 
     # Check that no service provider is created here
     assert ServiceProvider.objects.count() == 0
+
+
+def test_resource_server_authentication_shared_backend(settings):
+    """
+    The resource server backend should be built once and shared by all
+    authentication instances, until the settings change.
+    """
+    settings.OIDC_OP_URL = "https://oidc.example.com"
+    settings.OIDC_OP_JWKS_ENDPOINT = "https://oidc.example.com/jwks"
+    settings.OIDC_OP_INTROSPECTION_ENDPOINT = "https://oidc.example.com/introspect"
+    settings.OIDC_RS_CLIENT_ID = "some_client_id"
+    settings.OIDC_RS_CLIENT_SECRET = "some_client_secret"
+
+    backend = ResourceServerAuthentication().backend
+
+    assert isinstance(backend, ResourceServerBackend)
+    assert ResourceServerAuthentication().backend is backend
+
+    settings.OIDC_OP_URL = None
+
+    assert isinstance(
+        ResourceServerAuthentication().backend,
+        ResourceServerImproperlyConfiguredBackend,
+    )
@@ -5,19 +5,25 @@ Test for the Resource Server (RS) Backend.
 
 # pylint: disable=W0212
 
+import time
 from logging import Logger
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 
 from django.contrib import auth
+from django.core.cache import cache
 from django.core.exceptions import SuspiciousOperation
 from django.test.utils import override_settings
 
 import pytest
+from freezegun import freeze_time
+from joserfc import jwt as jose_jwt
 from joserfc.errors import InvalidClaimError, InvalidTokenError
+from joserfc.jwk import KeySet, RSAKey
 from joserfc.jwt import JWTClaimsRegistry
 from requests.exceptions import HTTPError
 
 from core.resource_server.backend import ResourceServerBackend
+from core.resource_server.clients import AuthorizationServerClient
 
 
 @pytest.fixture(name="mock_authorization_server")
@@ -82,7 +88,7 @@ def test_backend_initialization(mock_get_user_model, mock_authorization_server):
     }
 
 
-@patch.object(ResourceServerBackend, "get_user", return_value="user")
+@patch.object(ResourceServerBackend, "get_user", return_value=("user", "audience"))
 def test_get_or_create_user(mock_get_user, resource_server_backend):
     """Test 'get_or_create_user' method."""
 
@@ -294,6 +300,97 @@ def test_introspect_public_key_import_failure(
         )
 
 
+def _build_signed_token(kid):
+    """Build a decrypted token signed with a fresh key identified by 'kid'."""
+    signing_key = RSAKey.generate_key(2048, parameters={"kid": kid})
+    signed_token = Mock()
+    signed_token.plaintext = jose_jwt.encode(
+        {"alg": "RS256", "kid": kid}, {"sub": "user123"}, signing_key
+    ).encode()
+    return signed_token, signing_key
+
+
+def test_get_public_key_set_known_kid(resource_server_backend):
+    """The cached JWKS should be used when it contains the token signing key."""
+    signed_token, signing_key = _build_signed_token("known")
+    key_set = KeySet([signing_key])
+    client = resource_server_backend._authorization_server_client
+    client.import_public_keys = Mock(return_value=key_set)
+
+    assert resource_server_backend._get_public_key_set(signed_token) == key_set
+
+    client.import_public_keys.assert_called_once_with()
+
+
+def test_get_public_key_set_unknown_kid(resource_server_backend):
+    """The JWKS should be refreshed when the token is signed with an unknown key."""
+    signed_token, signing_key = _build_signed_token("rotated")
+    old_key_set = KeySet([RSAKey.generate_key(2048, parameters={"kid": "old"})])
+    new_key_set = KeySet([signing_key])
+    client = resource_server_backend._authorization_server_client
+    client.import_public_keys = Mock(side_effect=[old_key_set, new_key_set])
+
+    assert resource_server_backend._get_public_key_set(signed_token) == new_key_set
+
+    assert client.import_public_keys.call_args_list == [
+        call(),
+        call(force_refresh=True),
+    ]
+
+
+@patch("requests.Session.request")
+def test_get_public_key_set_unknown_kid_refresh_rate_limited(
+    mock_request, resource_server_backend
+):
+    """
+    Tokens signed with unknown keys should refresh the JWKS at most once per minimum
+    interval, so that forged tokens cannot flood the authorization server.
+    """
+    old_key = RSAKey.generate_key(2048, parameters={"kid": "old"})
+    mock_response = Mock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": [old_key.as_dict()]}
+    mock_request.return_value = mock_response
+    resource_server_backend._authorization_server_client = AuthorizationServerClient(
+        url="https://auth.example.com/api/v2",
+        url_jwks="https://auth.example.com/api/v2/jwks",
+        url_introspection="https://auth.example.com/api/v2/introspect",
+        verify_ssl=True,
+        timeout=5,
+        proxy=None,
+        jwks_min_refresh_interval=60,
+    )
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        for index in range(5):
+            signed_token, _signing_key = _build_signed_token(f"unknown-{index}")
+            resource_server_backend._get_public_key_set(signed_token)
+
+        # The JWKS was fetched to fill the cache, then refreshed once
+        assert mock_request.call_count == 2
+
+        frozen_time.tick(61)
+        signed_token, _signing_key = _build_signed_token("unknown")
+        resource_server_backend._get_public_key_set(signed_token)
+
+    assert mock_request.call_count == 3
+
+
+def test_get_public_key_set_refresh_failure(resource_server_backend):
+    """Failing to refresh the JWKS should raise a SuspiciousOperation."""
+    signed_token, _signing_key = _build_signed_token("rotated")
+    old_key_set = KeySet([RSAKey.generate_key(2048, parameters={"kid": "old"})])
+    client = resource_server_backend._authorization_server_client
+    client.import_public_keys = Mock(
+        side_effect=[old_key_set, HTTPError("Public key error")]
+    )
+
+    with pytest.raises(
+        SuspiciousOperation, match="Could get authorization server JWKS"
+    ):
+        resource_server_backend._get_public_key_set(signed_token)
+
+
 def test_verify_user_info_success(resource_server_backend):
     """Test '_verify_user_info' with a successful response."""
     introspection_response = {"active": True, "scope": "groups", "aud": "123"}
@@ -343,9 +440,10 @@ def test_get_user_success(resource_server_backend):
     )
     resource_server_backend.UserModel.objects.get = Mock(return_value=mock_user)
 
-    user = resource_server_backend.get_user(access_token)
+    user, audience = resource_server_backend.get_user(access_token)
 
     assert user == mock_user
+    assert audience == "123"
     resource_server_backend._introspect.assert_called_once_with(access_token)
     resource_server_backend._verify_claims.assert_called_once_with(mock_jwt)
     resource_server_backend._verify_user_info.assert_called_once_with(
@@ -410,8 +508,9 @@ def test_get_user_user_not_found(resource_server_backend):
     )
 
     with patch.object(Logger, "debug") as mock_logger_debug:
-        user = resource_server_backend.get_user(access_token)
+        user, audience = resource_server_backend.get_user(access_token)
         assert user is None
+        assert audience is None
         resource_server_backend._introspect.assert_called_once_with(access_token)
         resource_server_backend._verify_claims.assert_called_once_with(mock_jwt)
         resource_server_backend._verify_user_info.assert_called_once_with(
@@ -445,3 +544,114 @@ def test_get_user_no_user_identification(resource_server_backend):
             resource_server_backend.get_user(access_token)
 
         mock_logger_debug.assert_called_once_with(expected_message)
+
+
+def test_get_user_introspection_cached(resource_server_backend):
+    """Test '_get_user' only introspects the same access token once."""
+
+    access_token = "valid_access_token"
+    mock_jwt = Mock()
+    user_info = {"sub": "user123", "aud": "123", "exp": time.time() + 3600}
+    mock_claims = {"token_introspection": user_info}
+    mock_user = Mock()
+
+    resource_server_backend._introspect = Mock(return_value=mock_jwt)
+    resource_server_backend._verify_claims = Mock(return_value=mock_claims)
+    resource_server_backend._verify_user_info = Mock(return_value=user_info)
+    resource_server_backend.UserModel.objects.get = Mock(return_value=mock_user)
+
+    assert resource_server_backend.get_user(access_token) == (mock_user, "123")
+    assert resource_server_backend.get_user(access_token) == (mock_user, "123")
+
+    resource_server_backend._introspect.assert_called_once_with(access_token)
+    resource_server_backend._verify_claims.assert_called_once_with(mock_jwt)
+    resource_server_backend._verify_user_info.assert_called_once()
+
+    # The token itself is never used as cache key
+    assert all(access_token not in key for key in cache._cache)  # pylint: disable=no-member
+
+    # Another token is introspected
+    resource_server_backend.get_user("another_access_token")
+    assert resource_server_backend._introspect.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "expires_in,max_timeout,expected_timeout",
+    [
+        (None, 60, 60),
+        (3600, 60, 60),
+        (30, 60, 30),
+        (-10, 60, -10),
+    ],
+)
+def test_get_introspection_cache_timeout(
+    resource_server_backend, expires_in, max_timeout, expected_timeout
+):
+    """The introspection cache timeout should be bounded by the token expiration."""
+    resource_server_backend._introspection_cache_timeout = max_timeout
+    introspection_response = {"sub": "user123"}
+
+    with freeze_time("2025-01-01 00:00:00"):
+        if expires_in is not None:
+            introspection_response["exp"] = time.time() + expires_in
+
+        assert (
+            resource_server_backend._get_introspection_cache_timeout(
+                introspection_response
+            )
+            == expected_timeout
+        )
+
+
+def test_get_user_expired_introspection_not_cached(resource_server_backend):
+    """An introspection response for an expired token should not be cached."""
+
+    access_token = "valid_access_token"
+    user_info = {"sub": "user123", "aud": "123", "exp": time.time() - 1}
+
+    resource_server_backend._introspect = Mock(return_value=Mock())
+    resource_server_backend._verify_claims = Mock(
+        return_value={"token_introspection": user_info}
+    )
+    resource_server_backend._verify_user_info = Mock(return_value=user_info)
+    resource_server_backend.UserModel.objects.get = Mock(return_value=Mock())
+
+    resource_server_backend.get_user(access_token)
+    resource_server_backend.get_user(access_token)
+
+    assert resource_server_backend._introspect.call_count == 2
+
+
+def test_get_user_rejected_token_cached(resource_server_backend):
+    """A token rejected by the verification should not be introspected again."""
+
+    access_token = "inactive_access_token"
+
+    resource_server_backend._introspect = Mock(return_value=Mock())
+    resource_server_backend._verify_claims = Mock(
+        return_value={"token_introspection": {"active": False}}
+    )
+
+    with pytest.raises(SuspiciousOperation, match="Introspection response is not"):
+        resource_server_backend.get_user(access_token)
+
+    with pytest.raises(SuspiciousOperation, match="rejected by a previous"):
+        resource_server_backend.get_user(access_token)
+
+    resource_server_backend._introspect.assert_called_once_with(access_token)
+
+
+def test_get_user_introspection_failure_not_cached(resource_server_backend):
+    """A failing introspection request should not be cached as a rejection."""
+
+    access_token = "valid_access_token"
+
+    resource_server_backend._introspect = Mock(
+        side_effect=SuspiciousOperation("Could not fetch introspection")
+    )
+
+    for _ in range(2):
+        with pytest.raises(SuspiciousOperation, match="Could not fetch"):
+            resource_server_backend.get_user(access_token)
+
+    assert resource_server_backend._introspect.call_count == 2
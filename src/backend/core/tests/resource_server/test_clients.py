@@ -6,7 +6,10 @@ Test for the Resource Server (RS) clients classes.
 
 from unittest.mock import MagicMock, patch
 
+from django.core.cache import cache
+
 import pytest
+import responses
 from joserfc.jwk import KeySet, RSAKey
 from requests.exceptions import HTTPError
 
@@ -57,7 +60,7 @@ def test_introspection_headers(client):
     }
 
 
-@patch("requests.post")
+@patch("requests.Session.request")
 def test_get_introspection_success(mock_post, client):
     """Test 'get_introspection' method with a successful response."""
 
@@ -70,6 +73,7 @@ def test_get_introspection_success(mock_post, client):
     assert result == "introspection response"
 
     mock_post.assert_called_once_with(
+        "POST",
         "https://auth.example.com/api/v2/introspect",
         data={
             "client_id": "client_id",
@@ -86,7 +90,7 @@ def test_get_introspection_success(mock_post, client):
     )
 
 
-@patch("requests.post", side_effect=HTTPError())
+@patch("requests.Session.request", side_effect=HTTPError())
 # pylint: disable=(unused-argument
 def test_get_introspection_error(mock_post, client):
     """Test 'get_introspection' method with an HTTPError."""
@@ -94,7 +98,7 @@ def test_get_introspection_error(mock_post, client):
         client.get_introspection("client_id", "client_secret", "token")
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_get_jwks_success(mock_get, client):
     """Test 'get_jwks' method with a successful response."""
 
@@ -107,6 +111,7 @@ def test_get_jwks_success(mock_get, client):
     assert result == {"jwks": "foo"}
 
     mock_get.assert_called_once_with(
+        "GET",
         "https://auth.example.com/api/v2/jwks",
         verify=client._verify_ssl,
         timeout=client._timeout,
@@ -114,7 +119,7 @@ def test_get_jwks_success(mock_get, client):
     )
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_get_jwks_error(mock_get, client):
     """Test 'get_jwks' method with an HTTPError."""
 
@@ -128,7 +133,7 @@ def test_get_jwks_error(mock_get, client):
         client.get_jwks()
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_import_public_keys_valid(mock_get, client):
     """Test 'import_public_keys' method with a successful response."""
 
@@ -145,7 +150,7 @@ def test_import_public_keys_valid(mock_get, client):
     assert response.as_dict() == KeySet([mocked_key]).as_dict()
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_import_public_keys_http_error(mock_get, client):
     """Test 'import_public_keys' method with an HTTPError."""
 
@@ -159,7 +164,7 @@ def test_import_public_keys_http_error(mock_get, client):
         client.import_public_keys()
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_import_public_keys_empty_jwks(mock_get, client):
     """Test 'import_public_keys' method with empty keys response."""
 
@@ -174,7 +179,7 @@ def test_import_public_keys_empty_jwks(mock_get, client):
     assert response.as_dict() == {"keys": []}
 
 
-@patch("requests.get")
+@patch("requests.Session.request")
 def test_import_public_keys_invalid_jwks(mock_get, client):
     """Test 'import_public_keys' method with invalid keys response."""
 
@@ -185,3 +190,159 @@ def test_import_public_keys_invalid_jwks(mock_get, client):
 
     with pytest.raises(ValueError):
         client.import_public_keys()
+
+
+@patch("requests.Session.request")
+def test_import_public_keys_cached(mock_get, client):
+    """The JWKS should be fetched once and then served from the cache."""
+
+    mocked_key = RSAKey.generate_key(2048)
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": [mocked_key.as_dict()]}
+    mock_get.return_value = mock_response
+
+    first_response = client.import_public_keys()
+    second_response = client.import_public_keys()
+
+    mock_get.assert_called_once()
+    assert first_response.as_dict() == second_response.as_dict()
+    assert cache.get(client._jwks_cache_key) == {"keys": [mocked_key.as_dict()]}
+
+
+@patch("requests.Session.request")
+def test_import_public_keys_force_refresh(mock_get, client):
+    """Forcing the refresh should bypass the cache and store the new JWKS."""
+
+    old_key = RSAKey.generate_key(2048, parameters={"kid": "old"})
+    new_key = RSAKey.generate_key(2048, parameters={"kid": "new"})
+    cache.set(client._jwks_cache_key, {"keys": [old_key.as_dict()]})
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": [new_key.as_dict()]}
+    mock_get.return_value = mock_response
+
+    assert client.import_public_keys().as_dict() == KeySet([old_key]).as_dict()
+    mock_get.assert_not_called()
+
+    response = client.import_public_keys(force_refresh=True)
+
+    mock_get.assert_called_once()
+    assert response.as_dict() == KeySet([new_key]).as_dict()
+    assert cache.get(client._jwks_cache_key) == {"keys": [new_key.as_dict()]}
+
+
+@patch("requests.Session.request")
+def test_import_public_keys_force_refresh_rate_limited(mock_get, client):
+    """Forced refreshes should be served from the cache within the minimum interval."""
+
+    old_key = RSAKey.generate_key(2048, parameters={"kid": "old"})
+    new_key = RSAKey.generate_key(2048, parameters={"kid": "new"})
+    cache.set(client._jwks_cache_key, {"keys": [old_key.as_dict()]})
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": [new_key.as_dict()]}
+    mock_get.return_value = mock_response
+
+    assert (
+        client.import_public_keys(force_refresh=True).as_dict()
+        == KeySet([new_key]).as_dict()
+    )
+    mock_response.json.return_value = {"keys": [old_key.as_dict()]}
+
+    for _index in range(3):
+        assert (
+            client.import_public_keys(force_refresh=True).as_dict()
+            == KeySet([new_key]).as_dict()
+        )
+
+    mock_get.assert_called_once()
+
+    cache.delete(client._jwks_refresh_cache_key)
+    assert (
+        client.import_public_keys(force_refresh=True).as_dict()
+        == KeySet([old_key]).as_dict()
+    )
+    assert mock_get.call_count == 2
+
+
+@patch("requests.Session.request")
+def test_import_public_keys_invalid_jwks_not_cached(mock_get, client):
+    """An invalid JWKS should not be stored in the cache."""
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": [{"foo": "foo"}]}
+    mock_get.return_value = mock_response
+
+    with pytest.raises(ValueError):
+        client.import_public_keys()
+
+    assert cache.get(client._jwks_cache_key) is None
+
+
+@patch("requests.Session.request")
+def test_requests_stats(mock_request, client):
+    """Requests latency and errors should be counted per endpoint."""
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = {"keys": []}
+    mock_request.return_value = mock_response
+
+    client.get_jwks()
+    client.get_introspection("client_id", "client_secret", "token")
+
+    mock_response.raise_for_status.side_effect = HTTPError()
+    with pytest.raises(HTTPError):
+        client.get_introspection("client_id", "client_secret", "token")
+
+    stats = client.stats
+    assert stats["jwks"]["requests"] == 1
+    assert stats["jwks"]["errors"] == 0
+    assert stats["introspection"]["requests"] == 2
+    assert stats["introspection"]["errors"] == 1
+    assert stats["introspection"]["duration"] >= 0
+
+
+def test_session_pool_and_retries():
+    """The client session should use the configured pool size and retries."""
+
+    new_client = AuthorizationServerClient(
+        url="https://auth.example.com/api/v2",
+        url_jwks="https://auth.example.com/api/v2/jwks",
+        url_introspection="https://auth.example.com/api/v2/introspect",
+        verify_ssl=True,
+        timeout=5,
+        proxy=None,
+        pool_maxsize=42,
+        max_retries=3,
+    )
+
+    adapter = new_client._session.get_adapter("https://auth.example.com")
+    assert adapter._pool_maxsize == 42
+    assert adapter.max_retries.total == 3
+    assert "POST" in adapter.max_retries.allowed_methods
+
+
+@responses.activate
+def test_get_introspection_retry_on_gateway_error(client):
+    """Introspection should be retried when the authorization server is unavailable."""
+
+    responses.add(
+        responses.POST, "https://auth.example.com/api/v2/introspect", status=503
+    )
+    responses.add(
+        responses.POST,
+        "https://auth.example.com/api/v2/introspect",
+        body="introspection response",
+    )
+
+    assert (
+        client.get_introspection("client_id", "client_secret", "token")
+        == "introspection response"
+    )
+    assert len(responses.calls) == 2
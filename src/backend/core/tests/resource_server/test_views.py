@@ -68,3 +68,31 @@ def test_view_jwks_missing_private_key(mock_import_private_key_from_settings):
 
     assert response.status_code == 500
     assert response.json() == {"error": "foo."}
+
+
+@mock.patch("core.resource_server.utils.import_private_key_from_settings")
+def test_view_jwks_cache_headers(mock_import_private_key_from_settings):
+    """JWKS endpoint should be served with an ETag and Cache-Control headers."""
+
+    mocked_key = RSAKey.generate_key(2048)
+    mock_import_private_key_from_settings.return_value = mocked_key
+
+    url = reverse("resource_server_jwks")
+    response = APIClient().get(url)
+
+    assert response.status_code == 200
+    assert response["ETag"].startswith('"')
+    assert response["Cache-Control"] == "public, max-age=3600"
+
+    # Same key, same ETag: the client copy is still valid
+    response_not_modified = APIClient().get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    assert response_not_modified.status_code == 304
+    assert response_not_modified["ETag"] == response["ETag"]
+    assert not response_not_modified.content
+
+    # Outdated ETag: the JWKS is sent again
+    response_modified = APIClient().get(url, HTTP_IF_NONE_MATCH='"outdated"')
+
+    assert response_modified.status_code == 200
+    assert response_modified.json() == response.json()
@@ -0,0 +1,239 @@
+"""
+Test for team accesses API endpoints in People's core app : bulk create
+"""
+
+import json
+import re
+from unittest import mock
+
+import pytest
+import responses
+from rest_framework.test import APIClient
+
+from core import factories, models
+from core.api.client import serializers
+
+pytestmark = pytest.mark.django_db
+
+
+def test_api_team_accesses_bulk_create_anonymous():
+    """Anonymous users should not be allowed to create team accesses."""
+    user = factories.UserFactory()
+    team = factories.TeamFactory()
+
+    response = APIClient().post(
+        f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+        {"accesses": [{"user": str(user.id), "role": "member"}]},
+        format="json",
+    )
+    assert response.status_code == 401
+    assert models.TeamAccess.objects.exists() is False
+
+
+@pytest.mark.parametrize("role", [None, "member"])
+def test_api_team_accesses_bulk_create_authenticated_unprivileged(role):
+    """Users who are not owner or administrator of a team should not add members."""
+    user, other_user = factories.UserFactory.create_batch(2)
+    team = factories.TeamFactory(users=[(user, role)] if role else [])
+
+    client = APIClient()
+    client.force_login(user)
+    response = client.post(
+        f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+        {"accesses": [{"user": str(other_user.id), "role": "member"}]},
+        format="json",
+    )
+
+    assert response.status_code == 403
+    assert response.json() == {
+        "detail": "You are not allowed to manage accesses for this team."
+    }
+    assert not models.TeamAccess.objects.filter(user=other_user).exists()
+
+
+def test_api_team_accesses_bulk_create_administrator_owner_role():
+    """Administrators of a team should not be allowed to add owners."""
+    user, other_user = factories.UserFactory.create_batch(2)
+    team = factories.TeamFactory(users=[(user, "administrator")])
+
+    client = APIClient()
+    client.force_login(user)
+    response = client.post(
+        f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+        {"accesses": [{"user": str(other_user.id), "role": "owner"}]},
+        format="json",
+    )
+
+    assert response.status_code == 403
+    assert response.json() == {
+        "detail": "Only owners of a team can assign other users as owners."
+    }
+    assert not models.TeamAccess.objects.filter(user=other_user).exists()
+
+
+def test_api_team_accesses_bulk_create_invalid_users():
+    """Unknown, duplicated or existing members should be rejected as a whole."""
+    user, other_user, member = factories.UserFactory.create_batch(3)
+    team = factories.TeamFactory(users=[(user, "owner"), (member, "member")])
+    unknown_id = "9ccb7a9b-56cd-4f6e-a4b5-74bbf8bd7da6"
+
+    client = APIClient()
+    client.force_login(user)
+    url = f"/api/v1.0/teams/{team.id!s}/accesses/bulk/"
+
+    response = client.post(url, {"accesses": []}, format="json")
+    assert response.status_code == 400
+    assert response.json() == {
+        "accesses": {"non_field_errors": ["This list may not be empty."]}
+    }
+
+    response = client.post(
+        url,
+        {"accesses": [{"user": str(other_user.id)}, {"user": str(other_user.id)}]},
+        format="json",
+    )
+    assert response.status_code == 400
+    assert response.json() == {"accesses": ["Each user can only be given one access."]}
+
+    response = client.post(
+        url,
+        {"accesses": [{"user": str(other_user.id)}, {"user": unknown_id}]},
+        format="json",
+    )
+    assert response.status_code == 400
+    assert response.json() == {"accesses": [f"Unknown users: {unknown_id}."]}
+
+    response = client.post(
+        url,
+        {"accesses": [{"user": str(other_user.id)}, {"user": str(member.id)}]},
+        format="json",
+    )
+    assert response.status_code == 400
+    assert response.json() == {
+        "accesses": [f"These users are already in this team: {member.id!s}."]
+    }
+
+    assert not models.TeamAccess.objects.filter(user=other_user).exists()
+
+
+@pytest.mark.parametrize("role", ["administrator", "owner"])
+@pytest.mark.parametrize("count", [1, 20])
+def test_api_team_accesses_bulk_create_privileged(
+    role, count, django_assert_num_queries
+):
+    """
+    Owners and administrators of a team should be able to add members at once,
+    with a number of queries that does not depend on the number of members.
+    """
+    user = factories.UserFactory()
+    team = factories.TeamFactory(users=[(user, role)])
+    other_users = factories.UserFactory.create_batch(count)
+
+    client = APIClient()
+    client.force_login(user)
+    # The accesses are inserted within a savepoint, to report users added meanwhile,
+    # and the webhooks of the team are looked up to record their events with them
+    with django_assert_num_queries(11):
+        response = client.post(
+            f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+            {
+                "accesses": [
+                    {"user": str(other_user.id), "role": "administrator"}
+                    for other_user in other_users
+                ]
+            },
+            format="json",
+        )
+
+    assert response.status_code == 201
+    accesses = response.json()
+    assert len(accesses) == count
+    assert {access["user"]["id"] for access in accesses} == {
+        str(other_user.id) for other_user in other_users
+    }
+    assert accesses[0]["role"] == "administrator"
+    assert accesses[0]["abilities"]["delete"] is True
+    assert models.TeamAccess.objects.filter(
+        team=team, role="administrator"
+    ).count() == count + (role == "administrator")
+
+
+def test_api_team_accesses_bulk_create_webhook(django_capture_on_commit_callbacks):
+    """New members should be sent to each webhook of the team in a single request."""
+    user = factories.UserFactory()
+    # Commit the creation of the team so that its changes are sent on their own
+    with django_capture_on_commit_callbacks(execute=True):
+        team = factories.TeamFactory(users=[(user, "owner")])
+    webhook = factories.TeamWebhookFactory(team=team)
+    other_users = factories.UserFactory.create_batch(3)
+
+    client = APIClient()
+    client.force_login(user)
+
+    with responses.RequestsMock() as rsps:
+        rsp = rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+                {
+                    "accesses": [
+                        {"user": str(other_user.id)} for other_user in other_users
+                    ]
+                },
+                format="json",
+            )
+        assert response.status_code == 201
+
+        assert rsp.call_count == 1
+        assert rsps.calls[0].request.url == webhook.url
+        payload = json.loads(rsps.calls[0].request.body)
+
+    assert payload["Operations"] == [
+        {
+            "op": "add",
+            "path": "members",
+            "value": [
+                {"value": str(other_user.id), "email": other_user.email, "type": "User"}
+                for other_user in other_users
+            ],
+        }
+    ]
+
+
+def test_api_team_accesses_bulk_create_concurrent():
+    """
+    Users added to the team by another request since the validation should be
+    reported as already in the team, instead of failing with a server error.
+    """
+    user, other_user, concurrent_user = factories.UserFactory.create_batch(3)
+    team = factories.TeamFactory(users=[(user, "owner")])
+    validate = serializers.TeamAccessBulkCreateSerializer.validate
+
+    def concurrent_validate(serializer, attrs):
+        attrs = validate(serializer, attrs)
+        models.TeamAccess.objects.create(team=team, user=concurrent_user)
+        return attrs
+
+    client = APIClient()
+    client.force_login(user)
+    with mock.patch.object(
+        serializers.TeamAccessBulkCreateSerializer, "validate", concurrent_validate
+    ):
+        response = client.post(
+            f"/api/v1.0/teams/{team.id!s}/accesses/bulk/",
+            {
+                "accesses": [
+                    {"user": str(other_user.id), "role": "member"},
+                    {"user": str(concurrent_user.id), "role": "administrator"},
+                ]
+            },
+            format="json",
+        )
+
+    assert response.status_code == 400
+    assert response.json() == {
+        "accesses": [f"These users are already in this team: {concurrent_user.id!s}."]
+    }
+    assert not models.TeamAccess.objects.filter(user=other_user).exists()
+    assert models.TeamAccess.objects.get(user=concurrent_user).role == "member"
@@ -171,13 +171,15 @@ def test_api_team_accesses_create_authenticated_owner():
     }
 
 
-def test_api_team_accesses_create_webhook():
+def test_api_team_accesses_create_webhook(django_capture_on_commit_callbacks):
     """
     When the team has a webhook, creating a team access should fire a call.
     """
     user, other_user = factories.UserFactory.create_batch(2)
 
-    team = factories.TeamFactory(users=[(user, "owner")])
+    # Commit the creation of the team so that its changes are sent on their own
+    with django_capture_on_commit_callbacks(execute=True):
+        team = factories.TeamFactory(users=[(user, "owner")])
     webhook = factories.TeamWebhookFactory(team=team)
 
     role = random.choice([role[0] for role in models.RoleChoices.choices])
@@ -195,14 +197,15 @@ def test_api_team_accesses_create_webhook():
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/teams/{team.id!s}/accesses/",
-            {
-                "user": str(other_user.id),
-                "role": role,
-            },
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/teams/{team.id!s}/accesses/",
+                {
+                    "user": str(other_user.id),
+                    "role": role,
+                },
+                format="json",
+            )
         assert response.status_code == 201
 
         assert rsp.call_count == 1
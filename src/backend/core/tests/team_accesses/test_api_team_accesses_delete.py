@@ -157,16 +157,18 @@ def test_api_team_accesses_delete_owners_last_owner():
     assert models.TeamAccess.objects.count() == 1
 
 
-def test_api_team_accesses_delete_webhook():
+def test_api_team_accesses_delete_webhook(django_capture_on_commit_callbacks):
     """
     When the team has a webhook, deleting a team access should fire a call.
     """
     user = factories.UserFactory()
-    team = factories.TeamFactory(users=[(user, "administrator")])
+    # Commit the creation of the accesses, which would otherwise cancel out their deletion
+    with django_capture_on_commit_callbacks(execute=True):
+        team = factories.TeamFactory(users=[(user, "administrator")])
+        access = factories.TeamAccessFactory(
+            team=team, role=random.choice(["member", "administrator"])
+        )
     webhook = factories.TeamWebhookFactory(team=team)
-    access = factories.TeamAccessFactory(
-        team=team, role=random.choice(["member", "administrator"])
-    )
 
     assert models.TeamAccess.objects.count() == 2
     assert models.TeamAccess.objects.filter(user=access.user).exists()
@@ -184,9 +186,10 @@ def test_api_team_accesses_delete_webhook():
             content_type="application/json",
         )
 
-        response = client.delete(
-            f"/api/v1.0/teams/{team.id!s}/accesses/{access.id!s}/",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.delete(
+                f"/api/v1.0/teams/{team.id!s}/accesses/{access.id!s}/",
+            )
         assert response.status_code == 204
 
         assert rsp.call_count == 1
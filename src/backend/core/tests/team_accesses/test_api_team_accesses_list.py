@@ -144,10 +144,10 @@ def test_api_team_accesses_list_find_members(django_assert_num_queries):
     client = APIClient()
     client.force_login(mary)
 
-    # 5 queries are needed here:
+    # 3 queries are needed here:
     # - 1 query: select on user authenticated
-    # - 4 queries: get all users, owner included (2 more queries)
-    with django_assert_num_queries(5):
+    # - 2 queries: get all users, owner included
+    with django_assert_num_queries(3):
         response = client.get(
             f"/api/v1.0/teams/{team.id!s}/accesses/",
         )
@@ -181,10 +181,10 @@ def test_api_team_accesses_list_find_members(django_assert_num_queries):
     assert response.json()["results"][0]["id"] == str(nicole_access.id)
 
     # We can find Nicole and Mary
-    # 5 queries are needed here:
+    # 3 queries are needed here:
     # - 1 query: select on user authenticated
-    # - 4 queries: search user query with match and the owner found (2 more queries)
-    with django_assert_num_queries(5):
+    # - 2 queries: search user query with match, the owner found included
+    with django_assert_num_queries(3):
         response = client.get(
             f"/api/v1.0/teams/{team.id!s}/accesses/?q=ool",
         )
@@ -206,10 +206,10 @@ def test_api_team_accesses_list_find_members(django_assert_num_queries):
     assert response.json()["count"] == 0
 
     # We can find Mary
-    # 5 queries are needed here:
+    # 3 queries are needed here:
     # - 1 query: select on user authenticated
-    # - 4 queries: search user query with match and an owner found (2 more queries)
-    with django_assert_num_queries(5):
+    # - 2 queries: search user query with match, an owner found included
+    with django_assert_num_queries(3):
         response = client.get(
             f"/api/v1.0/teams/{team.id!s}/accesses/?q=mary",
         )
@@ -367,3 +367,30 @@ def test_api_team_accesses_list_authenticated_ordering_user(ordering_field):
         mary.name,
         nicole.name,
     ]
+
+
+def test_api_team_accesses_list_authenticated_owners_constant_numqueries(
+    django_assert_num_queries,
+):
+    """
+    Listing accesses as an owner should not query the number of owners for each
+    owner access.
+    """
+    user = factories.UserFactory()
+    team = factories.TeamFactory()
+    factories.TeamAccessFactory(team=team, user=user, role="owner")
+    factories.TeamAccessFactory.create_batch(10, team=team, role="owner")
+
+    client = APIClient()
+    client.force_login(user)
+
+    with django_assert_num_queries(3):
+        response = client.get(f"/api/v1.0/teams/{team.id!s}/accesses/")
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 11
+    own_access = next(
+        access for access in results if access["user"]["id"] == str(user.id)
+    )
+    assert own_access["abilities"]["delete"] is True
@@ -0,0 +1,32 @@
+"""
+Test the configuration of People's core app.
+"""
+
+from unittest import mock
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+
+import pytest
+
+from core.resource_server import utils
+
+
+def test_apps_ready_resource_server_not_configured(settings):
+    """Without a resource server private key, the startup should go on."""
+    settings.OIDC_RS_PRIVATE_KEY_STR = None
+
+    with mock.patch.object(utils, "_import_private_key") as import_mock:
+        apps.get_app_config("core").ready()
+
+    import_mock.assert_not_called()
+
+
+def test_apps_ready_resource_server_invalid_key(settings):
+    """An invalid resource server private key should stop the startup."""
+    settings.OIDC_RS_PRIVATE_KEY_STR = "not a private key"
+
+    with pytest.raises(
+        ImproperlyConfigured, match="OIDC_RS_PRIVATE_KEY_STR setting is wrong."
+    ):
+        apps.get_app_config("core").ready()
@@ -6,7 +6,8 @@ from django.core.exceptions import ValidationError
 
 import pytest
 
-from core import factories
+from core import factories, models
+from core.utils.search import search_filter
 
 pytestmark = pytest.mark.django_db
 
@@ -155,3 +156,57 @@ def test_models_contacts_data_invalid():
         "{'data': [\"Validation error in 'emails.0.type': 'invalid type' is not one of ['Work', "
         "'Home', 'Other']\"]}"
     )
+
+
+def test_models_contacts_search_emails():
+    """The email addresses of a contact should be kept denormalized for searching."""
+    contact = factories.ContactFactory(
+        data={
+            "emails": [
+                {"type": "Work", "value": "hélène@example.com"},
+                {"type": "Home", "value": "helene@example.org"},
+            ],
+            "phones": [{"type": "Mobile", "value": "0123456789"}],
+        }
+    )
+    contact.refresh_from_db()
+
+    assert contact.search_emails == "hélène@example.com\nhelene@example.org"
+
+    contact.data = {"emails": []}
+    contact.save()
+    contact.refresh_from_db()
+
+    assert contact.search_emails is None
+
+
+def test_models_contacts_search_emails_no_punctuation():
+    """Searching email addresses should not match across addresses nor JSON syntax."""
+    factories.ContactFactory(
+        data={
+            "emails": [
+                {"type": "Work", "value": "john@example.com"},
+                {"type": "Home", "value": "doe@example.org"},
+            ],
+        }
+    )
+
+    assert models.Contact.objects.filter(
+        search_filter("john@example.com", "search_emails")
+    ).exists()
+    for query in ['"', "[", ", ", 'com", "doe']:
+        assert not models.Contact.objects.filter(
+            search_filter(query, "search_emails")
+        ).exists()
+
+
+def test_models_contacts_get_abilities_no_query(django_assert_num_queries):
+    """Abilities on a contact should be computed without querying its owner."""
+    contact = factories.ContactFactory()
+    user = factories.UserFactory()
+    contact = models.Contact.objects.get(pk=contact.pk)
+
+    with django_assert_num_queries(0):
+        abilities = contact.get_abilities(user)
+
+    assert abilities == {"delete": False, "get": False, "patch": False, "put": False}
@@ -2,6 +2,7 @@
 Unit tests for the Invitation model
 """
 
+import json
 import smtplib
 import time
 import uuid
@@ -12,6 +13,7 @@ from django.contrib.auth.models import AnonymousUser
 from django.core import exceptions, mail
 
 import pytest
+import responses
 from faker import Faker
 from freezegun import freeze_time
 
@@ -115,6 +117,36 @@ def test_models_invitation__new_user__convert_invitations_to_accesses():
     ).exists()  # the other invitation remains
 
 
+def test_models_invitation__new_user__convert_invitations_webhooks(
+    django_capture_on_commit_callbacks,
+):
+    """
+    Team accesses converted from invitations should be synchronized with the
+    webhooks of their team.
+    """
+    invitation = factories.InvitationFactory()
+    webhook = factories.TeamWebhookFactory(team=invitation.team)
+
+    with responses.RequestsMock() as rsps:
+        rsp = rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            new_user = factories.UserFactory(email=invitation.email)
+
+        assert rsp.call_count == 1
+        payload = json.loads(rsps.calls[0].request.body)
+
+    assert payload["Operations"] == [
+        {
+            "op": "add",
+            "path": "members",
+            "value": [
+                {"value": str(new_user.id), "email": new_user.email, "type": "User"}
+            ],
+        }
+    ]
+
+
 def test_models_invitation__new_user__filter_expired_invitations():
     """
     Upon creating a new user, valid invitations should be converted into accesses
@@ -144,7 +176,7 @@ def test_models_invitation__new_user__filter_expired_invitations():
     ).exists()
 
 
-@pytest.mark.parametrize("num_invitations, num_queries", [(0, 4), (1, 7), (20, 7)])
+@pytest.mark.parametrize("num_invitations, num_queries", [(0, 4), (1, 10), (20, 10)])
 def test_models_invitation__new_user__user_creation_constant_num_queries(
     django_assert_num_queries, num_invitations, num_queries
 ):
@@ -238,8 +270,8 @@ def test_models_team_invitations_get_abilities_member():
     }
 
 
-def test_models_team_invitations_email():
-    """Check email invitation during invitation creation."""
+def test_models_team_invitations_email(django_capture_on_commit_callbacks):
+    """Check email invitation once the invitation creation is committed."""
 
     member_access = factories.TeamAccessFactory(role="member")
     team = member_access.team
@@ -248,7 +280,10 @@ def test_models_team_invitations_email():
     assert len(mail.outbox) == 0
 
     factories.TeamAccessFactory(team=team)
-    invitation = factories.InvitationFactory(team=team, email="john@people.com")
+    with django_capture_on_commit_callbacks(execute=True):
+        invitation = factories.InvitationFactory(team=team, email="john@people.com")
+        # pylint: disable-next=no-member
+        assert len(mail.outbox) == 0
 
     # pylint: disable-next=no-member
     assert len(mail.outbox) == 1
@@ -265,12 +300,14 @@ def test_models_team_invitations_email():
 
 
 @mock.patch(
-    "django.core.mail.send_mail",
+    "django.core.mail.backends.locmem.EmailBackend.send_messages",
     side_effect=smtplib.SMTPException("Error SMTPException"),
 )
 @mock.patch.object(Logger, "error")
-def test_models_team_invitations_email_failed(mock_logger, _mock_send_mail):
-    """Check invitation behavior when an SMTP error occurs during invitation creation."""
+def test_models_team_invitations_email_failed(
+    mock_logger, _mock_send_messages, django_capture_on_commit_callbacks
+):
+    """Check invitation behavior when an SMTP error occurs while sending the invitation."""
 
     member_access = factories.TeamAccessFactory(role="member")
     team = member_access.team
@@ -281,7 +318,8 @@ def test_models_team_invitations_email_failed(mock_logger, _mock_send_mail):
     factories.TeamAccessFactory(team=team)
 
     # No error should be raised
-    invitation = factories.InvitationFactory(team=team, email="john@people.com")
+    with django_capture_on_commit_callbacks(execute=True):
+        invitation = factories.InvitationFactory(team=team, email="john@people.com")
 
     # No email has been sent
     # pylint: disable-next=no-member
@@ -292,9 +330,11 @@ def test_models_team_invitations_email_failed(mock_logger, _mock_send_mail):
 
     (
         _,
+        subject,
         email,
         exception,
     ) = mock_logger.call_args.args
 
+    assert subject == "Invitation to join Desk!"
     assert email == invitation.email
     assert isinstance(exception, smtplib.SMTPException)
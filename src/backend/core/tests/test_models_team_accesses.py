@@ -40,7 +40,7 @@ def test_models_team_accesses_unique():
         factories.TeamAccessFactory(user=access.user, team=access.team)
 
 
-def test_models_team_accesses_create_webhook():
+def test_models_team_accesses_create_webhook(django_capture_on_commit_callbacks):
     """
     When the team has a webhook, creating a team access should fire a call.
     """
@@ -58,7 +58,8 @@ def test_models_team_accesses_create_webhook():
             content_type="application/json",
         )
 
-        models.TeamAccess.objects.create(user=user, team=team)
+        with django_capture_on_commit_callbacks(execute=True):
+            models.TeamAccess.objects.create(user=user, team=team)
 
         assert rsp.call_count == 1
         assert rsps.calls[0].request.url == webhook.url
@@ -83,13 +84,15 @@ def test_models_team_accesses_create_webhook():
         }
 
 
-def test_models_team_accesses_delete_webhook():
+def test_models_team_accesses_delete_webhook(django_capture_on_commit_callbacks):
     """
     When the team has a webhook, deleting a team access should fire a call.
     """
     team = factories.TeamFactory()
+    # Commit the creation of the access, which would otherwise cancel out its deletion
+    with django_capture_on_commit_callbacks(execute=True):
+        access = factories.TeamAccessFactory(team=team)
     webhook = factories.TeamWebhookFactory(team=team)
-    access = factories.TeamAccessFactory(team=team)
 
     with responses.RequestsMock() as rsps:
         # Ensure successful response by scim provider using "responses":
@@ -101,7 +104,8 @@ def test_models_team_accesses_delete_webhook():
             content_type="application/json",
         )
 
-        access.delete()
+        with django_capture_on_commit_callbacks(execute=True):
+            access.delete()
 
         assert rsp.call_count == 1
         assert rsps.calls[0].request.url == webhook.url
@@ -352,3 +356,26 @@ def test_models_team_access_get_abilities_preset_role(django_assert_num_queries)
         "put": False,
         "set_role_to": [],
     }
+
+
+def test_models_team_access_get_abilities_preset_owners_count(
+    django_assert_num_queries,
+):
+    """
+    No query is done for an owner access if the role and the number of owners
+    are preset, e.g., with query annotations.
+    """
+    access = factories.TeamAccessFactory(role="owner")
+    access.user_role = "owner"
+    access.owners_count = 2
+
+    with django_assert_num_queries(0):
+        abilities = access.get_abilities(access.user)
+
+    assert abilities == {
+        "delete": True,
+        "get": True,
+        "patch": True,
+        "put": True,
+        "set_role_to": ["administrator", "member"],
+    }
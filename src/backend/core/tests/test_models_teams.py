@@ -217,3 +217,50 @@ def test_models_teams_tree_alphabet():
     )
 
     assert models.Team.objects.count() == len(models.Team.alphabet) * 2
+
+
+def test_models_teams_manager_visible_to():
+    """
+    Users should see the teams they have access to and the ancestors of these teams
+    in their organization, but not the siblings nor the children of these teams.
+    """
+    user = factories.UserFactory(with_organization=True)
+    root_team = factories.TeamFactory(organization=user.organization)
+    uncle_team = factories.TeamFactory(
+        parent_id=root_team.pk, organization=user.organization
+    )
+    parent_team = factories.TeamFactory(
+        parent_id=root_team.pk, organization=user.organization
+    )
+    team = factories.TeamFactory(
+        parent_id=parent_team.pk, organization=user.organization, users=[user]
+    )
+    _sibling_team = factories.TeamFactory(
+        parent_id=parent_team.pk, organization=user.organization
+    )
+    _child_team = factories.TeamFactory(
+        parent_id=team.pk, organization=user.organization
+    )
+    _other_root_team = factories.TeamFactory(organization=user.organization)
+
+    other_root_team = factories.TeamFactory(
+        organization=factories.OrganizationFactory(with_registration_id=True)
+    )
+    other_team = factories.TeamFactory(parent_id=other_root_team.pk, users=[user])
+
+    assert uncle_team not in models.Team.objects.visible_to(user)
+    # The ancestor in another organization is not visible
+    assert set(models.Team.objects.visible_to(user)) == {
+        root_team,
+        parent_team,
+        team,
+        other_team,
+    }
+
+
+def test_models_teams_manager_visible_to_no_access():
+    """Users without any access should not see any team."""
+    user = factories.UserFactory()
+    factories.TeamFactory(organization=user.organization)
+
+    assert not models.Team.objects.visible_to(user).exists()
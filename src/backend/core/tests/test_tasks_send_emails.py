@@ -0,0 +1,182 @@
+"""Test the mail queue and the sending of emails by batches."""
+
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import transaction
+
+import pytest
+
+from core.tasks import send_emails
+from core.utils import mail as mail_utils
+from core.utils.mail import mail_queue
+
+pytestmark = pytest.mark.django_db
+
+
+def _get_messages(count):
+    """Return messages as queued by the mail queue."""
+    return [
+        {
+            "subject": f"Subject {index}",
+            "body": f"Body {index}",
+            "from_email": "from@example.com",
+            "to": [f"user{index}@example.com"],
+            "html_message": f"<p>Body {index}</p>" if index % 2 else None,
+        }
+        for index in range(count)
+    ]
+
+
+def _flaky_send_messages(errors):
+    """
+    Return a replacement of the send_messages method of the locmem email backend,
+    raising the errors given by call index then sending emails.
+    """
+    send_messages = locmem.EmailBackend.send_messages
+    calls = []
+
+    def flaky_send_messages(backend, email_messages):
+        calls.append(email_messages)
+        if error := errors.get(len(calls)):
+            raise error
+        return send_messages(backend, email_messages)
+
+    return flaky_send_messages, calls
+
+
+def test_tasks_send_emails_batches_on_commit(
+    settings, django_capture_on_commit_callbacks
+):
+    """
+    Emails should be sent once the transaction is committed, by batches sent over a
+    single connection each.
+    """
+    settings.EMAIL_BATCH_SIZE = 2
+
+    with (
+        mock.patch.object(
+            mail_utils.mail, "get_connection", wraps=mail.get_connection
+        ) as get_connection_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        for index in range(3):
+            mail_queue.send_mail(
+                "Welcome",
+                "Hello",
+                "from@example.com",
+                [f"user{index}@example.com"],
+                html_message="<p>Hello</p>",
+            )
+        # pylint: disable-next=no-member
+        assert len(mail.outbox) == 0
+
+    assert get_connection_mock.call_count == 2
+    # pylint: disable=no-member
+    assert [email.to for email in mail.outbox] == [
+        ["user0@example.com"],
+        ["user1@example.com"],
+        ["user2@example.com"],
+    ]
+    assert mail.outbox[0].alternatives == [("<p>Hello</p>", "text/html")]
+
+
+def test_tasks_send_emails_rollback(django_capture_on_commit_callbacks):
+    """Emails queued in a transaction rolled back should not be sent."""
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError), transaction.atomic():
+            mail_queue.send_mail("Welcome", "Hello", None, ["user@example.com"])
+            raise RuntimeError("rollback")
+
+        mail_queue.send_mail("Welcome", "Hello", None, ["other@example.com"])
+
+    # pylint: disable=no-member
+    assert [email.to for email in mail.outbox] == [["other@example.com"]]
+
+
+def test_tasks_send_emails_connection_lost():
+    """Emails left when the connection is lost should be sent again later."""
+    flaky_send_messages, calls = _flaky_send_messages(
+        {2: smtplib.SMTPServerDisconnected("Connection unexpectedly closed")}
+    )
+
+    with mock.patch.object(locmem.EmailBackend, "send_messages", flaky_send_messages):
+        # The retry sends the 2 emails left
+        assert send_emails.apply(args=[_get_messages(3)]).get() == 2
+
+    assert len(calls) == 4
+    # pylint: disable=no-member
+    assert [email.subject for email in mail.outbox] == [
+        "Subject 0",
+        "Subject 1",
+        "Subject 2",
+    ]
+
+
+def test_tasks_send_emails_refused():
+    """
+    Emails refused for a temporary reason should be sent again later, emails refused
+    for good should be dropped, without holding the other emails of the batch.
+    """
+    flaky_send_messages, calls = _flaky_send_messages(
+        {
+            1: smtplib.SMTPRecipientsRefused(
+                {"user0@example.com": (550, b"No such user")}
+            ),
+            2: smtplib.SMTPDataError(451, b"Try again later"),
+        }
+    )
+
+    with (
+        mock.patch.object(locmem.EmailBackend, "send_messages", flaky_send_messages),
+        mock.patch.object(mail_utils.logger, "error") as error_mock,
+    ):
+        # The retry sends the email refused for a temporary reason
+        assert send_emails.apply(args=[_get_messages(3)]).get() == 1
+
+    assert len(calls) == 4
+    # pylint: disable=no-member
+    assert [email.subject for email in mail.outbox] == ["Subject 2", "Subject 1"]
+    error_mock.assert_called_once()
+    assert error_mock.call_args.args[1:3] == ("Subject 0", "user0@example.com")
+
+
+def test_tasks_send_emails_max_retries(settings):
+    """Emails should be dropped once the retries are exhausted."""
+    settings.EMAIL_MAX_RETRIES = 2
+
+    with (
+        mock.patch.object(
+            locmem.EmailBackend,
+            "send_messages",
+            side_effect=smtplib.SMTPServerDisconnected("Connection refused"),
+        ) as send_messages_mock,
+        mock.patch("core.tasks.logger.error") as error_mock,
+    ):
+        assert send_emails.apply(args=[_get_messages(2)]).get() == 0
+
+    assert send_messages_mock.call_count == 3
+    assert error_mock.call_count == 2
+    # pylint: disable-next=no-member
+    assert len(mail.outbox) == 0
+
+
+def test_tasks_send_emails_savepoint_rollback(django_capture_on_commit_callbacks):
+    """
+    Emails queued in a savepoint rolled back should not be sent, the other emails of
+    the transaction being sent together.
+    """
+    with django_capture_on_commit_callbacks(execute=True):
+        mail_queue.send_mail("Welcome", "Hello", None, ["user@example.com"])
+        with pytest.raises(RuntimeError), transaction.atomic():
+            mail_queue.send_mail("Welcome", "Hello", None, ["rolled-back@example.com"])
+            raise RuntimeError("rollback")
+        mail_queue.send_mail("Welcome", "Hello", None, ["other@example.com"])
+
+    # pylint: disable=no-member
+    assert [email.to for email in mail.outbox] == [
+        ["user@example.com"],
+        ["other@example.com"],
+    ]
@@ -0,0 +1,399 @@
+"""Test the delivery of webhook events."""
+
+import json
+import re
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+import pytest
+import requests
+import responses
+from freezegun import freeze_time
+from kombu.exceptions import OperationalError
+
+from core import factories, models
+from core.tasks import (
+    deliver_webhook_events,
+    deliver_webhook_events_batch,
+    drain_webhook_events,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+def test_tasks_webhook_events_recorded_on_commit(django_capture_on_commit_callbacks):
+    """Membership changes should be recorded as an event per webhook and delivered."""
+    team = factories.TeamFactory()
+    user = factories.UserFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            factories.TeamAccessFactory(team=team, user=user)
+
+        assert len(rsps.calls) == 2
+
+    events = models.WebhookEvent.objects.all()
+    assert {event.webhook for event in events} == set(webhooks)
+    for event in events:
+        assert event.status == "delivered"
+        assert event.attempts == 1
+        assert event.operations == [
+            {
+                "op": "add",
+                "user_id": str(user.pk),
+                "email": user.email,
+            }
+        ]
+
+
+def test_tasks_webhook_events_recorded_with_changes(django_capture_on_commit_callbacks):
+    """
+    Events should be recorded in the transaction of the membership changes, only
+    their delivery waiting for it to be committed.
+    """
+    webhook = factories.TeamWebhookFactory()
+
+    with mock.patch.object(deliver_webhook_events, "delay") as delay_mock:
+        with django_capture_on_commit_callbacks() as callbacks:
+            access = factories.TeamAccessFactory(team=webhook.team)
+
+            event = models.WebhookEvent.objects.get()
+            assert event.webhook == webhook
+            assert event.status == "pending"
+            assert event.operations == [
+                {
+                    "op": "add",
+                    "user_id": str(access.user.pk),
+                    "email": access.user.email,
+                }
+            ]
+
+        delay_mock.assert_not_called()
+        assert len(callbacks) == 1
+        callbacks[0]()
+        delay_mock.assert_called_once_with()
+
+
+def test_tasks_webhook_events_broker_unavailable(django_capture_on_commit_callbacks):
+    """
+    Events whose delivery cannot be scheduled should be kept for the periodic
+    delivery, without failing the membership change already committed.
+    """
+    webhook = factories.TeamWebhookFactory()
+
+    with (
+        mock.patch.object(
+            deliver_webhook_events,
+            "delay",
+            side_effect=OperationalError("Connection refused"),
+        ),
+        mock.patch("core.utils.webhooks.logger.error") as error_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        factories.TeamAccessFactory(team=webhook.team)
+
+    error_mock.assert_called_once()
+    event = models.WebhookEvent.objects.get()
+    assert event.status == "pending"
+    assert event.attempts == 0
+
+
+def test_tasks_webhook_events_retry_later():
+    """
+    An event that may be delivered later should be retried with a backoff, the next
+    events of its webhook waiting for it.
+    """
+    webhook = factories.TeamWebhookFactory()
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, body=requests.ConnectionError())
+
+        with freeze_time("2025-01-01 09:59:58"):
+            event = factories.WebhookEventFactory(webhook=webhook)
+        with freeze_time("2025-01-01 09:59:59"):
+            next_event = factories.WebhookEventFactory(webhook=webhook)
+
+        with freeze_time("2025-01-01 10:00:00"):
+            assert deliver_webhook_events_batch(10) == (
+                1,
+                timezone.now() + timedelta(seconds=30),
+            )
+            # The webhook waits for its event to be retried
+            assert deliver_webhook_events_batch(10) == (0, None)
+
+        assert len(rsps.calls) == 1
+
+    event.refresh_from_db()
+    assert event.status == "pending"
+    assert event.attempts == 1
+    assert event.next_attempt_at.isoformat() == "2025-01-01T10:00:30+00:00"
+    next_event.refresh_from_db()
+    assert next_event.status == "pending"
+    assert next_event.attempts == 0
+    assert next_event.next_attempt_at == event.next_attempt_at
+    webhook.refresh_from_db()
+    assert webhook.status == "pending"
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        with freeze_time("2025-01-01 10:00:30"):
+            assert drain_webhook_events() is None
+
+        # Events are delivered in order
+        assert [
+            json.loads(call.request.body)["Operations"][0]["value"][0]["value"]
+            for call in rsps.calls
+        ] == [event.operations[0]["user_id"], next_event.operations[0]["user_id"]]
+
+    assert set(models.WebhookEvent.objects.values_list("status", flat=True)) == {
+        "delivered"
+    }
+    webhook.refresh_from_db()
+    assert webhook.status == "success"
+
+
+def test_tasks_webhook_events_dead_letter_failure():
+    """An event failing for good should become a dead letter without blocking the next ones."""
+    webhook = factories.TeamWebhookFactory()
+    event, next_event = factories.WebhookEventFactory.create_batch(2, webhook=webhook)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=404)
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        assert drain_webhook_events() is None
+        assert len(rsps.calls) == 2
+
+    event.refresh_from_db()
+    assert event.status == "dead"
+    assert event.attempts == 1
+    next_event.refresh_from_db()
+    assert next_event.status == "delivered"
+
+
+def test_tasks_webhook_events_dead_letter_max_retries(settings):
+    """An event should become a dead letter once its retries are exhausted."""
+    settings.WEBHOOKS_MAX_RETRIES = 1
+    settings.WEBHOOKS_RETRY_DELAY = 0
+    event = factories.WebhookEventFactory()
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, event.webhook.url, body=requests.ConnectionError())
+
+        drain_webhook_events()
+        assert len(rsps.calls) == 2
+
+    event.refresh_from_db()
+    assert event.status == "dead"
+    assert event.attempts == 2
+    event.webhook.refresh_from_db()
+    assert event.webhook.status == "failure"
+
+
+def test_tasks_webhook_events_batch_size():
+    """Each batch should deliver the events of a limited number of webhooks."""
+    factories.WebhookEventFactory.create_batch(3)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        assert deliver_webhook_events_batch(2)[0] == 2
+        assert deliver_webhook_events_batch(2)[0] == 1
+        assert deliver_webhook_events_batch(2)[0] == 0
+        assert len(rsps.calls) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tasks_webhook_events_skip_locked():
+    """Webhooks claimed by a worker should be skipped by the others."""
+    locked_event, event = factories.WebhookEventFactory.create_batch(2)
+    claimed = threading.Event()
+    release = threading.Event()
+
+    def other_worker():
+        with transaction.atomic():
+            models.TeamWebhook.objects.select_for_update(no_key=True).get(
+                pk=locked_event.webhook_id
+            )
+            claimed.set()
+            release.wait(5)
+        connection.close()
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    claimed.wait(5)
+    try:
+        with responses.RequestsMock() as rsps:
+            rsps.add(rsps.PATCH, event.webhook.url, status=200)
+
+            assert deliver_webhook_events_batch(10)[0] == 1
+    finally:
+        release.set()
+        thread.join()
+
+    locked_event.refresh_from_db()
+    assert locked_event.status == "pending"
+    event.refresh_from_db()
+    assert event.status == "delivered"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tasks_webhook_events_delivered_outside_transaction():
+    """
+    Webhooks should be called outside any transaction, their events being leased so
+    that another worker does not deliver them meanwhile.
+    """
+    event = factories.WebhookEventFactory()
+    calls = []
+
+    def callback(_request):
+        calls.append(connection.in_atomic_block)
+        # Another worker finds nothing to deliver
+        assert deliver_webhook_events_batch(10) == (0, None)
+        return (200, {}, "")
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(rsps.PATCH, event.webhook.url, callback=callback)
+
+        assert deliver_webhook_events_batch(10) == (1, None)
+
+    assert calls == [False]
+    event.refresh_from_db()
+    assert event.status == "delivered"
+
+
+def test_tasks_webhook_events_lease_expired(settings):
+    """The events of a worker lost while delivering them should be delivered again."""
+    settings.WEBHOOKS_LEASE_DURATION = 300
+    with freeze_time("2025-01-01 09:59:59"):
+        event = factories.WebhookEventFactory()
+
+    with (
+        freeze_time("2025-01-01 10:00:00"),
+        mock.patch("core.tasks.call_webhooks", side_effect=SystemExit),
+        pytest.raises(SystemExit),
+    ):
+        deliver_webhook_events_batch(10)
+
+    event.refresh_from_db()
+    assert event.status == "pending"
+    assert event.next_attempt_at.isoformat() == "2025-01-01T10:05:00+00:00"
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, event.webhook.url, status=200)
+
+        with freeze_time("2025-01-01 10:04:59"):
+            assert deliver_webhook_events_batch(10) == (0, None)
+        with freeze_time("2025-01-01 10:05:00"):
+            assert deliver_webhook_events_batch(10) == (1, None)
+
+    event.refresh_from_db()
+    assert event.status == "delivered"
+    assert event.attempts == 1
+
+
+def test_tasks_webhook_events_beat_schedule(settings):
+    """Pending events should be delivered periodically, in case a delivery was lost."""
+    assert settings.CELERY_BEAT_SCHEDULE["deliver-webhook-events"] == {
+        "task": "core.tasks.deliver_webhook_events",
+        "schedule": settings.WEBHOOKS_DELIVERY_SCHEDULE,
+        "kwargs": {"schedule_retries": False},
+    }
+
+
+def test_tasks_webhook_events_periodic_delivery():
+    """
+    A periodic delivery should deliver the events whose scheduled delivery was lost,
+    without scheduling retries.
+    """
+    delivered, retried = factories.WebhookEventFactory.create_batch(2)
+
+    with (
+        responses.RequestsMock() as rsps,
+        mock.patch.object(deliver_webhook_events, "apply_async") as apply_async_mock,
+    ):
+        rsps.add(rsps.PATCH, delivered.webhook.url, status=200)
+        rsps.add(rsps.PATCH, retried.webhook.url, body=requests.ConnectionError())
+
+        deliver_webhook_events.apply(kwargs={"schedule_retries": False})
+
+        apply_async_mock.assert_not_called()
+
+    delivered.refresh_from_db()
+    assert delivered.status == "delivered"
+    retried.refresh_from_db()
+    assert retried.status == "pending"
+    assert retried.attempts == 1
+
+
+def test_tasks_webhook_events_per_claim(settings):
+    """A worker should deliver a limited number of events of a webhook at a time."""
+    settings.WEBHOOKS_EVENTS_PER_CLAIM = 2
+    webhook = factories.TeamWebhookFactory()
+    events = factories.WebhookEventFactory.create_batch(3, webhook=webhook)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        assert deliver_webhook_events_batch(10)[0] == 1
+        assert len(rsps.calls) == 2
+        assert models.WebhookEvent.objects.filter(status="pending").get() == events[2]
+
+        assert deliver_webhook_events_batch(10)[0] == 1
+        assert len(rsps.calls) == 3
+
+        assert [
+            json.loads(call.request.body)["Operations"][0]["value"][0]["value"]
+            for call in rsps.calls
+        ] == [event.operations[0]["user_id"] for event in events]
+
+
+def test_tasks_webhook_events_lease_expiring(settings):
+    """
+    A worker should stop delivering events when their lease would expire before a
+    call ends, leaving them to the next delivery instead of another worker.
+    """
+    settings.WEBHOOKS_LEASE_DURATION = 300
+    webhook = factories.TeamWebhookFactory()
+    with freeze_time("2025-01-01 09:59:57"):
+        delivered = factories.WebhookEventFactory(webhook=webhook)
+    with freeze_time("2025-01-01 09:59:58"):
+        postponed = factories.WebhookEventFactory(webhook=webhook)
+
+    with freeze_time("2025-01-01 10:00:00") as frozen_time:
+
+        def slow_callback(_request):
+            # The call takes most of the lease
+            frozen_time.tick(timedelta(seconds=280))
+            return (200, {}, "")
+
+        with responses.RequestsMock() as rsps:
+            rsps.add_callback(rsps.PATCH, webhook.url, callback=slow_callback)
+
+            assert deliver_webhook_events_batch(10) == (1, None)
+            assert len(rsps.calls) == 1
+
+    delivered.refresh_from_db()
+    assert delivered.status == "delivered"
+    postponed.refresh_from_db()
+    assert postponed.status == "pending"
+    assert postponed.attempts == 0
+    # The event is released to be delivered right away, its lease being over
+    assert postponed.next_attempt_at.isoformat() == "2025-01-01T10:04:40+00:00"
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        with freeze_time("2025-01-01 10:04:40"):
+            assert deliver_webhook_events_batch(10) == (1, None)
+
+    postponed.refresh_from_db()
+    assert postponed.status == "delivered"
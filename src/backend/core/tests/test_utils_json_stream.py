@@ -0,0 +1,54 @@
+"""Test the helpers reading JSON documents incrementally"""
+
+import json
+
+import pytest
+
+from core.utils.json_stream import iter_json_array
+
+
+def chunked(text, size):
+    """Split a text in chunks of the given size."""
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_utils_iter_json_array(size):
+    """Items should be the same whatever the size of the chunks."""
+    items = [
+        {"email": "john.doe@example.com", "tags": ["a", "]", ","]},
+        12345,
+        -1.5e3,
+        'a "string" [with] {brackets}',
+        None,
+        True,
+        [],
+    ]
+    document = json.dumps(items, indent=2)
+
+    assert list(iter_json_array(chunked(document, size))) == items
+
+
+@pytest.mark.parametrize("document", ["[]", " [ ] ", "[\n]"])
+def test_utils_iter_json_array_empty(document):
+    """An empty array should yield nothing."""
+    assert not list(iter_json_array(chunked(document, 1)))
+
+
+def test_utils_iter_json_array_lazy():
+    """Items should be yielded as soon as they are complete."""
+    chunks = iter(['[{"a": 1}, {"b"', ": 2}", "]"])
+    items = iter_json_array(chunks)
+
+    assert next(items) == {"a": 1}
+    assert next(chunks) == ": 2}"
+
+
+@pytest.mark.parametrize(
+    "document",
+    ["", "{}", '["a" "b"]', '["a",]', "[1, 2", '["a"] "b"', "[nope]"],
+)
+def test_utils_iter_json_array_invalid(document):
+    """Invalid arrays should raise a decoding error."""
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(chunked(document, 2)))
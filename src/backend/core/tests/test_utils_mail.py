@@ -0,0 +1,72 @@
+"""Test the rendering of emails."""
+
+import os
+from unittest import mock
+
+from django.contrib.staticfiles import finders
+from django.utils.translation import override
+
+import pytest
+
+from core.templatetags import extra_tags
+from core.utils import mail as mail_utils
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start each test with nothing rendered yet."""
+    extra_tags.static_image_to_base64.cache_clear()
+    mail_utils.clear_static_emails()
+    yield
+    extra_tags.static_image_to_base64.cache_clear()
+    mail_utils.clear_static_emails()
+
+
+def test_utils_mail_base64_static_memoized():
+    """Static images should be encoded again only when they change."""
+    path = finders.find("images/logo.png")
+    stat = os.stat(path)
+
+    with mock.patch.object(
+        extra_tags, "image_to_base64", wraps=extra_tags.image_to_base64
+    ) as encode_mock:
+        encoded = extra_tags.base64_static("images/logo.png")
+        assert encoded.startswith("data:image/png;base64, ")
+        assert extra_tags.base64_static("images/logo.png") == encoded
+        assert encode_mock.call_count == 1
+
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        try:
+            assert extra_tags.base64_static("images/logo.png") == encoded
+        finally:
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert encode_mock.call_count == 2
+
+    assert extra_tags.base64_static("images/missing.png") == ""
+
+
+def test_utils_mail_render_static_email_cached():
+    """Static emails should be rendered once per language."""
+    with mock.patch.object(
+        mail_utils, "render_email", wraps=mail_utils.render_email
+    ) as render_mock:
+        with override("en-us"):
+            html, plain = mail_utils.render_static_email(
+                "invitation", title="Invitation"
+            )
+            assert mail_utils.render_static_email("invitation", title="Invitation") == (
+                html,
+                plain,
+            )
+        assert render_mock.call_count == 1
+        assert "Invitation" in plain
+        assert "//example.com" in html
+
+        with override("fr-fr"):
+            french_html, _plain = mail_utils.render_static_email(
+                "invitation", title="Invitation"
+            )
+        assert render_mock.call_count == 2
+        assert french_html != html
@@ -2,18 +2,20 @@
 
 from django.db.models.expressions import RawSQL
 
-from core.models import Contact
-from core.utils.raw_sql import gen_sql_filter_json_array
+from core.models import Team, TeamAccess
+from core.utils.raw_sql import gen_sql_team_ancestors_paths
 
 
-def test_gen_sql_filter_json_array():
-    """Test the generation of a raw SQL query to filter on a JSON array."""
-    raw_sql = gen_sql_filter_json_array(Contact, "data->'emails'", "value", "blah")
+def test_gen_sql_team_ancestors_paths():
+    """Test the generation of a raw SQL query selecting a user's teams ancestors."""
+    raw_sql = gen_sql_team_ancestors_paths(Team, TeamAccess, "user-id")
 
     assert isinstance(raw_sql, RawSQL)
     assert raw_sql.sql == (
-        "SELECT people_contact.id FROM people_contact, "
-        "jsonb_array_elements(data->'emails') AS temp_filter_table WHERE "
-        "unaccent(temp_filter_table->>'value') ILIKE  unaccent(%s)"
+        "SELECT substr(team.path, 1, %s * ancestor.depth) "
+        "FROM people_team_access AS access "
+        "JOIN people_team AS team ON team.id = access.team_id "
+        "CROSS JOIN generate_series(1, team.depth - 1) AS ancestor(depth) "
+        "WHERE access.user_id = %s"
     )
-    assert raw_sql.params == ["%blah%"]
+    assert raw_sql.params == [5, "user-id"]
@@ -0,0 +1,47 @@
+"""Unit tests for the search helpers"""
+
+import pytest
+
+from core import factories, models
+from core.utils.search import search_filter
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize("query", ["héloïse", "HELOISE", "éloï", "lois"])
+def test_utils_search_filter_case_and_accent_insensitive(query):
+    """The search should ignore case and accents on both the query and the fields."""
+    user = factories.UserFactory(name="Héloïse Dupont", email="hd@example.com")
+    factories.UserFactory(name="Jean Martin", email="jm@example.com")
+
+    assert list(models.User.objects.filter(search_filter(query, "name"))) == [user]
+
+
+def test_utils_search_filter_any_field():
+    """Objects matching the query on any of the given fields should be returned."""
+    user1 = factories.UserFactory(name="Jean Martin", email="jm@example.com")
+    user2 = factories.UserFactory(name="Marie Curie", email="jean@example.com")
+    factories.UserFactory(name="Pierre Curie", email="pc@example.com")
+
+    queryset = models.User.objects.filter(search_filter("jean", "name", "email"))
+
+    assert set(queryset) == {user1, user2}
+
+
+def test_utils_search_filter_related_fields():
+    """Related fields lookups should be supported."""
+    access = factories.TeamAccessFactory(user__name="Émile Zola")
+    factories.TeamAccessFactory(user__name="Victor Hugo")
+
+    queryset = models.TeamAccess.objects.filter(search_filter("emile", "user__name"))
+
+    assert list(queryset) == [access]
+
+
+def test_utils_search_filter_uses_immutable_unaccent():
+    """The lookup should go through the indexed `immutable_unaccent` function."""
+    queryset = models.User.objects.filter(search_filter("jean", "name"))
+
+    assert 'UPPER(immutable_unaccent("people_user"."name")::text) LIKE' in str(
+        queryset.query
+    )
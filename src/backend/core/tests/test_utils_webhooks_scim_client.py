@@ -3,10 +3,14 @@
 import json
 import random
 import re
+import time
 from logging import Logger
 from unittest import mock
 
+from django.db import transaction
+
 import pytest
+import requests
 import responses
 
 from core import factories
@@ -15,22 +19,28 @@ from core.utils.webhooks import scim_synchronizer
 pytestmark = pytest.mark.django_db
 
 
-def test_utils_webhooks_add_user_to_group_no_webhooks():
+def test_utils_webhooks_add_user_to_group_no_webhooks(
+    django_capture_on_commit_callbacks,
+):
     """If no webhook is declared on the team, the function should not make any request."""
-    access = factories.TeamAccessFactory()
+    team = factories.TeamFactory()
+    user = factories.UserFactory()
 
     with responses.RequestsMock():
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
 
     assert len(responses.calls) == 0
 
 
 @mock.patch.object(Logger, "info")
-def test_utils_webhooks_add_user_to_group_success(mock_info):
+def test_utils_webhooks_add_user_to_group_success(
+    mock_info, django_capture_on_commit_callbacks
+):
     """The user passed to the function should get added."""
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhooks = factories.TeamWebhookFactory.create_batch(2, team=access.team)
+    team = factories.TeamFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
 
     with responses.RequestsMock() as rsps:
         # Ensure successful response by scim provider using "responses":
@@ -42,13 +52,17 @@ def test_utils_webhooks_add_user_to_group_success(mock_info):
             content_type="application/json",
         )
 
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
 
-        for i, webhook in enumerate(webhooks):
-            assert rsps.calls[i].request.url == webhook.url
+        # Webhooks are called concurrently
+        assert {call.request.url for call in rsps.calls} == {
+            webhook.url for webhook in webhooks
+        }
 
-            # Check headers
-            headers = rsps.calls[i].request.headers
+        # Check headers
+        for call in rsps.calls:
+            headers = call.request.headers
             assert "Authorization" not in headers
             assert headers["Content-Type"] == "application/json"
 
@@ -63,7 +77,7 @@ def test_utils_webhooks_add_user_to_group_success(mock_info):
                         "path": "members",
                         "value": [
                             {
-                                "value": str(access.user.id),
+                                "value": str(user.id),
                                 "email": user.email,
                                 "type": "User",
                             }
@@ -74,12 +88,10 @@ def test_utils_webhooks_add_user_to_group_success(mock_info):
 
     # Logger
     assert mock_info.call_count == 2
-    for i, webhook in enumerate(webhooks):
-        assert mock_info.call_args_list[i][0] == (
-            "%s synchronization succeeded with %s",
-            "add_user_to_group",
-            webhook.url,
-        )
+    assert sorted(call[0] for call in mock_info.call_args_list) == sorted(
+        ("Members synchronization succeeded with %s", webhook.url)
+        for webhook in webhooks
+    )
 
     # Status
     for webhook in webhooks:
@@ -88,11 +100,13 @@ def test_utils_webhooks_add_user_to_group_success(mock_info):
 
 
 @mock.patch.object(Logger, "info")
-def test_utils_webhooks_remove_user_from_group_success(mock_info):
+def test_utils_webhooks_remove_user_from_group_success(
+    mock_info, django_capture_on_commit_callbacks
+):
     """The user passed to the function should get removed."""
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhooks = factories.TeamWebhookFactory.create_batch(2, team=access.team)
+    team = factories.TeamFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
 
     with responses.RequestsMock() as rsps:
         # Ensure successful response by scim provider using "responses":
@@ -104,10 +118,12 @@ def test_utils_webhooks_remove_user_from_group_success(mock_info):
             content_type="application/json",
         )
 
-        scim_synchronizer.remove_user_from_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.remove_user_from_group(team, user)
 
-        for i, webhook in enumerate(webhooks):
-            assert rsps.calls[i].request.url == webhook.url
+        assert {call.request.url for call in rsps.calls} == {
+            webhook.url for webhook in webhooks
+        }
 
         # Payload sent to scim provider
         for call in rsps.calls:
@@ -120,7 +136,7 @@ def test_utils_webhooks_remove_user_from_group_success(mock_info):
                         "path": "members",
                         "value": [
                             {
-                                "value": str(access.user.id),
+                                "value": str(user.id),
                                 "email": user.email,
                                 "type": "User",
                             }
@@ -131,12 +147,10 @@ def test_utils_webhooks_remove_user_from_group_success(mock_info):
 
     # Logger
     assert mock_info.call_count == 2
-    for i, webhook in enumerate(webhooks):
-        assert mock_info.call_args_list[i][0] == (
-            "%s synchronization succeeded with %s",
-            "remove_user_from_group",
-            webhook.url,
-        )
+    assert sorted(call[0] for call in mock_info.call_args_list) == sorted(
+        ("Members synchronization succeeded with %s", webhook.url)
+        for webhook in webhooks
+    )
 
     # Status
     for webhook in webhooks:
@@ -146,11 +160,13 @@ def test_utils_webhooks_remove_user_from_group_success(mock_info):
 
 @mock.patch.object(Logger, "error")
 @mock.patch.object(Logger, "info")
-def test_utils_webhooks_add_user_to_group_failure(mock_info, mock_error):
+def test_utils_webhooks_add_user_to_group_failure(
+    mock_info, mock_error, django_capture_on_commit_callbacks
+):
     """The logger should be called on webhook call failure."""
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhooks = factories.TeamWebhookFactory.create_batch(2, team=access.team)
+    team = factories.TeamFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
 
     with responses.RequestsMock() as rsps:
         # Simulate webhook failure using "responses":
@@ -162,10 +178,12 @@ def test_utils_webhooks_add_user_to_group_failure(mock_info, mock_error):
             content_type="application/json",
         )
 
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
 
-        for i, webhook in enumerate(webhooks):
-            assert rsps.calls[i].request.url == webhook.url
+        assert {call.request.url for call in rsps.calls} == {
+            webhook.url for webhook in webhooks
+        }
 
         # Payload sent to scim provider
         for call in rsps.calls:
@@ -178,7 +196,7 @@ def test_utils_webhooks_add_user_to_group_failure(mock_info, mock_error):
                         "path": "members",
                         "value": [
                             {
-                                "value": str(access.user.id),
+                                "value": str(user.id),
                                 "email": user.email,
                                 "type": "User",
                             }
@@ -190,12 +208,9 @@ def test_utils_webhooks_add_user_to_group_failure(mock_info, mock_error):
     # Logger
     assert not mock_info.called
     assert mock_error.call_count == 2
-    for i, webhook in enumerate(webhooks):
-        assert mock_error.call_args_list[i][0] == (
-            "%s synchronization failed with %s",
-            "add_user_to_group",
-            webhook.url,
-        )
+    assert sorted(call[0] for call in mock_error.call_args_list) == sorted(
+        ("Members synchronization failed with %s", webhook.url) for webhook in webhooks
+    )
 
     # Status
     for webhook in webhooks:
@@ -205,11 +220,13 @@ def test_utils_webhooks_add_user_to_group_failure(mock_info, mock_error):
 
 @mock.patch.object(Logger, "error")
 @mock.patch.object(Logger, "info")
-def test_utils_webhooks_add_user_to_group_retries(mock_info, mock_error):
+def test_utils_webhooks_add_user_to_group_retries(
+    mock_info, mock_error, django_capture_on_commit_callbacks
+):
     """webhooks synchronization supports retries."""
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhook = factories.TeamWebhookFactory(team=access.team)
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team)
 
     url = re.compile(r".*/Groups/.*")
     with responses.RequestsMock() as rsps:
@@ -221,7 +238,8 @@ def test_utils_webhooks_add_user_to_group_retries(mock_info, mock_error):
             rsps.add(rsps.PATCH, url, status=200, content_type="application/json"),
         ]
 
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
 
         for i in range(4):
             assert all_rsps[i].call_count == 1
@@ -235,7 +253,7 @@ def test_utils_webhooks_add_user_to_group_retries(mock_info, mock_error):
                         "path": "members",
                         "value": [
                             {
-                                "value": str(access.user.id),
+                                "value": str(user.id),
                                 "email": user.email,
                                 "type": "User",
                             }
@@ -248,8 +266,7 @@ def test_utils_webhooks_add_user_to_group_retries(mock_info, mock_error):
     assert not mock_error.called
     assert mock_info.call_count == 1
     assert mock_info.call_args_list[0][0] == (
-        "%s synchronization succeeded with %s",
-        "add_user_to_group",
+        "Members synchronization succeeded with %s",
         webhook.url,
     )
 
@@ -260,11 +277,19 @@ def test_utils_webhooks_add_user_to_group_retries(mock_info, mock_error):
 
 @mock.patch.object(Logger, "error")
 @mock.patch.object(Logger, "info")
-def test_utils_synchronize_course_runs_max_retries_exceeded(mock_info, mock_error):
-    """Webhooks synchronization has exceeded max retries and should get logged."""
+def test_utils_synchronize_course_runs_max_retries_exceeded(
+    mock_info, mock_error, django_capture_on_commit_callbacks, settings
+):
+    """
+    Webhooks synchronization has exceeded max retries and should get logged,
+    each task retry making its own HTTP retries.
+    """
+    settings.WEBHOOKS_MAX_RETRIES = 2
+    # Retry events right away instead of waiting for a new task
+    settings.WEBHOOKS_RETRY_DELAY = 0
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhook = factories.TeamWebhookFactory(team=access.team)
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team)
 
     with responses.RequestsMock() as rsps:
         # Simulate webhook temporary failure using "responses":
@@ -276,9 +301,10 @@ def test_utils_synchronize_course_runs_max_retries_exceeded(mock_info, mock_erro
             content_type="application/json",
         )
 
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
 
-        assert rsp.call_count == 5
+        assert rsp.call_count == 15
         assert rsps.calls[0].request.url == webhook.url
         payload = json.loads(rsps.calls[0].request.body)
         assert payload == {
@@ -289,7 +315,7 @@ def test_utils_synchronize_course_runs_max_retries_exceeded(mock_info, mock_erro
                     "path": "members",
                     "value": [
                         {
-                            "value": str(access.user.id),
+                            "value": str(user.id),
                             "email": user.email,
                             "type": "User",
                         }
@@ -299,24 +325,27 @@ def test_utils_synchronize_course_runs_max_retries_exceeded(mock_info, mock_erro
         }
 
     # Logger
-    assert not mock_info.called
-    assert mock_error.call_count == 1
-    assert mock_error.call_args_list[0][0] == (
-        "%s synchronization failed due to max retries exceeded with url %s",
-        "add_user_to_group",
-        webhook.url,
-    )
+    # Only Celery logs the retries of the task
+    assert all("retry" in call[0][0] for call in mock_info.call_args_list)
+    assert mock_error.call_count == 3
+    for call_args in mock_error.call_args_list:
+        assert call_args[0] == (
+            "Members synchronization failed due to max retries exceeded with url %s",
+            webhook.url,
+        )
 
     # Status
     webhook.refresh_from_db()
     assert webhook.status == "failure"
 
 
-def test_utils_webhooks_add_user_to_group_authorization():
+def test_utils_webhooks_add_user_to_group_authorization(
+    django_capture_on_commit_callbacks,
+):
     """Secret token should be passed in authorization header when set."""
     user = factories.UserFactory()
-    access = factories.TeamAccessFactory(user=user)
-    webhook = factories.TeamWebhookFactory(team=access.team, secret="123")
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team, secret="123")
 
     with responses.RequestsMock() as rsps:
         # Ensure successful response by scim provider using "responses":
@@ -328,7 +357,8 @@ def test_utils_webhooks_add_user_to_group_authorization():
             content_type="application/json",
         )
 
-        scim_synchronizer.add_user_to_group(access.team, access.user)
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
         assert rsps.calls[0].request.url == webhook.url
 
         # Check headers
@@ -339,3 +369,278 @@ def test_utils_webhooks_add_user_to_group_authorization():
     # Status
     webhook.refresh_from_db()
     assert webhook.status == "success"
+
+
+@mock.patch.object(Logger, "error")
+@mock.patch.object(Logger, "info")
+def test_utils_webhooks_add_user_to_group_task_retries(
+    mock_info, mock_error, django_capture_on_commit_callbacks, settings
+):
+    """Webhook calls failing on a connection error should be retried later."""
+    settings.WEBHOOKS_RETRY_DELAY = 0
+    user = factories.UserFactory()
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team)
+
+    url = re.compile(r".*/Groups/.*")
+    with responses.RequestsMock() as rsps:
+        # Make webhook fail on connection twice before succeeding
+        rsps.add(rsps.PATCH, url, body=requests.ConnectionError())
+        rsps.add(rsps.PATCH, url, body=requests.ConnectionError())
+        rsps.add(rsps.PATCH, url, status=200, content_type="application/json")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
+
+        assert len(rsps.calls) == 3
+
+    # Logger
+    assert mock_error.call_count == 2
+    assert mock_info.call_args_list[-1][0] == (
+        "Members synchronization succeeded with %s",
+        webhook.url,
+    )
+
+    # Status
+    webhook.refresh_from_db()
+    assert webhook.status == "success"
+
+
+def test_utils_webhooks_add_user_to_group_on_commit(
+    django_capture_on_commit_callbacks,
+):
+    """Webhooks should not be called before the transaction is committed."""
+    team = factories.TeamFactory()
+    user = factories.UserFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
+
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            scim_synchronizer.add_user_to_group(team, user)
+
+        assert len(callbacks) == 1
+        assert len(rsps.calls) == 0
+
+    for webhook in webhooks:
+        webhook.refresh_from_db()
+        assert webhook.status == "pending"
+
+
+def test_utils_webhooks_add_user_to_group_concurrent(
+    django_capture_on_commit_callbacks,
+):
+    """
+    Webhooks of a team should be called concurrently: synchronizing takes about as
+    long as the slowest webhook, not the sum of all of them.
+    """
+    team = factories.TeamFactory()
+    user = factories.UserFactory()
+    webhooks = factories.TeamWebhookFactory.create_batch(5, team=team)
+
+    def slow_callback(_request):
+        time.sleep(0.2)
+        return (200, {}, "{}")
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(rsps.PATCH, re.compile(r".*/Groups/.*"), slow_callback)
+
+        start = time.monotonic()
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
+        duration = time.monotonic() - start
+
+        assert len(rsps.calls) == 5
+
+    assert duration < 0.6
+
+    for webhook in webhooks:
+        webhook.refresh_from_db()
+        assert webhook.status == "success"
+
+
+def test_utils_webhooks_add_user_to_group_retry_failed_webhooks_only(
+    django_capture_on_commit_callbacks, settings
+):
+    """Only webhooks that may succeed later should be called again on retry."""
+    settings.WEBHOOKS_RETRY_DELAY = 0
+    team = factories.TeamFactory()
+    user = factories.UserFactory()
+    webhook_ok, webhook_retry, webhook_ko = factories.TeamWebhookFactory.create_batch(
+        3, team=team
+    )
+
+    with responses.RequestsMock() as rsps:
+        rsp_ok = rsps.add(rsps.PATCH, webhook_ok.url, status=200)
+        rsp_ko = rsps.add(rsps.PATCH, webhook_ko.url, status=404)
+        rsp_retry = rsps.add(
+            rsps.PATCH, webhook_retry.url, body=requests.ConnectionError()
+        )
+        rsps.add(rsps.PATCH, webhook_retry.url, status=200)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
+
+        assert rsp_ok.call_count == 1
+        assert rsp_ko.call_count == 1
+        assert rsp_retry.call_count == 1
+        assert len(rsps.calls) == 4
+
+    webhook_ok.refresh_from_db()
+    assert webhook_ok.status == "success"
+    webhook_ko.refresh_from_db()
+    assert webhook_ko.status == "failure"
+    webhook_retry.refresh_from_db()
+    assert webhook_retry.status == "success"
+
+
+def test_utils_webhooks_batch_operations_per_team(
+    django_capture_on_commit_callbacks,
+):
+    """
+    Membership changes made in a transaction should be sent to each webhook of
+    their team in a single request.
+    """
+    team, other_team = factories.TeamFactory.create_batch(2)
+    webhooks = factories.TeamWebhookFactory.create_batch(2, team=team)
+    other_webhook = factories.TeamWebhookFactory(team=other_team)
+    added_users = factories.UserFactory.create_batch(3)
+    removed_user = factories.UserFactory()
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, re.compile(r".*/Groups/.*"), status=200)
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            for user in added_users:
+                scim_synchronizer.add_user_to_group(team, user)
+            scim_synchronizer.remove_user_from_group(team, removed_user)
+            scim_synchronizer.add_user_to_group(other_team, removed_user)
+
+        assert len(callbacks) == 1
+        assert len(rsps.calls) == 3
+
+        payloads = {
+            call.request.url: json.loads(call.request.body) for call in rsps.calls
+        }
+
+    for webhook in webhooks:
+        assert payloads[webhook.url]["Operations"] == [
+            {
+                "op": "add",
+                "path": "members",
+                "value": [
+                    {"value": str(user.id), "email": user.email, "type": "User"}
+                    for user in added_users
+                ],
+            },
+            {
+                "op": "remove",
+                "path": "members",
+                "value": [
+                    {
+                        "value": str(removed_user.id),
+                        "email": removed_user.email,
+                        "type": "User",
+                    }
+                ],
+            },
+        ]
+    assert payloads[other_webhook.url]["Operations"] == [
+        {
+            "op": "add",
+            "path": "members",
+            "value": [
+                {
+                    "value": str(removed_user.id),
+                    "email": removed_user.email,
+                    "type": "User",
+                }
+            ],
+        }
+    ]
+
+
+def test_utils_webhooks_opposite_operations_cancel_out(
+    django_capture_on_commit_callbacks,
+):
+    """Adding then removing a user in the same transaction should call no webhook."""
+    team = factories.TeamFactory()
+    factories.TeamWebhookFactory(team=team)
+    user = factories.UserFactory()
+
+    with responses.RequestsMock():
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
+            scim_synchronizer.remove_user_from_group(team, user)
+
+    assert len(responses.calls) == 0
+
+
+def test_utils_webhooks_rollback(django_capture_on_commit_callbacks):
+    """Changes rolled back should not be sent with those of the next transaction."""
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team)
+    user, other_user = factories.UserFactory.create_batch(2)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        with pytest.raises(ZeroDivisionError):
+            with transaction.atomic():
+                scim_synchronizer.add_user_to_group(team, user)
+                raise ZeroDivisionError
+
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, other_user)
+
+        assert len(rsps.calls) == 1
+        payload = json.loads(rsps.calls[0].request.body)
+
+    assert payload["Operations"] == [
+        {
+            "op": "add",
+            "path": "members",
+            "value": [
+                {
+                    "value": str(other_user.id),
+                    "email": other_user.email,
+                    "type": "User",
+                }
+            ],
+        }
+    ]
+
+
+def test_utils_webhooks_savepoint_rollback(django_capture_on_commit_callbacks):
+    """
+    Changes rolled back with a savepoint should not be sent with the other changes
+    of the transaction.
+    """
+    team = factories.TeamFactory()
+    webhook = factories.TeamWebhookFactory(team=team)
+    user, rolled_back_user, other_user = factories.UserFactory.create_batch(3)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(rsps.PATCH, webhook.url, status=200)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            scim_synchronizer.add_user_to_group(team, user)
+            with pytest.raises(ZeroDivisionError), transaction.atomic():
+                scim_synchronizer.add_user_to_group(team, rolled_back_user)
+                raise ZeroDivisionError
+            scim_synchronizer.add_user_to_group(team, other_user)
+
+        assert len(rsps.calls) == 1
+        payload = json.loads(rsps.calls[0].request.body)
+
+    assert payload["Operations"] == [
+        {
+            "op": "add",
+            "path": "members",
+            "value": [
+                {"value": str(added.id), "email": added.email, "type": "User"}
+                for added in (user, other_user)
+            ],
+        }
+    ]
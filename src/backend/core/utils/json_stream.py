@@ -0,0 +1,81 @@
+"""Helpers to read large JSON documents without loading them in memory."""
+
+import json
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = tuple(_WHITESPACE + ",]")
+
+# Parser states
+_START, _FIRST_ITEM, _ITEM, _SEPARATOR, _END = range(5)
+
+# Punctuation expected in each state, and the state it leads to
+_TRANSITIONS = {
+    (_START, "["): _FIRST_ITEM,
+    (_FIRST_ITEM, "]"): _END,
+    (_SEPARATOR, ","): _ITEM,
+    (_SEPARATOR, "]"): _END,
+}
+
+_decoder = json.JSONDecoder()
+
+
+def _parse_items(buffer, state, final):
+    """
+    Parse the complete items of an array available in the buffer.
+
+    Return the items, the new state of the parser and the position up to which the
+    buffer was consumed.
+    """
+    items = []
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            break
+
+        char = buffer[position]
+        if state == _ITEM or (state == _FIRST_ITEM and char != "]"):
+            try:
+                item, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # the item is not complete yet
+            # A number may go on in the next chunk (e.g. "1" then ".5")
+            if not final and buffer[end : end + 1] not in _DELIMITERS:
+                break
+            items.append(item)
+            state, position = _SEPARATOR, end
+        else:
+            try:
+                state = _TRANSITIONS[state, char]
+            except KeyError:
+                raise json.JSONDecodeError(
+                    f"Unexpected character {char!r}", buffer, position
+                ) from None
+            position += 1
+
+    return items, state, position
+
+
+def iter_json_array(chunks):
+    """
+    Yield the items of a JSON array read from an iterable of text chunks, such as
+    an HTTP response body read incrementally.
+
+    Only the item being parsed is kept in memory. Raise `json.JSONDecodeError` if
+    the document is not a valid JSON array.
+    """
+    state = _START
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        items, state, position = _parse_items(buffer, state, final=False)
+        buffer = buffer[position:]
+        yield from items
+
+    items, state, position = _parse_items(buffer, state, final=True)
+    yield from items
+    if state != _END:
+        raise json.JSONDecodeError("Unterminated array", buffer, len(buffer))
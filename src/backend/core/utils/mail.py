@@ -0,0 +1,250 @@
+"""Render and send emails asynchronously, once the database transaction is committed"""
+
+import logging
+import smtplib
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.db import transaction
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils.autoreload import file_changed
+from django.utils.translation import get_language, override
+
+logger = logging.getLogger(__name__)
+
+
+def render_email(template_name, context):
+    """
+    Return the HTML and plain text bodies of an email, rendered from the templates
+    "mail/html/<template_name>.html" and "mail/text/<template_name>.txt".
+    """
+    return (
+        render_to_string(f"mail/html/{template_name}.html", context),
+        render_to_string(f"mail/text/{template_name}.txt", context),
+    )
+
+
+@lru_cache(maxsize=128)
+def _render_static_email(template_name, language, site_domain, site_name, context):
+    """Render an email once per template, language, site and context."""
+    site = Site(domain=site_domain, name=site_name)
+    with override(language):
+        return render_email(template_name, {"site": site, **dict(context)})
+
+
+def clear_static_emails():
+    """Forget the static emails rendered, to render them again."""
+    _render_static_email.cache_clear()
+
+
+@receiver(file_changed, dispatch_uid="reset_static_emails")
+def reset_static_emails(sender, file_path, **kwargs):  # pylint: disable=unused-argument
+    """Render emails again when their templates change in development."""
+    if file_path.suffix in {".html", ".txt"}:
+        clear_static_emails()
+
+
+def render_static_email(template_name, **context):
+    """
+    Render an email which is the same for all its recipients, as `render_email`
+    does with the current site in the context.
+
+    The bodies are cached per template, language and context in each process, as
+    bursts of such emails would otherwise render the same bodies again and again.
+    The context must only hold strings.
+    """
+    site = Site.objects.get_current()
+    return _render_static_email(
+        template_name,
+        get_language(),
+        site.domain,
+        site.name,
+        tuple(sorted((key, str(value)) for key, value in context.items())),
+    )
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def build_message(subject, message, from_email, recipient_list, html_message=None):
+    """
+    Return an email to send with `send_messages`, from the arguments of
+    `django.core.mail.send_mail`.
+    """
+    return {
+        # Lazy translations are resolved in the language of the caller
+        "subject": str(subject),
+        "body": message,
+        "from_email": from_email,
+        "to": list(recipient_list),
+        "html_message": html_message,
+    }
+
+
+def _is_temporary_error(error):
+    """Whether an email may be sent later despite this error of the mail relay."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _message in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Other SMTP errors are raised by the client itself, network errors may go away
+    return not isinstance(error, smtplib.SMTPException)
+
+
+def _build_email(message, connection):
+    """Build an email from a message returned by `build_message`."""
+    email = mail.EmailMultiAlternatives(
+        message["subject"],
+        message["body"],
+        message["from_email"],
+        message["to"],
+        connection=connection,
+    )
+    if message["html_message"]:
+        email.attach_alternative(message["html_message"], "text/html")
+    return email
+
+
+def send_messages(messages):
+    """
+    Send queued messages over a single connection to the mail relay.
+
+    Messages refused for good by the mail relay are logged and dropped. Return the
+    messages which failed but may be sent later: the ones refused for a temporary
+    reason, and the ones left when the connection failed.
+    """
+    pending = []
+
+    def fail(failed_messages, error):
+        if _is_temporary_error(error):
+            pending.extend(failed_messages)
+            return
+        for message in failed_messages:
+            logger.error(
+                "Email '%s' to %s was not sent: %s",
+                message["subject"],
+                ", ".join(message["to"]),
+                error,
+            )
+
+    connection = mail.get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except OSError as error:  # SMTP errors are OSError too
+        fail(messages, error)
+        return pending
+
+    try:
+        for index, message in enumerate(messages):
+            try:
+                connection.send_messages([_build_email(message, connection)])
+            except (
+                smtplib.SMTPRecipientsRefused,
+                smtplib.SMTPResponseException,
+            ) as error:
+                # The relay refused this message, the connection is still usable
+                fail([message], error)
+            except OSError as error:
+                fail(messages[index:], error)
+                break
+    finally:
+        try:
+            connection.close()
+        except OSError:
+            pass
+    return pending
+
+
+class MailOutbox:
+    """
+    Collect the emails sent during an atomic block, to send them once the transaction
+    is committed by batches, each sent by a worker over a single connection to the
+    mail relay.
+    """
+
+    def __init__(self):
+        """Start with no message."""
+        self.messages = []
+
+    def flush(self):
+        """Schedule tasks sending the messages by batches of EMAIL_BATCH_SIZE."""
+        # pylint: disable=import-outside-toplevel
+        from core.tasks import send_emails
+
+        batch_size = settings.EMAIL_BATCH_SIZE
+        for start in range(0, len(self.messages), batch_size):
+            send_emails.delay(self.messages[start : start + batch_size])
+
+
+class MailQueue:
+    """
+    Send emails through Celery workers instead of during the request.
+
+    Emails are sent once the transaction is committed, so that no email is sent
+    about changes rolled back. They go through the broker: emails holding secrets
+    must rather be sent from a worker with `send_messages`.
+    """
+
+    def __init__(self):
+        """Keep the outboxes of the current transaction per thread, as connections."""
+        self._local = threading.local()
+
+    @staticmethod
+    def _get_atomic_block_key():
+        """
+        Identify the current atomic block by the id of its transaction and the ids of
+        its savepoints, never reused, or return None out of any atomic block.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_current_xact_id()::text")
+            (transaction_id,) = cursor.fetchone()
+        return transaction_id, tuple(connection.savepoint_ids)
+
+    def get_outbox(self):
+        """
+        Return the outbox of the current atomic block, and whether it was just opened
+        and is still to be flushed on commit.
+
+        Each outbox is flushed by its own `on_commit` callback: the outbox of a
+        savepoint rolled back is discarded with it.
+        """
+        key = self._get_atomic_block_key()
+        outboxes = getattr(self._local, "outboxes", {})
+        if key is not None and key in outboxes:
+            return outboxes[key], False
+
+        outbox = MailOutbox()
+        if key is not None:
+            # The outboxes of previous transactions were flushed or discarded
+            self._local.outboxes = {
+                outbox_key: previous
+                for outbox_key, previous in outboxes.items()
+                if outbox_key[0] == key[0]
+            }
+            self._local.outboxes[key] = outbox
+        return outbox, True
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def send_mail(
+        self, subject, message, from_email, recipient_list, html_message=None
+    ):
+        """Queue an email, with the arguments of `django.core.mail.send_mail`."""
+        outbox, is_new = self.get_outbox()
+        outbox.messages.append(
+            build_message(
+                subject, message, from_email, recipient_list, html_message=html_message
+            )
+        )
+        if is_new:
+            # In autocommit mode, the outbox is flushed right away
+            transaction.on_commit(outbox.flush)
+
+
+mail_queue = MailQueue()
@@ -6,36 +6,33 @@ from django.db import models
 from django.db.models.expressions import RawSQL
 
 
-def gen_sql_filter_json_array(
-    model: Type[models.Model],
-    lookup_path: str,
-    nested_key: str,
-    lookup_value: str,
+def gen_sql_team_ancestors_paths(
+    team_model: Type[models.Model],
+    team_access_model: Type[models.Model],
+    user_id,
 ) -> RawSQL:
     """
-    Filter a queryset on a nested JSON key in an array field with
-    a case-insensitive and unaccent match.
+    Select the paths of all the ancestors of the teams a user has access to.
 
-    Highly inspired from
-    https://gist.github.com/TobeTek/df2e9783a64e431c228c513441eaa8df#file-utils-py
+    Teams are stored as a materialized path tree: the path of each ancestor is a
+    prefix of the team path, one step per depth level. Each team the user has
+    access to is joined with the series of its depth levels to produce these
+    prefixes, so that ancestors can be looked up on the unique index of the
+    team path instead of building one condition per team.
 
-    :param Type[models.Model] model: Your Django model to filter on
-    :param str lookup_path: The lookup path of the array field/key in
-           Postgres format e.g `data->"sub-key1"->"sub-key2"`
-    :param str nested_key: The name of the nested key to filter on
-    :param str lookup_value: The value to match/filter the queryset on
+    :param Type[models.Model] team_model: The team model, a treebeard MP_Node
+    :param Type[models.Model] team_access_model: The model linking users to teams
+    :param user_id: The ID of the user whose accesses are considered
     """
-    # Disabling S608 Possible SQL injection vector through string-based query construction
-    # because we are using Django's RawSQL with parameters.
-    # Disabling S611 Use of `RawSQL` can lead to SQL injection vulnerabilities
-    # for the same reason.
-
-    table_name = model._meta.db_table  # noqa: SLF001
+    team_table = team_model._meta.db_table  # noqa: SLF001
+    team_access_table = team_access_model._meta.db_table  # noqa: SLF001
 
     query = (
-        f"SELECT {table_name}.id FROM {table_name}, "  # noqa: S608
-        f"jsonb_array_elements({lookup_path}) AS temp_filter_table "
-        f"WHERE unaccent(temp_filter_table->>'{nested_key}') ILIKE  unaccent(%s)"
+        "SELECT substr(team.path, 1, %s * ancestor.depth) "  # noqa: S608
+        f"FROM {team_access_table} AS access "
+        f"JOIN {team_table} AS team ON team.id = access.team_id "
+        "CROSS JOIN generate_series(1, team.depth - 1) AS ancestor(depth) "
+        "WHERE access.user_id = %s"
     )
 
-    return RawSQL(sql=query, params=[f"%{lookup_value}%"])  # noqa: S611
+    return RawSQL(sql=query, params=[team_model.steplen, user_id])  # noqa: S611
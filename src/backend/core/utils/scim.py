@@ -2,18 +2,30 @@
 
 import logging
 
+from django.conf import settings
+
 import requests
 from urllib3.util import Retry
 
 logger = logging.getLogger(__name__)
 
+TIMEOUT = 3
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.1
+# Longest duration of a call, connecting and reading timing out on each attempt
+MAX_CALL_DURATION = (MAX_RETRIES + 1) * 2 * TIMEOUT + sum(
+    BACKOFF_FACTOR * 2**retry for retry in range(MAX_RETRIES)
+)
+
 adapter = requests.adapters.HTTPAdapter(
+    # Webhooks of a team may all be called at the same time on the same host
+    pool_maxsize=settings.WEBHOOKS_MAX_WORKERS,
     max_retries=Retry(
-        total=4,
-        backoff_factor=0.1,
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
         status_forcelist=[500, 502],
         allowed_methods=["PATCH"],
-    )
+    ),
 )
 
 session = requests.Session()
@@ -24,47 +36,40 @@ session.mount("https://", adapter)
 class SCIMClient:
     """A minimalist SCIM client for our needs."""
 
-    def add_user_to_group(self, webhook, user):
-        """Add a user to a group from its ID or email."""
-        payload = {
-            "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
-            "Operations": [
-                {
-                    "op": "add",
-                    "path": "members",
-                    "value": [
-                        {"value": str(user.id), "email": user.email, "type": "User"}
-                    ],
-                }
-            ],
-        }
+    def update_group_members(self, webhook, operations):
+        """
+        Add and remove members of a group in a single request.
 
-        return session.patch(
-            webhook.url,
-            json=payload,
-            headers=webhook.get_headers(),
-            verify=False,
-            timeout=3,
-        )
-
-    def remove_user_from_group(self, webhook, user):
-        """Remove a user from a group by its ID or email."""
+        :param list operations: Dicts with the "op" to apply ("add" or "remove") and
+               the "user_id" and "email" of the user it applies to
+        """
         payload = {
             "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
             "Operations": [
                 {
-                    "op": "remove",
+                    "op": op,
                     "path": "members",
-                    "value": [
-                        {"value": str(user.id), "email": user.email, "type": "User"}
-                    ],
+                    "value": values,
                 }
+                for op in ["add", "remove"]
+                if (
+                    values := [
+                        {
+                            "value": operation["user_id"],
+                            "email": operation["email"],
+                            "type": "User",
+                        }
+                        for operation in operations
+                        if operation["op"] == op
+                    ]
+                )
             ],
         }
+
         return session.patch(
             webhook.url,
             json=payload,
             headers=webhook.get_headers(),
             verify=False,
-            timeout=3,
+            timeout=TIMEOUT,
         )
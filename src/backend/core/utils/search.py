@@ -0,0 +1,52 @@
+"""Helpers to search text fields in a case and accent-insensitive way."""
+
+import operator
+from functools import reduce
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import CharField, Q, TextField, Transform
+from django.db.models.functions import Upper
+
+
+class ImmutableUnaccent(Transform):  # pylint: disable=abstract-method
+    """Remove accents with the `immutable_unaccent` SQL function.
+
+    PostgreSQL's `unaccent` function is only stable, so it cannot be used in an index.
+    `immutable_unaccent` wraps it with a fixed dictionary (see migration
+    `core.0011_immutable_unaccent_and_trigram_indexes`) so that lookups going through
+    this transform are served by the trigram indexes built with `trigram_search_index`.
+    """
+
+    bilateral = True
+    lookup_name = "immutable_unaccent"
+    function = "immutable_unaccent"
+
+
+CharField.register_lookup(ImmutableUnaccent)
+TextField.register_lookup(ImmutableUnaccent)
+
+
+def trigram_search_index(field_name, name):
+    """Build the GIN trigram index serving `search_filter` lookups on a field."""
+    return GinIndex(
+        OpClass(Upper(ImmutableUnaccent(field_name)), name="gin_trgm_ops"),
+        name=name,
+    )
+
+
+def search_filter(query, *field_names):
+    """
+    Build a filter matching objects for which any of the given fields contains
+    the query, ignoring case and accents.
+
+    :param str query: The text to search for
+    :param str field_names: The fields to search in, related fields lookups
+           (e.g `user__email`) are supported
+    """
+    return reduce(
+        operator.or_,
+        (
+            Q(**{f"{field_name}__immutable_unaccent__icontains": query})
+            for field_name in field_names
+        ),
+    )
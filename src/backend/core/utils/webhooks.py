@@ -1,75 +1,279 @@
-"""Fire webhooks with synchronous retries"""
+"""Fire webhooks asynchronously, once the database transaction is committed"""
 
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Func
+from django.utils import timezone
 
 import requests
+from kombu.exceptions import OperationalError
 
-from core.enums import WebhookStatusChoices
+from core.enums import WebhookEventStatusChoices, WebhookStatusChoices
 
-from .scim import SCIMClient
+from .scim import MAX_CALL_DURATION, SCIMClient
 
 logger = logging.getLogger(__name__)
 
 
+class WebhookRetryableError(Exception):
+    """The webhook call failed but may succeed if tried again later."""
+
+
+def call_webhook(webhook, operations):
+    """
+    Call a webhook to synchronize team memberships with a distant application.
+
+    Return True if the synchronization succeeded and False if it failed for good.
+    Raise WebhookRetryableError if it failed but may succeed later.
+    """
+    client = SCIMClient()
+    try:
+        response = client.update_group_members(webhook, operations)
+
+    except requests.exceptions.RetryError as exc:
+        logger.error(
+            "Members synchronization failed due to max retries exceeded with url %s",
+            webhook.url,
+            exc_info=exc,
+        )
+        raise WebhookRetryableError(webhook.url) from exc
+    except requests.exceptions.RequestException as exc:
+        logger.error(
+            "Members synchronization failed with %s.",
+            webhook.url,
+            exc_info=exc,
+        )
+        raise WebhookRetryableError(webhook.url) from exc
+
+    extra = {
+        "response": response.content,
+    }
+    # pylint: disable=no-member
+    if response.status_code == requests.codes.ok:
+        logger.info(
+            "Members synchronization succeeded with %s",
+            webhook.url,
+            extra=extra,
+        )
+        return True
+
+    logger.error(
+        "Members synchronization failed with %s",
+        webhook.url,
+        extra=extra,
+    )
+    if response.status_code >= 500:
+        raise WebhookRetryableError(webhook.url)
+    return False
+
+
+def call_webhook_events(webhook, events, deadline=None):
+    """
+    Deliver events to a webhook in order, stopping at the first one that may succeed
+    later: the next ones must not overtake it. No call is started past the deadline,
+    if any, so that calls end before it whatever they take.
+
+    Return a list of the events attempted with their status: success, failure or
+    pending if the call failed but may succeed if tried again later.
+    """
+    results = []
+    for event in events:
+        if (
+            deadline is not None
+            and timezone.now() + timedelta(seconds=MAX_CALL_DURATION) > deadline
+        ):
+            break
+        try:
+            synchronized = call_webhook(webhook, event.operations)
+        except WebhookRetryableError:
+            results.append((event, WebhookStatusChoices.PENDING))
+            break
+        results.append(
+            (
+                event,
+                WebhookStatusChoices.SUCCESS
+                if synchronized
+                else WebhookStatusChoices.FAILURE,
+            )
+        )
+    return results
+
+
+def call_webhooks(events_by_webhook, deadline=None):
+    """
+    Deliver events to webhooks concurrently, so that it takes about as long as the
+    slowest webhook, starting no call past the deadline if any.
+
+    Return a dict mapping each webhook to the events attempted with their status
+    (see `call_webhook_events`).
+    """
+    webhooks = list(events_by_webhook)
+    if len(webhooks) == 1:
+        return {
+            webhooks[0]: call_webhook_events(
+                webhooks[0], events_by_webhook[webhooks[0]], deadline
+            )
+        }
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(webhooks), settings.WEBHOOKS_MAX_WORKERS)
+    ) as executor:
+        return dict(
+            zip(
+                webhooks,
+                executor.map(
+                    call_webhook_events,
+                    webhooks,
+                    events_by_webhook.values(),
+                    [deadline] * len(webhooks),
+                ),
+                strict=True,
+            )
+        )
+
+
+class CurrentTransactionId(Func):  # pylint: disable=abstract-method
+    """
+    The id of the current top-level transaction, shared by all its savepoints and
+    never reused by another transaction.
+    """
+
+    template = "pg_current_xact_id()::text::bigint"
+    output_field = BigIntegerField()
+
+
+def merge_operations(operations, new_operations):
+    """
+    Merge membership operations, given as (op, user) pairs, with previous ones: the
+    last operation on a membership wins, adding then removing a user (or the other
+    way around) being a no-op.
+    """
+    memberships = {operation["user_id"]: operation for operation in operations}
+    for op, user in new_operations:
+        user_id = str(user.pk)
+        previous = memberships.pop(user_id, None)
+        if previous and previous["op"] != op:
+            continue
+        memberships[user_id] = {"op": op, "user_id": user_id, "email": user.email}
+    return list(memberships.values())
+
+
+def schedule_webhook_events_delivery():
+    """
+    Schedule a task delivering the webhook events recorded. If the broker is
+    unavailable, the events are left to the periodic delivery.
+    """
+    # pylint: disable=import-outside-toplevel
+    from core.tasks import deliver_webhook_events
+
+    try:
+        deliver_webhook_events.delay()
+    except OperationalError as error:
+        logger.error("Webhook events delivery could not be scheduled: %s", error)
+
+
 class WebhookSCIMClient:
-    """Wraps the SCIM client to record call results on webhooks."""
-
-    def __getattr__(self, name):
-        """Handle calls from webhooks to synchronize a team access with a distant application."""
-
-        def wrapper(team, user):
-            """
-            Wrap SCIMClient calls to handle retries, error handling and storing result in the
-            calling Webhook instance.
-            """
-            for webhook in team.webhooks.all():
-                if not webhook.url:
-                    continue
-
-                client = SCIMClient()
-                status = WebhookStatusChoices.FAILURE
-                try:
-                    response = getattr(client, name)(webhook, user)
-
-                except requests.exceptions.RetryError as exc:
-                    logger.error(
-                        "%s synchronization failed due to max retries exceeded with url %s",
-                        name,
-                        webhook.url,
-                        exc_info=exc,
-                    )
-                except requests.exceptions.RequestException as exc:
-                    logger.error(
-                        "%s synchronization failed with %s.",
-                        name,
-                        webhook.url,
-                        exc_info=exc,
-                    )
-                else:
-                    extra = {
-                        "response": response.content,
-                    }
-                    # pylint: disable=no-member
-                    if response.status_code == requests.codes.ok:
-                        logger.info(
-                            "%s synchronization succeeded with %s",
-                            name,
-                            webhook.url,
-                            extra=extra,
-                        )
-
-                        status = WebhookStatusChoices.SUCCESS
-                    else:
-                        logger.error(
-                            "%s synchronization failed with %s",
-                            name,
-                            webhook.url,
-                            extra=extra,
-                        )
-
-                webhook._meta.model.objects.filter(id=webhook.id).update(status=status)  # noqa
-
-        return wrapper
+    """
+    Record the membership changes of teams as events to deliver to their webhooks,
+    by Celery workers so that requests are not held while webhooks are called.
+
+    Events are written in the transaction of the membership changes, so that they are
+    delivered if and only if the changes are committed. The changes made to a team
+    during a transaction are coalesced in a single event per webhook, found by the
+    id of the transaction: the events written in a savepoint rolled back are rolled
+    back with it.
+    """
+
+    @staticmethod
+    def _get_webhooks(teams):
+        """Return the ids of the webhooks of each team, by team id."""
+        # pylint: disable=import-outside-toplevel
+        from core.models import TeamWebhook
+
+        webhooks = defaultdict(list)
+        for webhook_id, team_id in (
+            TeamWebhook.objects.filter(team__in=teams)
+            .exclude(url="")
+            .values_list("pk", "team_id")
+        ):
+            webhooks[team_id].append(webhook_id)
+        return webhooks
+
+    @staticmethod
+    def _get_transaction_events():
+        """Return the events recorded during the current transaction."""
+        # pylint: disable=import-outside-toplevel
+        from core.models import WebhookEvent
+
+        # Events cannot be attempted before their transaction is committed
+        return WebhookEvent.objects.filter(
+            transaction_id=CurrentTransactionId(),
+            status=WebhookEventStatusChoices.PENDING,
+            attempts=0,
+        )
+
+    def record_operations(self, operations):
+        """Record membership operations, given as (op, user) pairs by team."""
+        # pylint: disable=import-outside-toplevel
+        from core.models import WebhookEvent
+
+        webhooks = self._get_webhooks(list(operations))
+        if not webhooks:
+            return
+
+        teams = {
+            webhook_id: team_id
+            for team_id, webhook_ids in webhooks.items()
+            for webhook_id in webhook_ids
+        }
+        recorded = defaultdict(list)
+        for event in self._get_transaction_events().filter(webhook_id__in=list(teams)):
+            recorded[teams[event.webhook_id]].append(event)
+
+        events_to_create, events_to_update, events_to_delete = [], [], []
+        for team, team_operations in operations.items():
+            if team.pk not in webhooks:
+                continue
+            if team_events := recorded.get(team.pk):
+                # The events of a team recorded in a transaction hold the same operations
+                merged = merge_operations(team_events[0].operations, team_operations)
+                for event in team_events:
+                    event.operations = merged
+                    event.updated_at = timezone.now()
+                (events_to_update if merged else events_to_delete).extend(team_events)
+            elif merged := merge_operations([], team_operations):
+                events_to_create.extend(
+                    WebhookEvent(webhook_id=webhook_id, operations=merged)
+                    for webhook_id in webhooks[team.pk]
+                )
+
+        if events_to_update:
+            WebhookEvent.objects.bulk_update(
+                events_to_update, ["operations", "updated_at"]
+            )
+        if events_to_delete:
+            WebhookEvent.objects.filter(
+                pk__in=[event.pk for event in events_to_delete]
+            ).delete()
+        if events_to_create:
+            # The delivery is scheduled once per transaction, with its first events
+            is_first = not recorded and not self._get_transaction_events().exists()
+            WebhookEvent.objects.bulk_create(events_to_create)
+            if is_first:
+                transaction.on_commit(schedule_webhook_events_delivery)
+
+    def add_user_to_group(self, team, user):
+        """Add a user to the group of a team on its webhooks."""
+        self.record_operations({team: [("add", user)]})
+
+    def remove_user_from_group(self, team, user):
+        """Remove a user from the group of a team on its webhooks."""
+        self.record_operations({team: [("remove", user)]})
 
 
 scim_synchronizer = WebhookSCIMClient()
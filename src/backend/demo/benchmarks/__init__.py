@@ -0,0 +1,16 @@
+"""
+Benchmarks of performance sensitive code paths, run by the `benchmark` command.
+
+Each scenario is called with the output of the command, and the number of times
+each operation is run when it is given, scenarios defaulting to their own.
+"""
+
+from .emails import benchmark_email_rendering
+from .resource_server import benchmark_resource_server_authentication
+from .teams import benchmark_team_visibility
+
+SCENARIOS = {
+    "email_rendering": benchmark_email_rendering,
+    "resource_server_authentication": benchmark_resource_server_authentication,
+    "team_visibility": benchmark_team_visibility,
+}
@@ -0,0 +1,76 @@
+"""Benchmarks of the rendering of emails."""
+
+from itertools import count
+
+from django.contrib.sites.models import Site
+from django.template import engines
+from django.utils.translation import gettext_lazy as _
+from django.utils.translation import override
+
+from core.templatetags import extra_tags
+from core.utils import mail as mail_utils
+
+from .utils import measure, write_result
+
+LANGUAGE = "fr-fr"
+
+
+def _reset_caches():
+    """Forget compiled templates, encoded images and rendered emails."""
+    for loader in engines["django"].engine.template_loaders:
+        loader.reset()
+    extra_tags.static_image_to_base64.cache_clear()
+    mail_utils.clear_static_emails()
+
+
+def _render_invitation_uncached():
+    """Render an invitation as each of them used to be rendered."""
+    mail_utils.render_email(
+        "invitation",
+        {"title": _("Invitation to join Desk!"), "site": Site.objects.get_current()},
+    )
+
+
+def _render_invitation():
+    """Render an invitation, the same for all the users invited."""
+    mail_utils.render_static_email("invitation", title=_("Invitation to join Desk!"))
+
+
+def _render_new_mailbox(index):
+    """Render the information of a new mailbox, different for each mailbox."""
+    mail_utils.render_email(
+        "new_mailbox",
+        {
+            "title": _("Your new mailbox information"),
+            "site": Site.objects.get_current(),
+            "webmail_url": "https://webmail.example.com",
+            "mailbox_data": {
+                "email": f"user{index}@example.com",
+                "password": f"password{index}",
+            },
+        },
+    )
+
+
+def benchmark_email_rendering(stdout, iterations=1000):
+    """Measure how long rendering an invitation or a new mailbox email takes.
+
+    Emails rendered without any cache are compared with emails rendered with compiled
+    templates, memoized images and, for invitations, cached static emails.
+    """
+    indexes = count()
+
+    def render_new_mailbox():
+        _render_new_mailbox(next(indexes))
+
+    # Caches are reset before each uncached rendering, outside of its measure
+    renderings = {
+        "Invitation email, uncached": (_render_invitation_uncached, _reset_caches),
+        "Invitation email, cached": (_render_invitation, None),
+        "New mailbox email, uncached": (render_new_mailbox, _reset_caches),
+        "New mailbox email, cached": (render_new_mailbox, None),
+    }
+    with override(LANGUAGE):
+        for label, (render, setup) in renderings.items():
+            _reset_caches()
+            write_result(stdout, label, measure(render, iterations, setup))
@@ -0,0 +1,63 @@
+"""Benchmarks of the resource server authentication."""
+
+import base64
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.test import RequestFactory
+
+from core import factories
+from core.resource_server import authentication
+from core.resource_server.backend import (
+    ResourceServerBackend,
+    get_introspection_cache_key,
+)
+
+from .utils import measure, write_result
+
+ACCESS_TOKEN = "benchmark-access-token"  # noqa: S105
+
+
+def benchmark_resource_server_authentication(stdout, iterations=1000):
+    """Measure the per-request overhead of the resource server authentication.
+
+    The token introspection is cached beforehand, so no request is sent to the
+    authorization server: only the authentication machinery itself is measured,
+    with a backend built on every request or shared by all requests.
+    """
+    if not isinstance(
+        authentication.get_resource_server_backend(), ResourceServerBackend
+    ):
+        raise CommandError("The resource server is not configured.")
+
+    user = factories.UserFactory()
+    cache.set(
+        get_introspection_cache_key(ACCESS_TOKEN),
+        {"sub": user.sub, "aud": "benchmark"},
+        None,
+    )
+    # Service providers send base64 encoded tokens
+    bearer = base64.b64encode(ACCESS_TOKEN.encode()).decode()
+    request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {bearer}")
+
+    def authenticate():
+        authentication.ResourceServerAuthentication().authenticate(request)
+
+    def authenticate_with_new_backend():
+        authentication.get_resource_server_backend.cache_clear()
+        authenticate()
+
+    try:
+        write_result(
+            stdout,
+            "Authentication with a backend built per request",
+            measure(authenticate_with_new_backend, iterations),
+        )
+        write_result(
+            stdout,
+            "Authentication with a shared backend",
+            measure(authenticate, iterations),
+        )
+    finally:
+        cache.delete(get_introspection_cache_key(ACCESS_TOKEN))
+        authentication.get_resource_server_backend.cache_clear()
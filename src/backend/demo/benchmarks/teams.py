@@ -0,0 +1,86 @@
+"""Benchmarks of the team queries."""
+
+import operator
+from functools import reduce
+
+from django.db.models import Q
+
+from core import factories, models
+
+from .utils import measure, write_result
+
+MEMBERSHIPS = (1, 100, 1000)
+
+
+def _get_visible_teams_with_or_of_paths(user):
+    """Compute visible teams with one condition per team the user has access to.
+
+    This is how team visibility used to be computed, kept as a reference.
+    """
+    depth_path = models.Team.objects.filter(accesses__user=user).values("depth", "path")
+
+    if not depth_path:
+        return models.Team.objects.none()
+
+    return models.Team.objects.filter(
+        reduce(
+            operator.or_,
+            (
+                Q(depth=d["depth"], path=d["path"])
+                | Q(
+                    depth__lt=d["depth"],
+                    path__startswith=d["path"][: models.Team.steplen],
+                    organization_id=user.organization_id,
+                )
+                for d in depth_path
+            ),
+        )
+    )
+
+
+def _create_user_with_memberships(organization, memberships):
+    """Create a user with access to as many child teams, each with its own parent."""
+    user = factories.UserFactory(organization=organization)
+    teams_ids = models.Team.load_bulk(
+        [
+            {
+                "data": {"name": f"parent-{i}", "organization_id": organization.pk},
+                "children": [
+                    {"data": {"name": f"team-{i}", "organization_id": organization.pk}}
+                ],
+            }
+            for i in range(memberships)
+        ]
+    )
+    # Parents and children ids alternate
+    models.TeamAccess.objects.bulk_create(
+        models.TeamAccess(user=user, team_id=team_id) for team_id in teams_ids[1::2]
+    )
+    return user
+
+
+def benchmark_team_visibility(stdout, iterations=10):
+    """Measure how long computing the teams a user can see takes.
+
+    The single query joining accesses with their ancestors paths is compared with
+    the query built with one condition per team, for a growing number of teams.
+    """
+    organization = factories.OrganizationFactory(with_registration_id=True)
+
+    for memberships in MEMBERSHIPS:
+        user = _create_user_with_memberships(organization, memberships)
+
+        queries = {
+            "OR of paths": lambda user=user: list(
+                _get_visible_teams_with_or_of_paths(user)
+            ),
+            "ancestors join": lambda user=user: list(
+                models.Team.objects.visible_to(user)
+            ),
+        }
+        for label, query in queries.items():
+            write_result(
+                stdout,
+                f"Team visibility with {memberships} memberships, {label}",
+                measure(query, iterations),
+            )
@@ -0,0 +1,24 @@
+"""Helpers shared by the benchmarks."""
+
+import time
+
+
+def measure(func, iterations, setup=None):
+    """
+    Call a function repeatedly and return its mean duration, in seconds.
+
+    The setup function, if any, is called before each call without being measured.
+    """
+    duration = 0.0
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        duration += time.perf_counter() - start
+    return duration / iterations
+
+
+def write_result(stdout, label, duration):
+    """Display the mean duration of a benchmarked operation."""
+    stdout.write(f"{label}: {duration * 1e6:.1f} µs")
@@ -0,0 +1,37 @@
+"""benchmark management command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from demo.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    """Measure the cost of performance sensitive code paths."""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        """Select the scenario to run and how many times to run it."""
+        parser.add_argument("scenario", choices=sorted(SCENARIOS))
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=None,
+            help=(
+                "Number of times each operation is run to compute its mean duration, "
+                "defaults to a value adapted to the scenario."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        """Run the scenario and roll back any object it created."""
+        kwargs = {}
+        if options["iterations"] is not None:
+            if options["iterations"] < 1:
+                raise CommandError("The number of iterations must be positive.")
+            kwargs["iterations"] = options["iterations"]
+
+        with transaction.atomic():
+            SCENARIOS[options["scenario"]](self.stdout, **kwargs)
+            transaction.set_rollback(True)
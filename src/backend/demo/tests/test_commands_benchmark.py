@@ -0,0 +1,90 @@
+"""Test the `benchmark` management command"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+import pytest
+
+from core import models
+
+from demo.benchmarks import SCENARIOS
+
+pytestmark = pytest.mark.django_db
+
+
+def test_commands_benchmark_resource_server_authentication(settings):
+    """The benchmark should measure the authentication without keeping any object."""
+    settings.OIDC_OP_URL = "https://oidc.example.com"
+    settings.OIDC_OP_JWKS_ENDPOINT = "https://oidc.example.com/jwks"
+    settings.OIDC_OP_INTROSPECTION_ENDPOINT = "https://oidc.example.com/introspect"
+    settings.OIDC_RS_CLIENT_ID = "some_client_id"
+    settings.OIDC_RS_CLIENT_SECRET = "some_client_secret"
+
+    output = StringIO()
+    call_command(
+        "benchmark", "resource_server_authentication", iterations=5, stdout=output
+    )
+
+    assert "Authentication with a backend built per request:" in output.getvalue()
+    assert "Authentication with a shared backend:" in output.getvalue()
+    assert not models.User.objects.exists()
+
+
+def test_commands_benchmark_resource_server_not_configured(settings):
+    """The benchmark should fail when the resource server is not configured."""
+    settings.OIDC_OP_URL = None
+
+    with pytest.raises(CommandError, match="The resource server is not configured."):
+        call_command("benchmark", "resource_server_authentication", iterations=5)
+
+
+def test_commands_benchmark_team_visibility(monkeypatch):
+    """The benchmark should compare both team visibility queries without keeping teams."""
+    monkeypatch.setattr("demo.benchmarks.teams.MEMBERSHIPS", (1, 3))
+
+    output = StringIO()
+    call_command("benchmark", "team_visibility", iterations=2, stdout=output)
+
+    for memberships in (1, 3):
+        assert (
+            f"Team visibility with {memberships} memberships, OR of paths:"
+            in output.getvalue()
+        )
+        assert (
+            f"Team visibility with {memberships} memberships, ancestors join:"
+            in output.getvalue()
+        )
+    assert not models.Team.objects.exists()
+
+
+def test_commands_benchmark_email_rendering():
+    """The benchmark should compare the rendering of emails with and without caches."""
+    output = StringIO()
+    call_command("benchmark", "email_rendering", iterations=2, stdout=output)
+
+    for kind in ("Invitation email", "New mailbox email"):
+        assert f"{kind}, uncached:" in output.getvalue()
+        assert f"{kind}, cached:" in output.getvalue()
+
+
+def test_commands_benchmark_default_iterations(monkeypatch):
+    """Scenarios should run their own number of iterations by default."""
+    calls = []
+    monkeypatch.setitem(
+        SCENARIOS, "team_visibility", lambda stdout, **kwargs: calls.append(kwargs)
+    )
+
+    call_command("benchmark", "team_visibility")
+    call_command("benchmark", "team_visibility", iterations=3)
+
+    assert calls == [{}, {"iterations": 3}]
+
+
+def test_commands_benchmark_invalid_iterations():
+    """The number of iterations should be positive."""
+    with pytest.raises(
+        CommandError, match="The number of iterations must be positive."
+    ):
+        call_command("benchmark", "team_visibility", iterations=0)
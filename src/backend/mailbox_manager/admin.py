@@ -39,23 +39,26 @@ def fetch_domain_status_from_dimail(modeladmin, request, queryset):  # pylint: d
     client = DimailAPIClient()
     domains_updated, excluded_domains, msg_error = [], [], []
     success = False
+    domains = []
     for domain in queryset:
         # do not check disabled domains
         if domain.status == enums.MailDomainStatusChoices.DISABLED:
             excluded_domains.append(domain.name)
-            continue
+        else:
+            domains.append(domain)
 
-        old_status = domain.status
-        try:
-            response = client.fetch_domain_status(domain)
-        except exceptions.HTTPError as err:
-            msg_error.append(_(f"""- <b>{domain.name}</b> with message: '{err}'"""))
+    for check in client.fetch_domains_status(domains):
+        domain = check.domain
+        if check.error is not None:
+            msg_error.append(
+                _(f"""- <b>{domain.name}</b> with message: '{check.error}'""")
+            )
         else:
             success = True
             # temporary (or not?) display content of the dimail response to debug broken state
             if domain.status == enums.MailDomainStatusChoices.FAILED:
-                messages.info(request, response.json())
-            if old_status != domain.status:
+                messages.info(request, check.response.json())
+            if check.old_status != domain.status:
                 domains_updated.append(domain.name)
 
     if success:
@@ -114,6 +117,34 @@ class MailboxAdmin(admin.ModelAdmin):
     readonly_fields = ["updated_at", "local_part", "domain"]
 
 
+@admin.register(models.MailboxImport)
+class MailboxImportAdmin(admin.ModelAdmin):
+    """Admin for bulk imports of mailboxes."""
+
+    list_display = (
+        "domain",
+        "user",
+        "status",
+        "total",
+        "created",
+        "skipped",
+        "created_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("domain__name",)
+    readonly_fields = [
+        "domain",
+        "user",
+        "status",
+        "total",
+        "created",
+        "skipped",
+        "errors",
+        "upload",
+        "media_type",
+    ]
+
+
 @admin.register(models.MailDomainAccess)
 class MailDomainAccessAdmin(admin.ModelAdmin):
     """Admin for mail domain accesses model."""
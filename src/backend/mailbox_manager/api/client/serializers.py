@@ -1,8 +1,9 @@
 """Client serializers for People's mailbox manager app."""
 
-import json
 from logging import getLogger
 
+from django.db import transaction
+
 from requests.exceptions import HTTPError
 from rest_framework import exceptions, serializers
 
@@ -10,6 +11,7 @@ from core.api.client.serializers import UserSerializer
 from core.models import User
 
 from mailbox_manager import enums, models
+from mailbox_manager.tasks import provision_mailbox
 from mailbox_manager.utils.dimail import DimailAPIClient
 
 logger = getLogger(__name__)
@@ -33,29 +35,16 @@ class MailboxSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Override create function to fire a request on mailbox creation.
+        Override create function to provision the mailbox on dimail once it is saved
+        in our database. Provisioning is done by a worker: the mailbox stays pending
+        until it is enabled, or failed if dimail refuses it.
         """
         mailbox = super().create(validated_data)
         if validated_data["domain"].status == enums.MailDomainStatusChoices.ENABLED:
-            client = DimailAPIClient()
-            # send new mailbox request to dimail
-            response = client.create_mailbox(
-                validated_data, self.context["request"].user.sub
-            )
-
-            # fix format to have actual json, and remove uuid
-            mailbox_data = json.loads(
-                response.content.decode("utf-8").replace("'", '"')
-            )
-            mailbox.status = enums.MailDomainStatusChoices.ENABLED
-            mailbox.save()
-
-            # send confirmation email
-            client.notify_mailbox_creation(
-                recipient=validated_data["secondary_email"], mailbox_data=mailbox_data
+            user_sub = self.context["request"].user.sub
+            transaction.on_commit(
+                lambda: provision_mailbox.delay(str(mailbox.pk), user_sub)
             )
-
-        # actually save mailbox on our database
         return mailbox
 
 
@@ -227,3 +216,21 @@ class MailDomainAccessReadOnlySerializer(MailDomainAccessSerializer):
             "role",
             "can_set_role_to",
         ]
+
+
+class MailboxImportSerializer(serializers.ModelSerializer):
+    """Serialize the progress of a bulk import of mailboxes."""
+
+    class Meta:
+        model = models.MailboxImport
+        fields = [
+            "id",
+            "status",
+            "total",
+            "created",
+            "skipped",
+            "errors",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
@@ -1,17 +1,28 @@
 """API endpoints"""
 
-from django.db.models import Q, Subquery
+import io
+import shutil
+import tempfile
 
-from rest_framework import exceptions, filters, mixins, viewsets
+from django.core.files import File
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.http import UnreadablePostError
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, filters, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from core import models as core_models
 from core.api.client.serializers import UserSerializer
+from core.utils.search import search_filter
 
 from mailbox_manager import enums, models
 from mailbox_manager.api import permissions
 from mailbox_manager.api.client import serializers
+from mailbox_manager.tasks import import_mailboxes_upload
+from mailbox_manager.utils import bulk_import
 from mailbox_manager.utils.dimail import DimailAPIClient
 
 
@@ -46,7 +57,15 @@ class MailDomainViewSet(
 
     def get_queryset(self):
         """Restrict results to the current user's team."""
-        return self.queryset.filter(accesses__user=self.request.user)
+        user_role_query = models.MailDomainAccess.objects.filter(
+            user=self.request.user, domain=OuterRef("pk")
+        ).values("role")[:1]
+
+        return (
+            self.queryset.filter(accesses__user=self.request.user)
+            # Abilities are computed based on logged-in user's role for the domain
+            .annotate(user_role=Subquery(user_role_query))
+        )
 
     def perform_create(self, serializer):
         """Set the current user as owner of the newly created mail domain."""
@@ -206,13 +225,24 @@ class MailDomainAccessViewSet(
         )
         # Search by case-insensitive and accent-insensitive
         if query := request.GET.get("q", ""):
-            queryset = queryset.filter(
-                Q(name__unaccent__icontains=query) | Q(email__unaccent__icontains=query)
-            )
+            queryset = queryset.filter(search_filter(query, "name", "email"))
         return Response(UserSerializer(queryset.all(), many=True).data)
 
 
+class MailDomainNestedViewSetMixin:
+    """Give views nested under a mail domain access to this domain."""
+
+    def get_domain(self):
+        """Return the mail domain of the url, fetched once per request."""
+        if not hasattr(self, "_domain"):
+            self._domain = models.MailDomain.objects.get(
+                slug=self.kwargs.get("domain_slug", "")
+            )
+        return self._domain
+
+
 class MailBoxViewSet(
+    MailDomainNestedViewSetMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet,
@@ -220,7 +250,8 @@ class MailBoxViewSet(
     """MailBox ViewSet
 
     GET /api/<version>/mail-domains/<domain_slug>/mailboxes/
-        Return a list of mailboxes on the domain
+        Return a list of mailboxes on the domain, optionally filtered by
+        local part with the `q` query parameter
 
     POST /api/<version>/mail-domains/<domain_slug>/mailboxes/ with expected data:
         - first_name: str
@@ -244,18 +275,20 @@ class MailBoxViewSet(
 
     def get_queryset(self):
         """Custom queryset to get mailboxes related to a mail domain."""
-        domain_slug = self.kwargs.get("domain_slug", "")
-        if domain_slug:
-            return self.queryset.filter(domain__slug=domain_slug)
-        return self.queryset
+        queryset = self.queryset
+        if domain_slug := self.kwargs.get("domain_slug", ""):
+            queryset = queryset.filter(domain__slug=domain_slug)
+
+        if self.action == "list":
+            # Search by case-insensitive and accent-insensitive
+            if query := self.request.GET.get("q", ""):
+                queryset = queryset.filter(search_filter(query, "local_part"))
+
+        return queryset
 
     def perform_create(self, serializer):
         """Create new mailbox."""
-        domain_slug = self.kwargs.get("domain_slug", "")
-        if domain_slug:
-            serializer.validated_data["domain"] = models.MailDomain.objects.get(
-                slug=domain_slug
-            )
+        serializer.validated_data["domain"] = self.get_domain()
         super().perform_create(serializer)
 
     @action(detail=True, methods=["post"])
@@ -277,3 +310,74 @@ class MailBoxViewSet(
         mailbox.status = enums.MailboxStatusChoices.ENABLED
         mailbox.save()
         return Response(serializers.MailboxSerializer(mailbox).data)
+
+
+class MailboxImportViewSet(
+    MailDomainNestedViewSetMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Mailbox import ViewSet
+
+    POST /api/<version>/mail-domains/<domain_slug>/mailbox-imports/ with a body in
+    CSV (text/csv, with a header row) or JSON lines (application/jsonl) encoded in
+    UTF-8, each mailbox having the fields:
+        - first_name: str
+        - last_name: str
+        - local_part: str
+        - secondary_email: str
+        Stores the body and returns the import at once, the mailboxes being
+        created by a worker, then provisioned on dimail by workers: the progress
+        of the import is followed with its id
+
+    GET /api/<version>/mail-domains/<domain_slug>/mailbox-imports/
+        Return a list of the imports of mailboxes on the domain
+
+    GET /api/<version>/mail-domains/<domain_slug>/mailbox-imports/<import_id>/
+        Return an import of mailboxes and its progress
+    """
+
+    permission_classes = [permissions.MailBoxPermission]
+    serializer_class = serializers.MailboxImportSerializer
+    queryset = models.MailboxImport.objects.all()
+
+    def get_queryset(self):
+        """Custom queryset to get the imports of mailboxes of a mail domain."""
+        return self.queryset.filter(domain__slug=self.kwargs.get("domain_slug", ""))
+
+    def create(self, request, *args, **kwargs):
+        """
+        Store the body of the request, read as a stream so that large uploads are
+        not loaded in memory, and import its mailboxes in the background.
+        """
+        media_type = request.content_type.split(";")[0].strip().lower()
+        if media_type not in bulk_import.READERS:
+            raise exceptions.UnsupportedMediaType(media_type)
+
+        domain = self.get_domain()
+        if domain.status == enums.MailDomainStatusChoices.DISABLED:
+            raise exceptions.ValidationError(
+                _("You can't create or update a mailbox for a disabled domain.")
+            )
+
+        mailbox_import = models.MailboxImport(
+            domain=domain, user=request.user, media_type=media_type
+        )
+        with tempfile.TemporaryFile() as upload:
+            try:
+                shutil.copyfileobj(request.stream or io.BytesIO(), upload)
+            except UnreadablePostError as error:
+                raise exceptions.ParseError(
+                    _("The upload could not be read: %s") % error
+                ) from error
+            mailbox_import.upload.save(str(mailbox_import.pk), File(upload), save=False)
+        mailbox_import.save()
+
+        user_sub = request.user.sub
+        transaction.on_commit(
+            lambda: import_mailboxes_upload.delay(str(mailbox_import.pk), user_sub)
+        )
+        return Response(
+            self.get_serializer(mailbox_import).data, status=status.HTTP_202_ACCEPTED
+        )
@@ -2,8 +2,6 @@
 
 from core.api import permissions as core_permissions
 
-from mailbox_manager import models
-
 
 class AccessPermission(core_permissions.IsAuthenticated):
     """Permission class for access objects."""
@@ -15,11 +13,14 @@ class AccessPermission(core_permissions.IsAuthenticated):
 
 
 class MailBoxPermission(core_permissions.IsAuthenticated):
-    """Permission class to manage mailboxes for a mail domain"""
+    """
+    Permission class to manage mailboxes for a mail domain, for views nested under
+    this domain.
+    """
 
     def has_permission(self, request, view):
         """Check permission based on domain."""
-        domain = models.MailDomain.objects.get(slug=view.kwargs.get("domain_slug", ""))
+        domain = view.get_domain()
         abilities = domain.get_abilities(request.user)
         return abilities.get(request.method.lower(), False)
 
@@ -31,3 +31,11 @@ class MailboxStatusChoices(models.TextChoices):
     ENABLED = "enabled", _("Enabled")
     FAILED = "failed", _("Failed")
     DISABLED = "disabled", _("Disabled")
+
+
+class MailboxImportStatusChoices(models.TextChoices):
+    """Lists the possible statuses in which a bulk import of mailboxes can be."""
+
+    RUNNING = "running", _("Running")
+    DONE = "done", _("Done")
+    FAILED = "failed", _("Failed")
@@ -1,11 +1,10 @@
 """Management command to check and update domain status"""
 
 import logging
+import time
 
 from django.core.management.base import BaseCommand
 
-import requests
-
 from mailbox_manager.enums import MailDomainStatusChoices
 from mailbox_manager.models import MailDomain
 from mailbox_manager.utils.dimail import DimailAPIClient
@@ -24,6 +23,18 @@ class Command(BaseCommand):
         "sent by dimail does not match our status saved in our database."
     )
 
+    def add_arguments(self, parser):
+        """Add an argument to choose the number of domains checked at the same time."""
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help=(
+                "Number of domains checked at the same time. "
+                "Defaults to the MAIL_DOMAIN_CHECK_MAX_WORKERS setting."
+            ),
+        )
+
     def handle(self, *args, **options):
         """Handling of the management command."""
 
@@ -31,28 +42,38 @@ class Command(BaseCommand):
         client = DimailAPIClient()
         # do not fetch status of disabled domains
         domains = MailDomain.objects.exclude(status=MailDomainStatusChoices.DISABLED)
-        for domain in domains:
-            old_status = domain.status
-            try:
-                client.fetch_domain_status(domain)
-            except requests.exceptions.HTTPError as err:
+
+        start = time.monotonic()
+        checks = client.fetch_domains_status(domains, max_workers=options["workers"])
+        duration = time.monotonic() - start
+
+        for check in checks:
+            domain = check.domain
+            if check.error is not None:
                 self.stdout.write(
                     self.style.ERROR(
-                        f"Fetch failed for {domain.name} with message: '{err}'"
+                        f"Fetch failed for {domain.name} with message: '{check.error}'"
                     )
                 )
-            else:
-                action = "UPDATED" if old_status != domain.status else "CHECKED"
-                domain_name = (
-                    f"{domain.name[:40]}..." if len(domain.name) > 40 else domain.name
-                )
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        (
-                            f"Domain {domain_name}"
-                            + "." * (50 - len(domain_name))
-                            + action
-                        )
-                    )
+                continue
+
+            action = "UPDATED" if check.old_status != domain.status else "CHECKED"
+            domain_name = (
+                f"{domain.name[:40]}..." if len(domain.name) > 40 else domain.name
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    (f"Domain {domain_name}" + "." * (50 - len(domain_name)) + action)
                 )
+            )
+
+        if checks:
+            durations = [check.duration for check in checks]
+            self.stdout.write(
+                f"{len(checks)} domain(s) checked in {duration:.2f}s: "
+                f"{sum(check.old_status != check.domain.status for check in checks)} "
+                f"updated, {sum(check.error is not None for check in checks)} failed. "
+                f"Check duration: {sum(durations) / len(durations):.2f}s on average, "
+                f"{max(durations):.2f}s at most."
+            )
         self.stdout.write("Done", ending="\n")
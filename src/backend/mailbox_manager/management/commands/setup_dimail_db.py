@@ -4,11 +4,11 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
 
-import requests
 from rest_framework import status
 
 from mailbox_manager import enums
 from mailbox_manager.models import MailDomain, MailDomainAccess
+from mailbox_manager.utils.dimail import get_dimail_transport
 
 User = get_user_model()
 
@@ -103,8 +103,10 @@ class Command(BaseCommand):
         Send a request to create a new user.
         """
 
-        response = requests.post(
-            url=f"{DIMAIL_URL}/users/",
+        response = get_dimail_transport().request(
+            "/users/",
+            "POST",
+            f"{DIMAIL_URL}/users/",
             json={
                 "name": name,
                 "password": password,
@@ -112,7 +114,6 @@ class Command(BaseCommand):
                 "perms": perms or [],
             },
             auth=auth,
-            timeout=10,
         )
 
         if response.status_code == status.HTTP_201_CREATED:
@@ -128,15 +129,16 @@ class Command(BaseCommand):
         """
         Send a request to create a new domain.
         """
-        response = requests.post(
-            url=f"{DIMAIL_URL}/domains/",
+        response = get_dimail_transport().request(
+            "/domains/",
+            "POST",
+            f"{DIMAIL_URL}/domains/",
             json={
                 "name": name,
                 "context_name": "context",
                 "features": ["webmail", "mailbox", "alias"],
             },
             auth=auth,
-            timeout=10,
         )
 
         if response.status_code == status.HTTP_201_CREATED:
@@ -154,14 +156,15 @@ class Command(BaseCommand):
         """
         Send a request to create a new allows between user and domain.
         """
-        response = requests.post(
-            url=f"{DIMAIL_URL}/allows/",
+        response = get_dimail_transport().request(
+            "/allows/",
+            "POST",
+            f"{DIMAIL_URL}/allows/",
             json={
                 "domain": domain,
                 "user": user,
             },
             auth=auth,
-            timeout=10,
         )
 
         if response.status_code == status.HTTP_201_CREATED:
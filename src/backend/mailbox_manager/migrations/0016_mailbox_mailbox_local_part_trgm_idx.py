@@ -0,0 +1,19 @@
+import core.utils.search
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_immutable_unaccent_and_trigram_indexes'),
+        ('mailbox_manager', '0015_change_mailboxes_status_to_enabled'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailbox',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(core.utils.search.ImmutableUnaccent('local_part')), name='gin_trgm_ops'), name='mailbox_local_part_trgm_idx'),
+        ),
+    ]
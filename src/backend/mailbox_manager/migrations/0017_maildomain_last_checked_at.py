@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailbox_manager', '0016_mailbox_mailbox_local_part_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maildomain',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, help_text='date and time at which the domain was last checked with dimail', null=True, verbose_name='last checked at'),
+        ),
+        migrations.AddIndex(
+            model_name='maildomain',
+            index=models.Index(fields=['last_checked_at'], name='mail_domain_last_checked_idx'),
+        ),
+    ]
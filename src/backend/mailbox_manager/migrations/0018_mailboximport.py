@@ -0,0 +1,39 @@
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailbox_manager', '0017_maildomain_last_checked_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailboxImport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='primary key for the record as UUID', primary_key=True, serialize=False, verbose_name='id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='date and time at which a record was created', verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='date and time at which a record was last updated', verbose_name='updated at')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0, help_text='number of mailboxes read', verbose_name='total')),
+                ('created', models.PositiveIntegerField(default=0, help_text='number of mailboxes created', verbose_name='created')),
+                ('skipped', models.PositiveIntegerField(default=0, help_text='number of mailboxes skipped because invalid or already existing', verbose_name='skipped')),
+                ('errors', models.JSONField(blank=True, default=list, help_text='errors of the first mailboxes skipped, by line', verbose_name='errors')),
+                ('upload', models.FileField(blank=True, help_text='mailboxes to import, deleted once imported', upload_to='mailbox_imports/', verbose_name='upload')),
+                ('media_type', models.CharField(blank=True, help_text='media type of the upload', max_length=50, verbose_name='media type')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mailbox_imports', to='mailbox_manager.maildomain')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mailbox_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Mailbox import',
+                'verbose_name_plural': 'Mailbox imports',
+                'db_table': 'people_mailbox_import',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
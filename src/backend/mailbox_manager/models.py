@@ -9,8 +9,10 @@ from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
 from core.models import BaseModel
+from core.utils.search import trigram_search_index
 
 from mailbox_manager.enums import (
+    MailboxImportStatusChoices,
     MailboxStatusChoices,
     MailDomainRoleChoices,
     MailDomainStatusChoices,
@@ -29,11 +31,22 @@ class MailDomain(BaseModel):
         default=MailDomainStatusChoices.PENDING,
         choices=MailDomainStatusChoices.choices,
     )
+    last_checked_at = models.DateTimeField(
+        verbose_name=_("last checked at"),
+        help_text=_("date and time at which the domain was last checked with dimail"),
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         db_table = "people_mail_domain"
         verbose_name = _("Mail domain")
         verbose_name_plural = _("Mail domains")
+        indexes = [
+            models.Index(
+                fields=["last_checked_at"], name="mail_domain_last_checked_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -55,9 +68,12 @@ class MailDomain(BaseModel):
 
         if user.is_authenticated:
             try:
-                role = self.accesses.filter(user=user).values("role")[0]["role"]
-            except (MailDomainAccess.DoesNotExist, IndexError):
-                role = None
+                role = self.user_role
+            except AttributeError:
+                try:
+                    role = self.accesses.filter(user=user).values("role")[0]["role"]
+                except (MailDomainAccess.DoesNotExist, IndexError):
+                    role = None
 
         is_owner_or_admin = role in [
             MailDomainRoleChoices.OWNER,
@@ -148,9 +164,16 @@ class MailDomainAccess(BaseModel):
 
         if user.is_authenticated:
             try:
-                role = user.mail_domain_accesses.filter(domain=self.domain).get().role
-            except (MailDomainAccess.DoesNotExist, IndexError):
-                role = None
+                role = self.user_role
+            except AttributeError:
+                try:
+                    role = (
+                        user.mail_domain_accesses.filter(domain=self.domain_id)
+                        .get()
+                        .role
+                    )
+                except (MailDomainAccess.DoesNotExist, IndexError):
+                    role = None
 
         is_owner_or_admin = role in [
             MailDomainRoleChoices.OWNER,
@@ -199,6 +222,9 @@ class Mailbox(BaseModel):
         verbose_name = _("Mailbox")
         verbose_name_plural = _("Mailboxes")
         unique_together = ("local_part", "domain")
+        indexes = [
+            trigram_search_index("local_part", name="mailbox_local_part_trgm_idx"),
+        ]
 
     def __str__(self):
         return f"{self.local_part!s}@{self.domain.name:s}"
@@ -224,3 +250,65 @@ class Mailbox(BaseModel):
                 _("You can't create or update a mailbox for a disabled domain.")
             )
         return super().save(*args, **kwargs)
+
+
+class MailboxImport(BaseModel):
+    """Bulk import of mailboxes into a mail domain, and its progress."""
+
+    domain = models.ForeignKey(
+        MailDomain,
+        on_delete=models.CASCADE,
+        related_name="mailbox_imports",
+        null=False,
+        blank=False,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="mailbox_imports",
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=MailboxImportStatusChoices.choices,
+        default=MailboxImportStatusChoices.RUNNING,
+    )
+    total = models.PositiveIntegerField(
+        _("total"), default=0, help_text=_("number of mailboxes read")
+    )
+    created = models.PositiveIntegerField(
+        _("created"), default=0, help_text=_("number of mailboxes created")
+    )
+    skipped = models.PositiveIntegerField(
+        _("skipped"),
+        default=0,
+        help_text=_("number of mailboxes skipped because invalid or already existing"),
+    )
+    errors = models.JSONField(
+        _("errors"),
+        default=list,
+        blank=True,
+        help_text=_("errors of the first mailboxes skipped, by line"),
+    )
+    upload = models.FileField(
+        _("upload"),
+        upload_to="mailbox_imports/",
+        blank=True,
+        help_text=_("mailboxes to import, deleted once imported"),
+    )
+    media_type = models.CharField(
+        _("media type"),
+        max_length=50,
+        blank=True,
+        help_text=_("media type of the upload"),
+    )
+
+    class Meta:
+        db_table = "people_mailbox_import"
+        verbose_name = _("Mailbox import")
+        verbose_name_plural = _("Mailbox imports")
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Import of mailboxes on domain {self.domain} ({self.status})"
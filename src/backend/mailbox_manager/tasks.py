@@ -0,0 +1,278 @@
+"""Celery tasks of the People mailbox manager application"""
+
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+import requests
+from rest_framework import status
+
+from core.utils.mail import send_messages
+
+from mailbox_manager.enums import MailboxStatusChoices, MailDomainStatusChoices
+from mailbox_manager.models import Mailbox, MailboxImport, MailDomain
+from mailbox_manager.utils.dimail import DimailAPIClient
+from people.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+# Maximum duration of the provisioning of a mailbox by a worker, after which another
+# worker may provision it
+MAILBOX_PROVISIONING_LOCK_TIMEOUT = 300
+
+
+class MailboxProvisioningLockedError(Exception):
+    """The mailbox is being provisioned by another worker."""
+
+
+def get_domains_to_check():
+    """
+    Return the mail domains due for a check, the most urgent first.
+
+    Pending and failed domains are due MAIL_DOMAIN_CHECK_UNHEALTHY_INTERVAL seconds
+    after their last check and come first, other domains are due
+    MAIL_DOMAIN_CHECK_INTERVAL seconds after their last check. Domains never checked
+    are always due, disabled domains never are.
+    """
+    now = timezone.now()
+    unhealthy = Q(
+        status__in=[MailDomainStatusChoices.PENDING, MailDomainStatusChoices.FAILED]
+    )
+    return (
+        MailDomain.objects.exclude(status=MailDomainStatusChoices.DISABLED)
+        .filter(
+            Q(last_checked_at__isnull=True)
+            | Q(
+                unhealthy,
+                last_checked_at__lte=now
+                - timedelta(seconds=settings.MAIL_DOMAIN_CHECK_UNHEALTHY_INTERVAL),
+            )
+            | Q(
+                last_checked_at__lte=now
+                - timedelta(seconds=settings.MAIL_DOMAIN_CHECK_INTERVAL)
+            )
+        )
+        .annotate(priority=Case(When(unhealthy, then=Value(0)), default=Value(1)))
+        .order_by("priority", F("last_checked_at").asc(nulls_first=True))
+    )
+
+
+@app.task
+def check_domains():
+    """
+    Check the mail domains due for a check, split in shards checked in parallel.
+
+    At most MAIL_DOMAIN_CHECK_BATCH_SIZE domains are checked per run: as each check
+    updates the last check date of the domain, the next runs go on with the domains
+    left over.
+    """
+    domain_ids = [
+        str(domain_id)
+        for domain_id in get_domains_to_check().values_list("pk", flat=True)[
+            : settings.MAIL_DOMAIN_CHECK_BATCH_SIZE
+        ]
+    ]
+    shards = settings.MAIL_DOMAIN_CHECK_SHARDS
+    for index in range(min(shards, len(domain_ids))):
+        # Dealing ids out keeps urgent domains spread over all the shards
+        check_domains_shard.delay(domain_ids[index::shards])
+    return len(domain_ids)
+
+
+@app.task
+def check_domains_shard(domain_ids):
+    """Check a shard of mail domains with dimail and update their status."""
+    domains = MailDomain.objects.filter(pk__in=domain_ids).exclude(
+        status=MailDomainStatusChoices.DISABLED
+    )
+    checks = DimailAPIClient().fetch_domains_status(domains)
+    for check in checks:
+        if check.error is not None:
+            logger.warning(
+                "Check of domain %s failed with message: '%s'",
+                check.domain.name,
+                check.error,
+            )
+        elif check.old_status != check.domain.status:
+            logger.info(
+                "Status of domain %s changed from %s to %s",
+                check.domain.name,
+                check.old_status,
+                check.domain.status,
+            )
+    return len(checks)
+
+
+def _set_mailbox_status(mailbox, new_status):
+    """Move a pending mailbox to a new status, unless it left the pending status."""
+    Mailbox.objects.filter(pk=mailbox.pk, status=MailboxStatusChoices.PENDING).update(
+        status=new_status, updated_at=timezone.now()
+    )
+
+
+def _is_temporary_error(error):
+    """Whether the provisioning of a mailbox may succeed later despite this error."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def _provision_mailbox(mailbox_id, user_sub, lock_owner, retries):
+    """
+    Create a pending mailbox on dimail, then enable it. The mailbox fails if dimail
+    refuses it, or is still unavailable after MAILBOX_PROVISIONING_MAX_RETRIES retries.
+    A mailbox being provisioned by another worker is provisioned again later, in case
+    that worker dies, unless it still is after as many retries.
+
+    Return the new status of the mailbox, None if it was not provisioned, with the
+    email holding its information to send to its secondary email if any, and the
+    error after which its provisioning should be retried if any.
+    """
+    mailbox = (
+        Mailbox.objects.select_related("domain")
+        .filter(pk=mailbox_id, status=MailboxStatusChoices.PENDING)
+        .first()
+    )
+    if mailbox is None:
+        return None, None, None
+
+    lock_key = f"mailbox_provisioning:{mailbox_id}"
+    if not cache.add(lock_key, lock_owner, MAILBOX_PROVISIONING_LOCK_TIMEOUT):
+        logger.info("Mailbox %s is already being provisioned.", mailbox)
+        retry_error = (
+            MailboxProvisioningLockedError(mailbox_id)
+            if retries < settings.MAILBOX_PROVISIONING_MAX_RETRIES
+            else None
+        )
+        return None, None, retry_error
+
+    try:
+        client = DimailAPIClient()
+        try:
+            response = client.create_mailbox(
+                {
+                    "first_name": mailbox.first_name,
+                    "last_name": mailbox.last_name,
+                    "local_part": mailbox.local_part,
+                    "domain": mailbox.domain.name,
+                },
+                user_sub,
+            )
+        except (requests.exceptions.RequestException, PermissionDenied) as error:
+            if (
+                not _is_temporary_error(error)
+                or retries >= settings.MAILBOX_PROVISIONING_MAX_RETRIES
+            ):
+                _set_mailbox_status(mailbox, MailboxStatusChoices.FAILED)
+                logger.error("Provisioning of mailbox %s failed: %s", mailbox, error)
+                return MailboxStatusChoices.FAILED, None, None
+            return None, None, error
+
+        _set_mailbox_status(mailbox, MailboxStatusChoices.ENABLED)
+        # The mailbox was created by a previous attempt, its password is lost
+        if response.status_code == status.HTTP_409_CONFLICT:
+            return MailboxStatusChoices.ENABLED, None, None
+
+        # fix format to have actual json, and remove uuid
+        mailbox_data = json.loads(response.content.decode("utf-8").replace("'", '"'))
+        message = client.get_mailbox_creation_message(
+            recipient=mailbox.secondary_email, mailbox_data=mailbox_data
+        )
+        return MailboxStatusChoices.ENABLED, message, None
+    finally:
+        cache.delete(lock_key)
+
+
+def _send_mailbox_information(messages):
+    """
+    Send the information of new mailboxes to their secondary emails over a single
+    connection to the mail relay.
+
+    These emails hold the passwords of the mailboxes: they are sent from the worker
+    which got them rather than handed to the broker. The ones which cannot be sent are
+    lost, and the passwords of their mailboxes have to be reset.
+    """
+    if not messages:
+        return
+
+    pending = send_messages(messages)
+    for message in messages:
+        if message in pending:
+            logger.error(
+                "Information for a new mailbox was not sent to %s.",
+                ", ".join(message["to"]),
+            )
+        else:
+            logger.info(
+                "Information for a new mailbox sent to %s.", ", ".join(message["to"])
+            )
+
+
+@app.task(bind=True, max_retries=None)
+def provision_mailbox(self, mailbox_id, user_sub=None):
+    """
+    Create a pending mailbox on dimail, then enable it and send its information to
+    its secondary email. Mailboxes are provisioned again with an exponential backoff
+    while dimail is unavailable or another worker provisions them.
+
+    The mailbox id is the idempotency key of its provisioning: only pending mailboxes
+    are provisioned, by a single worker at a time, so that a task delivered twice
+    does not create the mailbox twice.
+    """
+    new_status, message, retry_error = _provision_mailbox(
+        mailbox_id, user_sub, self.request.id, self.request.retries
+    )
+    if retry_error is None:
+        _send_mailbox_information([message] if message else [])
+        return new_status
+
+    raise self.retry(
+        exc=retry_error,
+        countdown=settings.MAILBOX_PROVISIONING_RETRY_DELAY * 2**self.request.retries,
+    )
+
+
+@app.task(bind=True)
+def provision_mailboxes(self, mailbox_ids, user_sub=None):
+    """
+    Provision a batch of mailboxes, then send their information together over a single
+    connection to the mail relay.
+
+    Mailboxes which could not be provisioned yet are provisioned again each in its own
+    task, as `provision_mailbox` does.
+    """
+    messages = []
+    for mailbox_id in mailbox_ids:
+        _new_status, message, retry_error = _provision_mailbox(
+            mailbox_id, user_sub, self.request.id, 0
+        )
+        if retry_error is not None:
+            provision_mailbox.apply_async(
+                args=[mailbox_id, user_sub],
+                countdown=settings.MAILBOX_PROVISIONING_RETRY_DELAY,
+                retries=1,
+            )
+        elif message:
+            messages.append(message)
+
+    _send_mailbox_information(messages)
+    return len(mailbox_ids)
+
+
+@app.task
+def import_mailboxes_upload(mailbox_import_id, user_sub=None):
+    """Import the mailboxes uploaded for a bulk import, then delete the upload."""
+    # pylint: disable=import-outside-toplevel
+    from mailbox_manager.utils.bulk_import import import_upload
+
+    mailbox_import = MailboxImport.objects.select_related("domain").get(
+        pk=mailbox_import_id
+    )
+    import_upload(mailbox_import, user_sub)
+    return mailbox_import.created
@@ -53,3 +53,28 @@ def test_api_mail_domains__list_authenticated():
     assert len(results) == 5
     results_id = {result["id"] for result in results}
     assert expected_ids == results_id
+
+
+def test_api_mail_domains__list_authenticated_constant_numqueries(
+    django_assert_num_queries,
+):
+    """The number of queries should not depend on the amount of listed domains."""
+    user = core_factories.UserFactory()
+    factories.MailDomainAccessFactory(user=user)
+
+    client = APIClient()
+    client.force_login(user)
+
+    # - query retrieving logged-in user
+    # - count from pagination
+    # - domains with the role of the logged-in user
+    with django_assert_num_queries(3):
+        response = client.get("/api/v1.0/mail-domains/")
+
+    factories.MailDomainAccessFactory.create_batch(10, user=user)
+
+    with django_assert_num_queries(3):
+        response = client.get("/api/v1.0/mail-domains/")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["count"] == 11
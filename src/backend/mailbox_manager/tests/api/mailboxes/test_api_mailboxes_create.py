@@ -7,11 +7,11 @@ import re
 from logging import Logger
 from unittest import mock
 
+from django.core import mail
 from django.test.utils import override_settings
 
 import pytest
 import responses
-from requests.exceptions import HTTPError
 from rest_framework import status
 from rest_framework.test import APIClient
 
@@ -86,7 +86,7 @@ def test_api_mailboxes__create_viewer_failure():
     "role",
     [enums.MailDomainRoleChoices.OWNER, enums.MailDomainRoleChoices.ADMIN],
 )
-def test_api_mailboxes__create_roles_success(role):
+def test_api_mailboxes__create_roles_success(role, django_capture_on_commit_callbacks):
     """Users with owner or admin role should be able to create mailbox on the mail domain."""
     mail_domain = factories.MailDomainEnabledFactory()
     access = factories.MailDomainAccessFactory(role=role, domain=mail_domain)
@@ -119,11 +119,12 @@ def test_api_mailboxes__create_roles_success(role):
             status=status.HTTP_201_CREATED,
             content_type="application/json",
         )
-        response = client.post(
-            f"/api/v1.0/mail-domains/{mail_domain.slug}/mailboxes/",
-            mailbox_values,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{mail_domain.slug}/mailboxes/",
+                mailbox_values,
+                format="json",
+            )
 
     assert response.status_code == status.HTTP_201_CREATED
     mailbox = models.Mailbox.objects.get()
@@ -136,15 +137,19 @@ def test_api_mailboxes__create_roles_success(role):
         "last_name": str(mailbox.last_name),
         "local_part": str(mailbox.local_part),
         "secondary_email": str(mailbox.secondary_email),
-        "status": enums.MailboxStatusChoices.ENABLED,
+        "status": enums.MailboxStatusChoices.PENDING,
     }
+    # the mailbox was provisioned once the request was over
+    assert mailbox.status == enums.MailboxStatusChoices.ENABLED
 
 
 @pytest.mark.parametrize(
     "role",
     [enums.MailDomainRoleChoices.OWNER, enums.MailDomainRoleChoices.ADMIN],
 )
-def test_api_mailboxes__create_with_accent_success(role):
+def test_api_mailboxes__create_with_accent_success(
+    role, django_capture_on_commit_callbacks
+):
     """Users with proper abilities should be able to create mailbox on the mail domain with a
     first_name accentuated."""
     mail_domain = factories.MailDomainEnabledFactory()
@@ -178,11 +183,12 @@ def test_api_mailboxes__create_with_accent_success(role):
             status=status.HTTP_201_CREATED,
             content_type="application/json",
         )
-        response = client.post(
-            f"/api/v1.0/mail-domains/{mail_domain.slug}/mailboxes/",
-            mailbox_values,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{mail_domain.slug}/mailboxes/",
+                mailbox_values,
+                format="json",
+            )
     assert response.status_code == status.HTTP_201_CREATED
     mailbox = models.Mailbox.objects.get()
 
@@ -194,8 +200,10 @@ def test_api_mailboxes__create_with_accent_success(role):
         "last_name": str(mailbox.last_name),
         "local_part": str(mailbox.local_part),
         "secondary_email": str(mailbox.secondary_email),
-        "status": enums.MailboxStatusChoices.ENABLED,
+        "status": enums.MailboxStatusChoices.PENDING,
     }
+    # the mailbox was provisioned once the request was over
+    assert mailbox.status == enums.MailboxStatusChoices.ENABLED
 
 
 def test_api_mailboxes__create_administrator_missing_fields():
@@ -318,7 +326,9 @@ def test_api_mailboxes__no_dimail_call_if_mailbox_creation_failed():
         assert len(rsps.calls) == 0
 
 
-def test_api_mailboxes__same_local_part_on_different_domains():
+def test_api_mailboxes__same_local_part_on_different_domains(
+    django_capture_on_commit_callbacks,
+):
     """A domain admin should be able to create a mailbox with the same local part
     of another mailbox, on different domain."""
     # a mailbox exists on another domain
@@ -357,11 +367,12 @@ def test_api_mailboxes__same_local_part_on_different_domains():
             status=status.HTTP_201_CREATED,
             content_type="application/json",
         )
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_values,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_values,
+                format="json",
+            )
 
     assert response.status_code == status.HTTP_201_CREATED
     assert (
@@ -463,9 +474,11 @@ def test_api_mailboxes__domain_viewer_provisioning_api_not_called():
 
 
 @mock.patch.object(Logger, "error")
-def test_api_mailboxes__async_dimail_unauthorized(mock_error):
+def test_api_mailboxes__async_dimail_unauthorized(
+    mock_error, django_capture_on_commit_callbacks
+):
     """
-    Dimail should raise an error if token has been successfully granted
+    Provisioning should fail if token has been successfully granted
     but mailbox creation request returns a 403.
     i.e. user exists on dimail-api but has no permission on that domain
     """
@@ -498,14 +511,17 @@ def test_api_mailboxes__async_dimail_unauthorized(mock_error):
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_data,
-            format="json",
-        )
-        assert response.status_code == status.HTTP_403_FORBIDDEN
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_data,
+                format="json",
+            )
+        assert response.status_code == status.HTTP_201_CREATED
 
-    assert mock_error.call_count == 1
+    mailbox = models.Mailbox.objects.get()
+    assert mailbox.status == enums.MailboxStatusChoices.FAILED
+    assert mock_error.call_count == 2
     assert mock_error.call_args_list[0][0] == (
         "[DIMAIL] 403 Forbidden: you cannot access domain %s",
         access.domain.name,
@@ -517,7 +533,7 @@ def test_api_mailboxes__async_dimail_unauthorized(mock_error):
     [enums.MailDomainRoleChoices.ADMIN, enums.MailDomainRoleChoices.OWNER],
 )
 def test_api_mailboxes__domain_owner_or_admin_successful_creation_and_provisioning(
-    role,
+    role, django_capture_on_commit_callbacks
 ):
     """
     Domain owner/admin should be able to create mailboxes.
@@ -556,11 +572,12 @@ def test_api_mailboxes__domain_owner_or_admin_successful_creation_and_provisioni
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_data,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_data,
+                format="json",
+            )
 
         # Checks payload sent to email-provisioning API
         payload = json.loads(rsps.calls[1].request.body)
@@ -581,8 +598,10 @@ def test_api_mailboxes__domain_owner_or_admin_successful_creation_and_provisioni
         "last_name": str(mailbox_data["last_name"]),
         "local_part": str(mailbox_data["local_part"]),
         "secondary_email": str(mailbox_data["secondary_email"]),
-        "status": enums.MailboxStatusChoices.ENABLED,
+        "status": enums.MailboxStatusChoices.PENDING,
     }
+    # the mailbox was provisioned once the request was over
+    assert mailbox.status == enums.MailboxStatusChoices.ENABLED
     assert mailbox.first_name == mailbox_data["first_name"]
     assert mailbox.last_name == mailbox_data["last_name"]
     assert mailbox.local_part == mailbox_data["local_part"]
@@ -590,9 +609,11 @@ def test_api_mailboxes__domain_owner_or_admin_successful_creation_and_provisioni
 
 
 @override_settings(MAIL_PROVISIONING_API_CREDENTIALS="wrongCredentials")
-def test_api_mailboxes__dimail_token_permission_denied(caplog):
+def test_api_mailboxes__dimail_token_permission_denied(
+    caplog, django_capture_on_commit_callbacks
+):
     """
-    API should raise a clear "permission denied" error
+    Provisioning should fail with a clear "permission denied" error
     when receiving a permission denied from dimail upon requesting token.
     """
     # creating all needed objects
@@ -614,19 +635,19 @@ def test_api_mailboxes__dimail_token_permission_denied(caplog):
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_data,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_data,
+                format="json",
+            )
 
-        assert response.status_code == status.HTTP_403_FORBIDDEN
-        assert response.json() == {
-            "detail": "Token denied. Please check your MAIL_PROVISIONING_API_CREDENTIALS."
-        }
-        # mailbox was created in our side only and in pending status
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["status"] == enums.MailboxStatusChoices.PENDING
+
+        # mailbox was created in our side only and failed
         mailbox = models.Mailbox.objects.get()
-        assert mailbox.status == enums.MailboxStatusChoices.PENDING
+        assert mailbox.status == enums.MailboxStatusChoices.FAILED
 
         # Check error logger was called
         assert caplog.records[0].levelname == "ERROR"
@@ -635,11 +656,15 @@ def test_api_mailboxes__dimail_token_permission_denied(caplog):
             == "[DIMAIL] 403 Forbidden: Could not retrieve a token,"
             "please check 'MAIL_PROVISIONING_API_CREDENTIALS' setting."
         )
+        assert caplog.records[1].message == (
+            f"Provisioning of mailbox {mailbox} failed: "
+            "Token denied. Please check your MAIL_PROVISIONING_API_CREDENTIALS."
+        )
 
 
-def test_api_mailboxes__user_unrelated_to_domain():
+def test_api_mailboxes__user_unrelated_to_domain(django_capture_on_commit_callbacks):
     """
-    API should raise a clear "permission denied" when dimail returns a permission denied
+    Provisioning should fail when dimail returns a permission denied
     on mailbox creation. This means token was granted for this user
     but user is not allowed to modify this domain (i.e. does not have a allow)
     """
@@ -669,25 +694,27 @@ def test_api_mailboxes__user_unrelated_to_domain():
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_data,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_data,
+                format="json",
+            )
 
-        assert response.status_code == status.HTTP_403_FORBIDDEN
-        assert response.json() == {
-            "detail": "Permission denied. Please check your MAIL_PROVISIONING_API_CREDENTIALS."
-        }
-        # mailbox was created in our side only and in pending status
+        assert response.status_code == status.HTTP_201_CREATED
+        # mailbox was created in our side only and failed
         mailbox = models.Mailbox.objects.get()
-        assert mailbox.status == enums.MailboxStatusChoices.PENDING
+        assert mailbox.status == enums.MailboxStatusChoices.FAILED
 
 
-def test_api_mailboxes__handling_dimail_unexpected_error(caplog):
+def test_api_mailboxes__handling_dimail_unexpected_error(
+    caplog, django_capture_on_commit_callbacks, settings
+):
     """
-    API should raise a clear error when dimail returns an unexpected response.
+    Provisioning should be retried when dimail returns an unexpected server error,
+    and fail once retries are exhausted.
     """
+    settings.MAILBOX_PROVISIONING_MAX_RETRIES = 2
     # creating all needed objects
     access = factories.MailDomainAccessFactory(role=enums.MailDomainRoleChoices.OWNER)
 
@@ -706,7 +733,7 @@ def test_api_mailboxes__handling_dimail_unexpected_error(caplog):
             status=status.HTTP_200_OK,
             content_type="application/json",
         )
-        rsps.add(
+        rsp = rsps.add(
             rsps.POST,
             re.compile(rf".*/domains/{access.domain.name}/mailboxes/"),
             body='{"detail": "Internal server error"}',
@@ -714,20 +741,19 @@ def test_api_mailboxes__handling_dimail_unexpected_error(caplog):
             content_type="application/json",
         )
 
-        with pytest.raises(HTTPError):
+        with django_capture_on_commit_callbacks(execute=True):
             response = client.post(
                 f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
                 mailbox_data,
                 format="json",
             )
-            assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
-            assert response.json() == {
-                "detail": "Unexpected response from dimail: {'details': 'Internal server error'}"
-            }
+        assert response.status_code == status.HTTP_201_CREATED
+        # first attempt and 2 retries
+        assert rsp.call_count == 3
 
-        # mailbox was created in our side only and in pending status
+        # mailbox was created in our side only and failed
         mailbox = models.Mailbox.objects.get()
-        assert mailbox.status == enums.MailboxStatusChoices.PENDING
+        assert mailbox.status == enums.MailboxStatusChoices.FAILED
 
         # Check error logger was called
         assert caplog.records[0].levelname == "ERROR"
@@ -739,7 +765,9 @@ def test_api_mailboxes__handling_dimail_unexpected_error(caplog):
 
 @mock.patch.object(Logger, "error")
 @mock.patch.object(Logger, "info")
-def test_api_mailboxes__send_correct_logger_infos(mock_info, mock_error):
+def test_api_mailboxes__send_correct_logger_infos(
+    mock_info, mock_error, django_capture_on_commit_callbacks
+):
     """
     Upon requesting mailbox creation, la régie should impersonate
     querying user in dimail and log things correctly.
@@ -775,11 +803,12 @@ def test_api_mailboxes__send_correct_logger_infos(mock_info, mock_error):
             content_type="application/json",
         )
 
-        response = client.post(
-            f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
-            mailbox_data,
-            format="json",
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
+                mailbox_data,
+                format="json",
+            )
         assert response.status_code == status.HTTP_201_CREATED
 
         # user sub is sent to payload as a parameter
@@ -788,11 +817,12 @@ def test_api_mailboxes__send_correct_logger_infos(mock_info, mock_error):
     # Logger
     assert not mock_error.called
     assert mock_info.call_count == 4
-    # a new empty error has been added. To be investigated
-    assert mock_info.call_args_list[0][0] == (
+    # The request is logged before the mailbox is provisioned, once committed
+    assert mock_info.call_args_list[0][0] == ("",)
+    assert mock_info.call_args_list[1][0] == (
         "Token succesfully granted by mail-provisioning API.",
     )
-    assert mock_info.call_args_list[1][0] == (
+    assert mock_info.call_args_list[2][0] == (
         "Mailbox successfully created on domain %s by user %s",
         str(access.domain),
         access.user.sub,
@@ -800,7 +830,9 @@ def test_api_mailboxes__send_correct_logger_infos(mock_info, mock_error):
 
 
 @mock.patch.object(Logger, "info")
-def test_api_mailboxes__sends_new_mailbox_notification(mock_info):
+def test_api_mailboxes__sends_new_mailbox_notification(
+    mock_info, django_capture_on_commit_callbacks
+):
     """
     Creating a new mailbox should send confirmation email
     to secondary email.
@@ -835,20 +867,22 @@ def test_api_mailboxes__sends_new_mailbox_notification(mock_info):
             status=status.HTTP_201_CREATED,
             content_type="application/json",
         )
-        with mock.patch("django.core.mail.send_mail") as mock_send:
+        with django_capture_on_commit_callbacks(execute=True):
             client.post(
                 f"/api/v1.0/mail-domains/{access.domain.slug}/mailboxes/",
                 mailbox_data,
                 format="json",
             )
 
-        assert mock_send.call_count == 1
-        assert mock_send.mock_calls[0][1][0] == "Your new mailbox information"
-        assert mock_send.mock_calls[0][1][3][0] == mailbox_data["secondary_email"]
+    # pylint: disable-next=no-member
+    assert len(mail.outbox) == 1
+    # pylint: disable-next=no-member
+    email = mail.outbox[0]
+    assert email.subject == "Your new mailbox information"
+    assert email.to == [mailbox_data["secondary_email"]]
 
     assert mock_info.call_count == 4
-    assert mock_info.call_args_list[2][0] == (
-        "Information for mailbox %s sent to %s.",
-        f"{mailbox_data['local_part']}@{access.domain.name}",
+    assert mock_info.call_args_list[3][0] == (
+        "Information for a new mailbox sent to %s.",
         mailbox_data["secondary_email"],
     )
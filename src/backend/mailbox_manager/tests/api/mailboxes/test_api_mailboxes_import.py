@@ -0,0 +1,411 @@
+"""
+Unit tests for the bulk import of mailboxes API
+"""
+
+import json
+from unittest import mock
+
+from django.db import DatabaseError
+
+import pytest
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import factories as core_factories
+
+from mailbox_manager import enums, factories, models
+from mailbox_manager.tasks import import_mailboxes_upload, provision_mailboxes
+
+pytestmark = pytest.mark.django_db
+
+CSV_HEADER = "first_name,last_name,local_part,secondary_email\n"
+
+
+@pytest.fixture(autouse=True)
+def in_memory_storage(settings):
+    """Store the uploads in memory."""
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    }
+
+
+def _post_import(client, domain, body, content_type):
+    """Upload mailboxes to import into a domain."""
+    return client.post(
+        f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/",
+        body,
+        content_type=content_type,
+    )
+
+
+def _get_import(client, domain, response):
+    """Follow the progress of an import with the id returned on upload."""
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    return client.get(
+        f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/{response.json()['id']}/"
+    ).json()
+
+
+def _get_client(domain, role=enums.MailDomainRoleChoices.ADMIN):
+    """Return a client logged in as a user having a role on the domain."""
+    access = factories.MailDomainAccessFactory(domain=domain, role=role)
+    client = APIClient()
+    client.force_login(access.user)
+    return client
+
+
+def test_api_mailboxes_import__anonymous():
+    """Anonymous users should not be allowed to import mailboxes."""
+    domain = factories.MailDomainEnabledFactory()
+
+    response = _post_import(
+        APIClient(),
+        domain,
+        CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n",
+        "text/csv",
+    )
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert not models.Mailbox.objects.exists()
+
+
+def test_api_mailboxes_import__viewer():
+    """Viewers of a domain should not be allowed to import mailboxes."""
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain, enums.MailDomainRoleChoices.VIEWER)
+
+    response = _post_import(
+        client, domain, CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n", "text/csv"
+    )
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert not models.MailboxImport.objects.exists()
+
+
+def test_api_mailboxes_import__unsupported_media_type():
+    """Only CSV and JSON lines uploads should be imported."""
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+
+    response = _post_import(client, domain, "<mailboxes/>", "application/xml")
+
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    assert not models.MailboxImport.objects.exists()
+
+
+def test_api_mailboxes_import__disabled_domain():
+    """Mailboxes should not be imported into a disabled domain."""
+    domain = factories.MailDomainFactory(status=enums.MailDomainStatusChoices.DISABLED)
+    client = _get_client(domain)
+
+    response = _post_import(
+        client, domain, CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n", "text/csv"
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not models.Mailbox.objects.exists()
+
+
+def test_api_mailboxes_import__background(django_capture_on_commit_callbacks):
+    """
+    The upload should be stored and the import returned at once, its mailboxes being
+    imported in the background once the upload is committed.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+
+    with (
+        mock.patch.object(import_mailboxes_upload, "delay") as delay_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(
+            client,
+            domain,
+            CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n",
+            "text/csv",
+        )
+
+        delay_mock.assert_not_called()
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    content = response.json()
+    assert content["status"] == enums.MailboxImportStatusChoices.RUNNING
+    assert (content["total"], content["created"], content["skipped"]) == (0, 0, 0)
+    assert not models.Mailbox.objects.exists()
+
+    mailbox_import = models.MailboxImport.objects.get(pk=content["id"])
+    assert mailbox_import.media_type == "text/csv"
+    with mailbox_import.upload.open("rb") as upload:
+        assert (
+            upload.read()
+            == (CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n").encode()
+        )
+    delay_mock.assert_called_once_with(str(mailbox_import.pk), mock.ANY)
+
+
+def test_api_mailboxes_import__csv(django_capture_on_commit_callbacks):
+    """
+    Valid and new mailboxes of a CSV upload should be created pending and queued for
+    provisioning, the other ones being skipped with their errors.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    factories.MailboxFactory(domain=domain, local_part="grace")
+    client = _get_client(domain)
+
+    body = (
+        CSV_HEADER
+        + "Ada,Lovelace,ada,ada@example.com\n"
+        + "Grace,Hopper,grace,grace@example.com\n"
+        + "Alan,Turing,alan,not an email\n"
+        + "Ada,Byron,ada,ada.byron@example.com\n"
+        + '"Katherine","Johnson","katherine","katherine@example.com"\n'
+    )
+    with (
+        mock.patch.object(provision_mailboxes, "delay") as delay_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(client, domain, body, "text/csv; charset=utf-8")
+
+    mailbox_import = models.MailboxImport.objects.get()
+    assert _get_import(client, domain, response) == {
+        "id": str(mailbox_import.pk),
+        "status": enums.MailboxImportStatusChoices.DONE,
+        "total": 5,
+        "created": 2,
+        "skipped": 3,
+        "errors": [
+            {"line": 3, "errors": {"local_part": ["This mailbox already exists."]}},
+            {
+                "line": 4,
+                "errors": {"secondary_email": ["Enter a valid email address."]},
+            },
+            {"line": 5, "errors": {"local_part": ["This mailbox is imported twice."]}},
+        ],
+        "created_at": mailbox_import.created_at.isoformat().replace("+00:00", "Z"),
+        "updated_at": mailbox_import.updated_at.isoformat().replace("+00:00", "Z"),
+    }
+
+    mailboxes = models.Mailbox.objects.filter(local_part__in=["ada", "katherine"])
+    assert {mailbox.status for mailbox in mailboxes} == {
+        enums.MailboxStatusChoices.PENDING
+    }
+    assert mailboxes.get(local_part="ada").secondary_email == "ada@example.com"
+    # The upload is deleted once imported
+    assert not mailbox_import.upload
+    delay_mock.assert_called_once()
+    assert set(delay_mock.call_args.args[0]) == {
+        str(mailbox.pk) for mailbox in mailboxes
+    }
+
+
+def test_api_mailboxes_import__jsonl_batches(
+    django_capture_on_commit_callbacks, django_assert_num_queries
+):
+    """
+    Mailboxes of a JSON lines upload should be imported by batches, with a constant
+    number of queries per batch, each batch being queued for provisioning.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+    lines = [
+        json.dumps(
+            {
+                "first_name": "John",
+                "last_name": f"Doe {index}",
+                "local_part": f"john.doe{index}",
+                "secondary_email": f"john.doe{index}@example.com",
+            }
+        )
+        for index in range(5)
+    ]
+    lines[2:2] = ["", "[not json", '["not", "an", "object"]']
+    body = "\n".join(lines) + "\n"
+
+    with (
+        mock.patch(
+            "mailbox_manager.utils.bulk_import.MAILBOX_BULK_IMPORT_BATCH_SIZE", 4
+        ),
+        mock.patch.object(provision_mailboxes, "delay") as delay_mock,
+    ):
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = _post_import(client, domain, body, "application/jsonl")
+
+        with (
+            django_capture_on_commit_callbacks(execute=True),
+            # import, then for each of the 2 batches: existing mailboxes, savepoint,
+            # insert, mailboxes inserted, progress, release savepoint, and the final
+            # status and the deletion of the upload
+            django_assert_num_queries(15),
+        ):
+            for callback in callbacks:
+                callback()
+
+    content = _get_import(client, domain, response)
+    assert content["status"] == enums.MailboxImportStatusChoices.DONE
+    assert (content["total"], content["created"], content["skipped"]) == (7, 5, 2)
+    assert [error["line"] for error in content["errors"]] == [4, 5]
+    assert models.Mailbox.objects.filter(domain=domain).count() == 5
+    assert [len(call.args[0]) for call in delay_mock.call_args_list] == [2, 3]
+
+
+def test_api_mailboxes_import__created_meanwhile(django_capture_on_commit_callbacks):
+    """
+    Mailboxes created by another request while importing them should be skipped,
+    and not provisioned.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+    bulk_create = models.Mailbox.objects.bulk_create
+
+    def concurrent_bulk_create(mailboxes, *args, **kwargs):
+        factories.MailboxFactory(domain=domain, local_part="grace")
+        return bulk_create(mailboxes, *args, **kwargs)
+
+    with (
+        mock.patch.object(
+            models.Mailbox.objects, "bulk_create", side_effect=concurrent_bulk_create
+        ),
+        mock.patch.object(provision_mailboxes, "delay") as delay_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(
+            client,
+            domain,
+            CSV_HEADER
+            + "Ada,Lovelace,ada,ada@example.com\n"
+            + "Grace,Hopper,grace,grace@example.com\n",
+            "text/csv",
+        )
+
+    content = _get_import(client, domain, response)
+    assert (content["total"], content["created"], content["skipped"]) == (2, 1, 1)
+    assert content["errors"] == [
+        {"line": 3, "errors": {"local_part": ["This mailbox already exists."]}}
+    ]
+    ada = models.Mailbox.objects.get(domain=domain, local_part="ada")
+    delay_mock.assert_called_once_with([str(ada.pk)], mock.ANY)
+
+
+def test_api_mailboxes_import__pending_domain(django_capture_on_commit_callbacks):
+    """Mailboxes of a domain not enabled yet should not be provisioned."""
+    domain = factories.MailDomainFactory(status=enums.MailDomainStatusChoices.PENDING)
+    client = _get_client(domain)
+
+    with (
+        mock.patch.object(provision_mailboxes, "delay") as delay_mock,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(
+            client,
+            domain,
+            CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n",
+            "text/csv",
+        )
+
+    assert _get_import(client, domain, response)["created"] == 1
+    delay_mock.assert_not_called()
+
+
+def test_api_mailboxes_import__unreadable_upload(django_capture_on_commit_callbacks):
+    """
+    An upload which cannot be decoded should fail the import, keeping the mailboxes
+    already imported.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+    body = (CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n").encode() + b"\xff\xfe"
+
+    with (
+        mock.patch(
+            "mailbox_manager.utils.bulk_import.MAILBOX_BULK_IMPORT_BATCH_SIZE", 1
+        ),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(client, domain, body, "text/csv")
+
+    content = _get_import(client, domain, response)
+    assert content["status"] == enums.MailboxImportStatusChoices.FAILED
+    assert content["created"] == 1
+    assert content["errors"][0]["line"] is None
+    assert models.Mailbox.objects.filter(domain=domain, local_part="ada").exists()
+
+
+def test_api_mailboxes_import__unexpected_error(django_capture_on_commit_callbacks):
+    """
+    An unexpected error, of the database for instance, should fail the import before
+    being raised, so that it does not look running forever, and delete its upload.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    client = _get_client(domain)
+
+    with (
+        mock.patch.object(import_mailboxes_upload, "delay"),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        response = _post_import(
+            client,
+            domain,
+            CSV_HEADER + "Ada,Lovelace,ada,ada@example.com\n",
+            "text/csv",
+        )
+
+    with (
+        mock.patch(
+            "mailbox_manager.utils.bulk_import._get_new_mailboxes",
+            side_effect=DatabaseError("connection lost"),
+        ),
+        pytest.raises(DatabaseError),
+    ):
+        import_mailboxes_upload(response.json()["id"])
+
+    content = _get_import(client, domain, response)
+    assert content["status"] == enums.MailboxImportStatusChoices.FAILED
+    assert content["errors"] == [
+        {"line": None, "errors": {"__all__": ["The import failed unexpectedly."]}}
+    ]
+    assert not models.Mailbox.objects.exists()
+    assert not models.MailboxImport.objects.get(pk=response.json()["id"]).upload
+
+
+def test_api_mailboxes_import__retrieve():
+    """Users having access to a domain should follow the progress of its imports."""
+    domain = factories.MailDomainEnabledFactory()
+    mailbox_import = models.MailboxImport.objects.create(
+        domain=domain, total=10, created=8, skipped=2
+    )
+    other_import = models.MailboxImport.objects.create(
+        domain=factories.MailDomainEnabledFactory()
+    )
+    client = _get_client(domain, enums.MailDomainRoleChoices.VIEWER)
+
+    response = client.get(
+        f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/{mailbox_import.pk}/"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == enums.MailboxImportStatusChoices.RUNNING
+    assert (response.json()["created"], response.json()["skipped"]) == (8, 2)
+
+    response = client.get(
+        f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/{other_import.pk}/"
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.get(f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/")
+    assert [result["id"] for result in response.json()["results"]] == [
+        str(mailbox_import.pk)
+    ]
+
+
+def test_api_mailboxes_import__retrieve_no_access():
+    """Users without access to a domain should not see its imports."""
+    domain = factories.MailDomainEnabledFactory()
+    mailbox_import = models.MailboxImport.objects.create(domain=domain)
+    client = APIClient()
+    client.force_login(core_factories.UserFactory())
+
+    response = client.get(
+        f"/api/v1.0/mail-domains/{domain.slug}/mailbox-imports/{mailbox_import.pk}/"
+    )
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -94,3 +94,24 @@ def test_api_mailboxes__list_non_existing():
 
     response = client.get("/api/v1.0/mail-domains/nonexistent.domain/mailboxes/")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_api_mailboxes__list_search_local_part():
+    """Mailboxes should be filtered by local part, ignoring case."""
+    mail_domain = factories.MailDomainEnabledFactory()
+    mailbox = factories.MailboxEnabledFactory(
+        domain=mail_domain, local_part="jean.dupont"
+    )
+    factories.MailboxEnabledFactory(domain=mail_domain, local_part="marie.martin")
+
+    access = factories.MailDomainAccessFactory(
+        role=enums.MailDomainRoleChoices.VIEWER, domain=mail_domain
+    )
+    client = APIClient()
+    client.force_login(access.user)
+
+    response = client.get(
+        f"/api/v1.0/mail-domains/{mail_domain.slug}/mailboxes/?q=DUPON"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["id"] for result in response.json()["results"]] == [str(mailbox.id)]
@@ -2,6 +2,7 @@
 
 import json
 import re
+import time
 from io import StringIO
 
 from django.core.management import call_command
@@ -67,3 +68,51 @@ def test_fetch_domain_status():
     assert domain_disabled.status == enums.MailDomainStatusChoices.DISABLED
     assert output.getvalue().count("CHECKED") == 1
     assert output.getvalue().count("UPDATED") == 2
+
+
+@responses.activate
+def test_fetch_domain_status_concurrent(settings):
+    """
+    Domains should be checked concurrently, their status updated at once and a
+    summary of the run printed, failed checks not stopping the others.
+    """
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 0
+    domains = factories.MailDomainFactory.create_batch(5)
+    domain_error = factories.MailDomainEnabledFactory()
+
+    def slow_check(request):
+        time.sleep(0.2)
+        body = CHECK_DOMAIN_OK.copy()
+        body["name"] = request.url.split("/")[-3]
+        return (200, {}, json.dumps(body))
+
+    for domain in domains:
+        responses.add_callback(
+            responses.GET,
+            re.compile(rf".*/domains/{domain.name}/check/"),
+            callback=slow_check,
+            content_type="application/json",
+        )
+    responses.add(
+        responses.GET,
+        re.compile(rf".*/domains/{domain_error.name}/check/"),
+        body=json.dumps({"detail": "Internal error"}),
+        status=500,
+        content_type="application/json",
+    )
+
+    output = StringIO()
+    start = time.monotonic()
+    call_command("fetch_domain_status", "--workers", "6", stdout=output)
+    assert time.monotonic() - start < 0.6
+
+    for domain in domains:
+        domain.refresh_from_db()
+        assert domain.status == enums.MailDomainStatusChoices.ENABLED
+    domain_error.refresh_from_db()
+    assert domain_error.status == enums.MailDomainStatusChoices.ENABLED
+
+    assert output.getvalue().count("UPDATED") == 5
+    assert f"Fetch failed for {domain_error.name}" in output.getvalue()
+    assert "6 domain(s) checked in " in output.getvalue()
+    assert "5 updated, 1 failed." in output.getvalue()
@@ -123,3 +123,21 @@ def test_models_maildomains_get_abilities_viewer():
         "post": False,
         "manage_accesses": False,
     }
+
+
+def test_models_maildomains_get_abilities_preset_role(django_assert_num_queries):
+    """No query is done if the role is preset, e.g., with a query annotation."""
+    access = factories.MailDomainAccessFactory(role=enums.MailDomainRoleChoices.VIEWER)
+    access.domain.user_role = enums.MailDomainRoleChoices.ADMIN
+
+    with django_assert_num_queries(0):
+        abilities = access.domain.get_abilities(access.user)
+
+    assert abilities == {
+        "delete": False,
+        "get": True,
+        "patch": True,
+        "put": True,
+        "post": True,
+        "manage_accesses": True,
+    }
@@ -6,7 +6,7 @@ from django.core.exceptions import ValidationError
 
 import pytest
 
-from mailbox_manager import factories
+from mailbox_manager import enums, factories
 
 pytestmark = pytest.mark.django_db
 
@@ -58,3 +58,44 @@ def test_models_maildomainaccesses__role_cannot_be_null():
     """The "role" field cannot be null."""
     with pytest.raises(ValidationError, match="This field cannot be null"):
         factories.MailDomainAccessFactory(role=None)
+
+
+# ABILITIES
+
+
+def test_models_maildomainaccesses__get_abilities_admin():
+    """Check abilities of an administrator of the domain on an access."""
+    access = factories.MailDomainAccessFactory(role=enums.MailDomainRoleChoices.VIEWER)
+    user = factories.MailDomainAccessFactory(
+        domain=access.domain, role=enums.MailDomainRoleChoices.ADMIN
+    ).user
+
+    assert access.get_abilities(user) == {
+        "get": True,
+        "patch": True,
+        "put": True,
+        "post": True,
+        "delete": True,
+    }
+
+
+def test_models_maildomainaccesses__get_abilities_preset_role(
+    django_assert_num_queries,
+):
+    """No query is done if the role is preset, e.g., with a query annotation."""
+    access = factories.MailDomainAccessFactory(role=enums.MailDomainRoleChoices.VIEWER)
+    user = factories.MailDomainAccessFactory(
+        domain=access.domain, role=enums.MailDomainRoleChoices.VIEWER
+    ).user
+    access.user_role = enums.MailDomainRoleChoices.VIEWER
+
+    with django_assert_num_queries(0):
+        abilities = access.get_abilities(user)
+
+    assert abilities == {
+        "get": True,
+        "patch": False,
+        "put": False,
+        "post": False,
+        "delete": False,
+    }
@@ -0,0 +1,399 @@
+"""Test the celery tasks of the mailbox manager"""
+
+import json
+import re
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.utils import timezone
+
+import pytest
+import requests
+import responses
+
+from core.tasks import send_emails
+from core.utils import mail as mail_utils
+
+from mailbox_manager import enums, factories, tasks
+from mailbox_manager.tests.fixtures.dimail import CHECK_DOMAIN_BROKEN, CHECK_DOMAIN_OK
+
+pytestmark = pytest.mark.django_db
+
+
+def test_tasks_get_domains_to_check(settings):
+    """
+    Domains never checked or not checked recently should be due, pending and failed
+    domains first, then the domains checked the longest time ago.
+    """
+    settings.MAIL_DOMAIN_CHECK_INTERVAL = 3600
+    settings.MAIL_DOMAIN_CHECK_UNHEALTHY_INTERVAL = 60
+    now = timezone.now()
+
+    never_checked = factories.MailDomainEnabledFactory()
+    checked_long_ago = factories.MailDomainEnabledFactory(
+        last_checked_at=now - timedelta(hours=3)
+    )
+    checked_a_while_ago = factories.MailDomainEnabledFactory(
+        last_checked_at=now - timedelta(hours=2)
+    )
+    failed = factories.MailDomainFactory(
+        status=enums.MailDomainStatusChoices.FAILED,
+        last_checked_at=now - timedelta(minutes=2),
+    )
+    pending = factories.MailDomainFactory(
+        status=enums.MailDomainStatusChoices.PENDING,
+        last_checked_at=now - timedelta(minutes=5),
+    )
+    # Not due
+    factories.MailDomainEnabledFactory(last_checked_at=now - timedelta(minutes=30))
+    factories.MailDomainFactory(
+        status=enums.MailDomainStatusChoices.FAILED, last_checked_at=now
+    )
+    factories.MailDomainFactory(status=enums.MailDomainStatusChoices.DISABLED)
+
+    assert list(tasks.get_domains_to_check()) == [
+        pending,
+        failed,
+        never_checked,
+        checked_long_ago,
+        checked_a_while_ago,
+    ]
+
+
+def test_tasks_check_domains_shards(settings):
+    """Due domains should be split between shards, within the batch size."""
+    settings.MAIL_DOMAIN_CHECK_SHARDS = 3
+    settings.MAIL_DOMAIN_CHECK_BATCH_SIZE = 7
+    # Domains are created by name, which faker may draw twice
+    domains = [
+        factories.MailDomainEnabledFactory(name=f"domain{index}.example.com")
+        for index in range(8)
+    ]
+
+    with mock.patch.object(tasks.check_domains_shard, "delay") as delay_mock:
+        assert tasks.check_domains() == 7
+
+    shards = [call.args[0] for call in delay_mock.call_args_list]
+    assert [len(shard) for shard in shards] == [3, 2, 2]
+    checked_ids = {domain_id for shard in shards for domain_id in shard}
+    assert len(checked_ids) == 7
+    assert checked_ids < {str(domain.pk) for domain in domains}
+
+
+def test_tasks_check_domains_nothing_due():
+    """No shard should be sent when no domain is due."""
+    factories.MailDomainEnabledFactory(last_checked_at=timezone.now())
+
+    with mock.patch.object(tasks.check_domains_shard, "delay") as delay_mock:
+        assert tasks.check_domains() == 0
+
+    delay_mock.assert_not_called()
+
+
+@responses.activate
+def test_tasks_check_domains_incremental(settings):
+    """
+    Checked domains should get their status and last check date updated, the next
+    run going on with the domains left over.
+    """
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 0
+    settings.MAIL_DOMAIN_CHECK_SHARDS = 2
+    settings.MAIL_DOMAIN_CHECK_BATCH_SIZE = 2
+    failed = factories.MailDomainFactory(status=enums.MailDomainStatusChoices.FAILED)
+    enabled = factories.MailDomainEnabledFactory()
+    broken = factories.MailDomainEnabledFactory()
+    for domain, body in [
+        (failed, CHECK_DOMAIN_OK),
+        (enabled, CHECK_DOMAIN_OK),
+        (broken, CHECK_DOMAIN_BROKEN),
+    ]:
+        responses.add(
+            responses.GET,
+            re.compile(rf".*/domains/{domain.name}/check/"),
+            body=json.dumps({**body, "name": domain.name}),
+            status=200,
+            content_type="application/json",
+        )
+
+    assert tasks.check_domains() == 2
+    failed.refresh_from_db()
+    assert failed.status == enums.MailDomainStatusChoices.ENABLED
+    assert failed.last_checked_at is not None
+    enabled.refresh_from_db()
+    broken.refresh_from_db()
+    # One of the domains never checked was left over
+    assert [enabled.last_checked_at, broken.last_checked_at].count(None) == 1
+
+    assert tasks.check_domains() == 1
+    enabled.refresh_from_db()
+    broken.refresh_from_db()
+    assert enabled.status == enums.MailDomainStatusChoices.ENABLED
+    assert broken.status == enums.MailDomainStatusChoices.FAILED
+    assert enabled.last_checked_at is not None
+    assert broken.last_checked_at is not None
+
+    # Everything is up to date
+    assert tasks.check_domains() == 0
+
+
+@responses.activate
+def test_tasks_check_domains_shard_failure(settings):
+    """A failed check should not be retried before the next interval."""
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 0
+    domain = factories.MailDomainEnabledFactory()
+    responses.add(
+        responses.GET,
+        re.compile(rf".*/domains/{domain.name}/check/"),
+        body=requests.exceptions.ConnectionError("dimail is down"),
+    )
+
+    assert tasks.check_domains_shard([str(domain.pk)]) == 1
+
+    domain.refresh_from_db()
+    assert domain.status == enums.MailDomainStatusChoices.ENABLED
+    assert domain.last_checked_at is not None
+    assert domain not in tasks.get_domains_to_check()
+
+
+@responses.activate
+def test_tasks_check_domains_shard_malformed_response(settings):
+    """A malformed check response should only fail the check of its domain."""
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 0
+    malformed_domain, domain = factories.MailDomainFactory.create_batch(
+        2, status=enums.MailDomainStatusChoices.PENDING
+    )
+    responses.add(
+        responses.GET,
+        re.compile(rf".*/domains/{malformed_domain.name}/check/"),
+        body="<html>Bad gateway</html>",
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        re.compile(rf".*/domains/{domain.name}/check/"),
+        body=json.dumps(CHECK_DOMAIN_OK),
+        status=200,
+    )
+
+    with mock.patch.object(tasks.logger, "warning") as warning_mock:
+        assert (
+            tasks.check_domains_shard([str(malformed_domain.pk), str(domain.pk)]) == 2
+        )
+
+    warning_mock.assert_called_once()
+    assert warning_mock.call_args.args[1] == malformed_domain.name
+    malformed_domain.refresh_from_db()
+    assert malformed_domain.status == enums.MailDomainStatusChoices.PENDING
+    assert malformed_domain.last_checked_at is not None
+    domain.refresh_from_db()
+    assert domain.status == enums.MailDomainStatusChoices.ENABLED
+
+
+def test_tasks_beat_schedule(settings):
+    """The domain checks should be scheduled with celery beat."""
+    assert settings.CELERY_BEAT_SCHEDULE["check-mail-domains"] == {
+        "task": "mailbox_manager.tasks.check_domains",
+        "schedule": settings.MAIL_DOMAIN_CHECK_SCHEDULE,
+    }
+
+
+def _add_token_response(rsps):
+    """Mock the token granted by dimail."""
+    rsps.add(
+        rsps.GET,
+        re.compile(r".*/token/"),
+        body='{"access_token": "domain_owner_token"}',
+        status=200,
+        content_type="application/json",
+    )
+
+
+def test_tasks_provision_mailbox_conflict(django_capture_on_commit_callbacks):
+    """
+    A mailbox already created by a previous attempt should be enabled without
+    sending its information again.
+    """
+    mailbox = factories.MailboxFactory()
+
+    with responses.RequestsMock() as rsps:
+        _add_token_response(rsps)
+        rsps.add(
+            rsps.POST,
+            re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/"),
+            body='{"detail": "Mailbox already exists"}',
+            status=409,
+            content_type="application/json",
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            assert (
+                tasks.provision_mailbox.apply(args=[str(mailbox.pk)]).get()
+                == enums.MailboxStatusChoices.ENABLED
+            )
+
+    # pylint: disable-next=no-member
+    assert len(mail.outbox) == 0
+    mailbox.refresh_from_db()
+    assert mailbox.status == enums.MailboxStatusChoices.ENABLED
+
+
+def test_tasks_provision_mailbox_idempotent(settings):
+    """
+    Mailboxes no longer pending, or still being provisioned by another worker after
+    all the retries, should not be created again.
+    """
+    settings.MAILBOX_PROVISIONING_MAX_RETRIES = 2
+    enabled = factories.MailboxEnabledFactory()
+    pending = factories.MailboxFactory()
+
+    with responses.RequestsMock():  # any call to dimail would fail
+        assert tasks.provision_mailbox.apply(args=[str(enabled.pk)]).get() is None
+
+        cache.add(f"mailbox_provisioning:{pending.pk}", "another-task")
+        try:
+            with mock.patch.object(
+                tasks.cache, "add", wraps=cache.add
+            ) as cache_add_mock:
+                assert (
+                    tasks.provision_mailbox.apply(args=[str(pending.pk)]).get() is None
+                )
+        finally:
+            cache.delete(f"mailbox_provisioning:{pending.pk}")
+
+    assert cache_add_mock.call_count == 3
+    pending.refresh_from_db()
+    assert pending.status == enums.MailboxStatusChoices.PENDING
+
+
+def test_tasks_provision_mailbox_locked():
+    """
+    A mailbox being provisioned by another worker should be provisioned again later,
+    in case that worker died before provisioning it.
+    """
+    mailbox = factories.MailboxFactory()
+
+    with responses.RequestsMock() as rsps:
+        _add_token_response(rsps)
+        rsps.add(
+            rsps.POST,
+            re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/"),
+            body=str({"email": f"ada@{mailbox.domain.name}", "password": "newpass"}),
+            status=201,
+            content_type="application/json",
+        )
+        with (
+            mock.patch.object(tasks.cache, "add", side_effect=[False, True]),
+            mock.patch.object(
+                tasks.provision_mailbox, "retry", wraps=tasks.provision_mailbox.retry
+            ) as retry_mock,
+        ):
+            assert (
+                tasks.provision_mailbox.apply(args=[str(mailbox.pk)]).get()
+                == enums.MailboxStatusChoices.ENABLED
+            )
+
+    assert isinstance(
+        retry_mock.call_args.kwargs["exc"], tasks.MailboxProvisioningLockedError
+    )
+    mailbox.refresh_from_db()
+    assert mailbox.status == enums.MailboxStatusChoices.ENABLED
+
+
+def test_tasks_provision_mailbox_retry(settings):
+    """Mailboxes should be provisioned again when dimail is unreachable."""
+    settings.MAILBOX_PROVISIONING_MAX_RETRIES = 1
+    settings.MAIL_PROVISIONING_API_MAX_RETRIES = 0
+    mailbox = factories.MailboxFactory()
+
+    with responses.RequestsMock() as rsps:
+        _add_token_response(rsps)
+        creation = rsps.add(
+            rsps.POST,
+            re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/"),
+            body=requests.exceptions.ConnectionError("dimail is down"),
+        )
+        with mock.patch.object(tasks.logger, "error") as mock_error:
+            assert (
+                tasks.provision_mailbox.apply(args=[str(mailbox.pk)]).get()
+                == enums.MailboxStatusChoices.FAILED
+            )
+
+    assert creation.call_count == 2
+    assert mock_error.call_count == 1
+    mailbox.refresh_from_db()
+    assert mailbox.status == enums.MailboxStatusChoices.FAILED
+
+
+def test_tasks_provision_mailboxes_notifications():
+    """
+    The information of the mailboxes of a batch should be sent together over a single
+    connection to the mail relay, without their passwords going through the broker.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    mailboxes = factories.MailboxFactory.create_batch(3, domain=domain)
+
+    with responses.RequestsMock() as rsps:
+        _add_token_response(rsps)
+        rsps.add(
+            rsps.POST,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=str({"email": f"mailbox@{domain.name}", "password": "newpass"}),
+            status=201,
+            content_type="application/json",
+        )
+        with (
+            mock.patch.object(
+                mail_utils.mail, "get_connection", wraps=mail.get_connection
+            ) as get_connection_mock,
+            mock.patch.object(send_emails, "delay") as send_emails_mock,
+        ):
+            assert (
+                tasks.provision_mailboxes.apply(
+                    args=[[str(mailbox.pk) for mailbox in mailboxes]]
+                ).get()
+                == 3
+            )
+
+    get_connection_mock.assert_called_once()
+    send_emails_mock.assert_not_called()
+    # pylint: disable-next=no-member
+    emails = mail.outbox
+    assert {email.to[0] for email in emails} == {
+        mailbox.secondary_email for mailbox in mailboxes
+    }
+    assert all("newpass" in email.body for email in emails)
+    for mailbox in mailboxes:
+        mailbox.refresh_from_db()
+        assert mailbox.status == enums.MailboxStatusChoices.ENABLED
+
+
+def test_tasks_provision_mailboxes_retry():
+    """
+    Mailboxes of a batch which could not be provisioned yet should be provisioned again
+    each in its own task.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    mailbox = factories.MailboxFactory(domain=domain)
+
+    with responses.RequestsMock() as rsps:
+        _add_token_response(rsps)
+        rsps.add(
+            rsps.POST,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body='{"detail": "Service unavailable"}',
+            status=503,
+            content_type="application/json",
+        )
+        with mock.patch.object(
+            tasks.provision_mailbox, "apply_async"
+        ) as apply_async_mock:
+            tasks.provision_mailboxes.apply(args=[[str(mailbox.pk)]]).get()
+
+    apply_async_mock.assert_called_once_with(
+        args=[str(mailbox.pk), None], countdown=mock.ANY, retries=1
+    )
+    # pylint: disable-next=no-member
+    assert len(mail.outbox) == 0
+    mailbox.refresh_from_db()
+    assert mailbox.status == enums.MailboxStatusChoices.PENDING
@@ -4,16 +4,27 @@ Unit tests for dimail client
 
 import json
 import re
+import threading
+import time
 from email.errors import HeaderParseError, NonASCIILocalPartDefect
 from logging import Logger
 from unittest import mock
 
+from django.core import exceptions
+
+import jwt
 import pytest
+import requests
 import responses
 from rest_framework import status
 
 from mailbox_manager import enums, factories, models
-from mailbox_manager.utils.dimail import DimailAPIClient
+from mailbox_manager.utils.dimail import (
+    DimailAPIClient,
+    RateLimiter,
+    get_dimail_transport,
+    get_domain_check_rate_limiter,
+)
 
 from .fixtures.dimail import CHECK_DOMAIN_BROKEN, CHECK_DOMAIN_OK
 
@@ -43,7 +54,7 @@ def test_dimail_synchronization__already_sync():
         rsps.add(
             rsps.GET,
             re.compile(rf".*/domains/{domain.name}/mailboxes/"),
-            body=str(
+            body=json.dumps(
                 [
                     {
                         "type": "mailbox",
@@ -121,7 +132,7 @@ def test_dimail_synchronization__synchronize_mailboxes(mock_warning):
         rsps.add(
             rsps.GET,
             re.compile(rf".*/domains/{domain.name}/mailboxes/"),
-            body=str(
+            body=json.dumps(
                 [
                     mailbox_valid,
                     mailbox_with_wrong_domain,
@@ -159,6 +170,218 @@ def test_dimail_synchronization__synchronize_mailboxes(mock_warning):
         assert imported_mailboxes == [mailbox_valid["email"]]
 
 
+def test_dimail_synchronization__bulk_import(django_assert_num_queries):
+    """
+    Mailboxes missing on our end should be validated and created at once, whatever
+    their number, skipping invalid and duplicate mailboxes.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    existing_mailbox = factories.MailboxFactory(domain=domain)
+
+    def dimail_mailbox(local_part):
+        return {
+            "type": "mailbox",
+            "status": "broken",
+            "email": f"{local_part}@{domain.name}",
+            "givenName": "John",
+            "surName": "Doe",
+            "displayName": "John Doe",
+        }
+
+    dimail_mailboxes = [dimail_mailbox(f"john.doe{i}") for i in range(100)]
+    dimail_mailboxes += [
+        dimail_mailbox(existing_mailbox.local_part),
+        # duplicate
+        dimail_mailbox("john.doe0"),
+        # forbidden character in local part
+        dimail_mailbox("john+doe"),
+    ]
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "dimail_people_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=json.dumps(dimail_mailboxes),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+
+        with (
+            mock.patch.object(Logger, "warning") as mock_warning,
+            # existing mailboxes, insert and mailboxes inserted
+            django_assert_num_queries(3),
+        ):
+            imported_mailboxes = dimail_client.import_mailboxes(domain)
+
+    assert imported_mailboxes == [f"john.doe{i}@{domain.name}" for i in range(100)]
+    assert models.Mailbox.objects.filter(domain=domain).count() == 101
+    mailbox = models.Mailbox.objects.get(local_part="john.doe42")
+    assert mailbox.first_name == "John"
+    assert mailbox.last_name == "Doe"
+    assert mailbox.secondary_email == f"john.doe42@{domain.name}"
+    assert mailbox.status == enums.MailboxStatusChoices.PENDING
+
+    assert mock_warning.call_count == 1
+    assert mock_warning.call_args[0][1] == f"john+doe@{domain.name}"
+
+
+def test_dimail_synchronization__created_meanwhile():
+    """
+    Mailboxes created on our end while importing them should not be reported as
+    imported.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    dimail_mailboxes = [
+        {
+            "type": "mailbox",
+            "status": "ok",
+            "email": f"{local_part}@{domain.name}",
+            "givenName": "John",
+            "surName": "Doe",
+            "displayName": "John Doe",
+        }
+        for local_part in ["john.doe", "jane.doe"]
+    ]
+    bulk_create = models.Mailbox.objects.bulk_create
+
+    def concurrent_bulk_create(mailboxes, *args, **kwargs):
+        factories.MailboxFactory(domain=domain, local_part="jane.doe")
+        return bulk_create(mailboxes, *args, **kwargs)
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "dimail_people_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=json.dumps(dimail_mailboxes),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+
+        with mock.patch.object(
+            models.Mailbox.objects, "bulk_create", side_effect=concurrent_bulk_create
+        ):
+            imported_mailboxes = dimail_client.import_mailboxes(domain)
+
+    assert imported_mailboxes == [f"john.doe@{domain.name}"]
+    assert models.Mailbox.objects.filter(domain=domain).count() == 2
+
+
+def test_dimail_synchronization__resume_interrupted_import():
+    """
+    Mailboxes should be imported by chunks, so that an interrupted import resumes
+    from the last chunk imported.
+    """
+    domain = factories.MailDomainEnabledFactory()
+    dimail_mailboxes = json.dumps(
+        [
+            {
+                "type": "mailbox",
+                "status": "broken",
+                "email": f"john.doe{i}@{domain.name}",
+                "givenName": "John",
+                "surName": "Doe",
+                "displayName": "John Doe",
+            }
+            for i in range(5)
+        ]
+    )
+
+    dimail_client = DimailAPIClient()
+    with (
+        mock.patch("mailbox_manager.utils.dimail.MAILBOX_IMPORT_BATCH_SIZE", 2),
+        responses.RequestsMock() as rsps,
+    ):
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "dimail_people_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        # The download is interrupted in the middle of the fourth mailbox
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=dimail_mailboxes[: dimail_mailboxes.index("john.doe3")],
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        with pytest.raises(json.JSONDecodeError):
+            dimail_client.import_mailboxes(domain)
+
+        # Only complete chunks were imported
+        assert set(models.Mailbox.objects.values_list("local_part", flat=True)) == {
+            "john.doe0",
+            "john.doe1",
+        }
+
+        rsps.replace(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=dimail_mailboxes,
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        imported_mailboxes = dimail_client.import_mailboxes(domain)
+
+    assert imported_mailboxes == [f"john.doe{i}@{domain.name}" for i in range(2, 5)]
+    assert models.Mailbox.objects.filter(domain=domain).count() == 5
+
+
+def test_dimail_synchronization__disabled_domain():
+    """No mailbox should be imported to a disabled domain."""
+    domain = factories.MailDomainFactory(status=enums.MailDomainStatusChoices.DISABLED)
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "dimail_people_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/mailboxes/"),
+            body=json.dumps(
+                [
+                    {
+                        "type": "mailbox",
+                        "status": "broken",
+                        "email": f"john.doe@{domain.name}",
+                        "givenName": "John",
+                        "surName": "Doe",
+                        "displayName": "John Doe",
+                    }
+                ]
+            ),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+
+        with pytest.raises(exceptions.ValidationError):
+            dimail_client.import_mailboxes(domain)
+
+    assert not models.Mailbox.objects.exists()
+
+
 def test_dimail__fetch_domain_status_from_dimail():
     """Request to dimail health status of a domain"""
     domain = factories.MailDomainEnabledFactory()
@@ -176,6 +399,9 @@ def test_dimail__fetch_domain_status_from_dimail():
         response = dimail_client.fetch_domain_status(domain)
         assert response.status_code == status.HTTP_200_OK
         assert domain.status == enums.MailDomainStatusChoices.FAILED
+        domain.refresh_from_db()
+        assert domain.status == enums.MailDomainStatusChoices.FAILED
+        assert domain.last_checked_at is not None
 
         # Now domain is ok again
         body_content = CHECK_DOMAIN_OK.copy()
@@ -190,3 +416,257 @@ def test_dimail__fetch_domain_status_from_dimail():
         response = dimail_client.fetch_domain_status(domain)
         assert response.status_code == status.HTTP_200_OK
         assert domain.status == enums.MailDomainStatusChoices.ENABLED
+
+
+def test_dimail__token_cached_per_user():
+    """Tokens should be requested once per user and reused for the next calls."""
+    mailbox = factories.MailboxEnabledFactory()
+    url = re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/.*")
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsp_token = rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "dimail_people_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsp_mailbox = rsps.add(rsps.PATCH, url, status=status.HTTP_200_OK)
+
+        dimail_client.disable_mailbox(mailbox, "user-sub")
+        dimail_client.enable_mailbox(mailbox, "user-sub")
+        assert rsp_token.call_count == 1
+
+        dimail_client.disable_mailbox(mailbox, "other-user-sub")
+        assert rsp_token.call_count == 2
+        assert rsp_mailbox.call_count == 3
+        assert rsps.calls[1].request.headers["Authorization"] == (
+            "Bearer dimail_people_token"
+        )
+
+
+@pytest.mark.parametrize("expires_in, cached", [(5, False), (3600, True)])
+def test_dimail__token_cache_bounded_by_expiration(expires_in, cached):
+    """Tokens should not be used from cache once they expired."""
+    mailbox = factories.MailboxEnabledFactory()
+    token = jwt.encode(
+        {"sub": "user-sub", "exp": int(time.time()) + expires_in}, "secret"
+    )
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsp_token = rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body=json.dumps({"access_token": token}),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.PATCH,
+            re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/.*"),
+            status=status.HTTP_200_OK,
+        )
+
+        dimail_client.disable_mailbox(mailbox, "user-sub")
+        dimail_client.disable_mailbox(mailbox, "user-sub")
+
+        assert rsp_token.call_count == (1 if cached else 2)
+
+
+def test_dimail__token_refreshed_when_rejected():
+    """A cached token rejected by dimail should be replaced by a new one."""
+    mailbox = factories.MailboxEnabledFactory()
+    url = re.compile(rf".*/domains/{mailbox.domain.name}/mailboxes/.*")
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "expired_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.GET,
+            re.compile(r".*/token/"),
+            body='{"access_token": "new_token"}',
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(rsps.PATCH, url, status=status.HTTP_200_OK)
+        rsps.add(rsps.PATCH, url, status=status.HTTP_401_UNAUTHORIZED)
+        rsps.add(rsps.PATCH, url, status=status.HTTP_200_OK)
+        rsps.add(rsps.PATCH, url, status=status.HTTP_200_OK)
+
+        dimail_client.disable_mailbox(mailbox)
+        response = dimail_client.disable_mailbox(mailbox)
+        assert response.status_code == status.HTTP_200_OK
+        dimail_client.disable_mailbox(mailbox)
+
+        assert [
+            call.request.headers["Authorization"]
+            for call in rsps.calls
+            if call.request.method == "PATCH"
+        ] == [
+            "Bearer expired_token",
+            "Bearer expired_token",
+            "Bearer new_token",
+            "Bearer new_token",
+        ]
+
+
+def test_dimail__rate_limiter():
+    """The rate limiter should space out calls made from several threads."""
+    rate_limiter = RateLimiter(20)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=rate_limiter.wait) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The first call is immediate, the next ones are spaced out by 50ms
+    assert 0.2 <= time.monotonic() - start < 0.4
+
+    unlimited = RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        unlimited.wait()
+    assert time.monotonic() - start < 0.1
+
+
+def test_dimail__domain_check_rate_limiter(settings):
+    """The rate limiter of the domain checks should follow the rate of the settings."""
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 20
+    assert get_domain_check_rate_limiter().interval == 0.05
+    assert get_domain_check_rate_limiter() is get_domain_check_rate_limiter()
+
+    settings.MAIL_DOMAIN_CHECK_RATE_LIMIT = 0
+    assert get_domain_check_rate_limiter().interval == 0
+
+
+def test_dimail__transport_stats_and_timeouts(settings):
+    """
+    Requests should be sent with the connect and read timeouts of the settings, and
+    counted with their status per endpoint.
+    """
+    settings.MAIL_PROVISIONING_API_CONNECT_TIMEOUT = 2
+    settings.MAIL_PROVISIONING_API_READ_TIMEOUT = 7
+    domains = factories.MailDomainEnabledFactory.create_batch(2)
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domains[0].name}/check/"),
+            body=json.dumps({**CHECK_DOMAIN_OK, "name": domains[0].name}),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domains[1].name}/check/"),
+            body='{"detail": "Not found"}',
+            status=status.HTTP_404_NOT_FOUND,
+            content_type="application/json",
+        )
+        rsps.add(
+            rsps.POST,
+            re.compile(r".*/users/"),
+            body=requests.exceptions.ConnectionError(),
+        )
+
+        dimail_client.check_domain(domains[0])
+        with pytest.raises(requests.exceptions.HTTPError):
+            dimail_client.check_domain(domains[1])
+        with pytest.raises(requests.exceptions.ConnectionError):
+            dimail_client.create_user("user-sub")
+
+        assert {call.request.req_kwargs["timeout"] for call in rsps.calls} == {(2, 7)}
+
+    stats = get_dimail_transport().stats
+    assert stats["/domains/{name}/check/"]["requests"] == 2
+    assert stats["/domains/{name}/check/"]["errors"] == 0
+    assert stats["/domains/{name}/check/"][200] == 1
+    assert stats["/domains/{name}/check/"][404] == 1
+    assert stats["/domains/{name}/check/"]["duration"] > 0
+    assert stats["/users/"]["requests"] == 1
+    assert stats["/users/"]["errors"] == 1
+    assert stats["/users/"]["no_response"] == 1
+
+
+def test_dimail__transport_retries_idempotent_requests(settings):
+    """Only idempotent requests should be retried on gateway errors."""
+    settings.MAIL_PROVISIONING_API_MAX_RETRIES = 2
+    domain = factories.MailDomainEnabledFactory()
+
+    dimail_client = DimailAPIClient()
+    with responses.RequestsMock() as rsps:
+        rsp_check = rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/check/"),
+            body='{"detail": "Bad gateway"}',
+            status=status.HTTP_502_BAD_GATEWAY,
+            content_type="application/json",
+        )
+        rsp_user = rsps.add(
+            rsps.POST,
+            re.compile(r".*/users/"),
+            body='{"detail": "Bad gateway"}',
+            status=status.HTTP_502_BAD_GATEWAY,
+            content_type="application/json",
+        )
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            dimail_client.check_domain(domain)
+        with pytest.raises(requests.exceptions.HTTPError):
+            dimail_client.create_user("user-sub")
+
+        assert rsp_check.call_count == 3
+        assert rsp_user.call_count == 1
+
+
+@mock.patch.object(Logger, "warning")
+def test_dimail__transport_logs_slow_requests(mock_warning, settings):
+    """Requests slower than the setting should be logged as warnings."""
+    settings.MAIL_PROVISIONING_API_SLOW_REQUEST_DURATION = 0
+    domain = factories.MailDomainEnabledFactory()
+
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            rsps.GET,
+            re.compile(rf".*/domains/{domain.name}/check/"),
+            body=json.dumps({**CHECK_DOMAIN_OK, "name": domain.name}),
+            status=status.HTTP_200_OK,
+            content_type="application/json",
+        )
+        DimailAPIClient().check_domain(domain)
+
+    assert mock_warning.call_count == 1
+    assert mock_warning.call_args[0][:4] == (
+        "[DIMAIL] %s %s: %s in %.3fs",
+        "GET",
+        "/domains/{name}/check/",
+        200,
+    )
+
+
+def test_dimail__transport_pool_size(settings):
+    """The pool should allow a connection per gunicorn thread or domain check."""
+    settings.MAIL_PROVISIONING_API_POOL_MAXSIZE = 0
+    settings.MAIL_DOMAIN_CHECK_MAX_WORKERS = 4
+    settings.GUNICORN_THREADS = 8
+
+    with mock.patch.object(
+        requests.adapters, "HTTPAdapter", wraps=requests.adapters.HTTPAdapter
+    ) as adapter_mock:
+        get_dimail_transport()
+        assert adapter_mock.call_args.kwargs["pool_maxsize"] == 8
+
+        settings.MAIL_PROVISIONING_API_POOL_MAXSIZE = 20
+        get_dimail_transport()
+        assert adapter_mock.call_args.kwargs["pool_maxsize"] == 20
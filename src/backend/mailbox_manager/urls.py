@@ -23,6 +23,11 @@ maildomain_related_router.register(
     viewsets.MailBoxViewSet,
     basename="mailboxes",
 )
+maildomain_related_router.register(
+    "mailbox-imports",
+    viewsets.MailboxImportViewSet,
+    basename="mailbox-imports",
+)
 
 
 urlpatterns = [
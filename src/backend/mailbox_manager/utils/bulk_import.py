@@ -0,0 +1,261 @@
+"""Bulk import of mailboxes uploaded by the administrators of a mail domain."""
+
+import codecs
+import csv
+import itertools
+import json
+from logging import getLogger
+
+from django.core import exceptions
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from mailbox_manager import enums, models
+from mailbox_manager.tasks import provision_mailboxes
+
+logger = getLogger(__name__)
+
+# Number of mailboxes validated and inserted at once, then queued for provisioning
+MAILBOX_BULK_IMPORT_BATCH_SIZE = 1000
+# Number of errors kept on an import, the next ones are only counted
+MAILBOX_BULK_IMPORT_MAX_ERRORS = 100
+
+MAILBOX_FIELDS = ["first_name", "last_name", "local_part", "secondary_email"]
+
+
+def iter_csv_mailboxes(lines):
+    """
+    Yield the line number and the fields of each mailbox of a CSV document, whose
+    header row names the columns.
+    """
+    reader = csv.DictReader(lines)
+    for fields in reader:
+        yield reader.line_num, fields
+
+
+def iter_jsonl_mailboxes(lines):
+    """
+    Yield the line number and the fields of each mailbox of a JSON lines document,
+    one JSON object per line. The fields of lines which are not valid JSON are None.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            fields = None
+        yield line_number, fields
+
+
+# Readers of the rows of an upload by media type
+READERS = {
+    "text/csv": iter_csv_mailboxes,
+    "application/jsonl": iter_jsonl_mailboxes,
+    "application/x-ndjson": iter_jsonl_mailboxes,
+}
+
+
+def _get_error_messages(error):
+    """Return the messages of a validation error by field, as JSON serializable."""
+    return {
+        field: [str(message) for message in messages]
+        for field, messages in error.message_dict.items()
+    }
+
+
+def _get_existing_mailbox_error(line_number):
+    """Return the error of a row whose mailbox already exists."""
+    return {
+        "line": line_number,
+        "errors": {"local_part": [str(_("This mailbox already exists."))]},
+    }
+
+
+def _save_progress(mailbox_import, fields):
+    """
+    Save the progress of an import with a single query, skipping the validation of
+    its relations done by `save`.
+    """
+    mailbox_import.updated_at = timezone.now()
+    models.MailboxImport.objects.filter(pk=mailbox_import.pk).update(
+        updated_at=mailbox_import.updated_at,
+        **{field: getattr(mailbox_import, field) for field in fields},
+    )
+
+
+def _fail(mailbox_import, message):
+    """Fail an import, recording why with its errors, and save it."""
+    mailbox_import.status = enums.MailboxImportStatusChoices.FAILED
+    if len(mailbox_import.errors) < MAILBOX_BULK_IMPORT_MAX_ERRORS:
+        mailbox_import.errors.append(
+            {"line": None, "errors": {exceptions.NON_FIELD_ERRORS: [message]}}
+        )
+    _save_progress(mailbox_import, ["status", "errors"])
+
+
+def _get_new_mailboxes(domain, rows, seen_local_parts):
+    """
+    Return the line number and the mailbox of the valid rows of a batch which are
+    neither imported twice nor already existing, and the errors of the other rows.
+    """
+    errors = []
+    mailboxes = {}
+    for line_number, fields in rows:
+        if not isinstance(fields, dict):
+            errors.append(
+                {
+                    "line": line_number,
+                    "errors": {
+                        exceptions.NON_FIELD_ERRORS: [
+                            str(_("A mailbox must be an object."))
+                        ]
+                    },
+                }
+            )
+            continue
+
+        mailbox = models.Mailbox(
+            domain=domain,
+            **{field: fields.get(field) or "" for field in MAILBOX_FIELDS},
+        )
+        try:
+            # Uniqueness is checked below for the whole batch
+            mailbox.full_clean(exclude=["domain"], validate_unique=False)
+        except exceptions.ValidationError as error:
+            errors.append({"line": line_number, "errors": _get_error_messages(error)})
+            continue
+
+        if mailbox.local_part in seen_local_parts or mailbox.local_part in mailboxes:
+            errors.append(
+                {
+                    "line": line_number,
+                    "errors": {
+                        "local_part": [str(_("This mailbox is imported twice."))]
+                    },
+                }
+            )
+            continue
+        mailboxes[mailbox.local_part] = line_number, mailbox
+
+    existing_local_parts = set(
+        models.Mailbox.objects.filter(
+            domain=domain, local_part__in=mailboxes
+        ).values_list("local_part", flat=True)
+    )
+    new_mailboxes = []
+    for local_part, (line_number, mailbox) in mailboxes.items():
+        if local_part in existing_local_parts:
+            errors.append(_get_existing_mailbox_error(line_number))
+        else:
+            new_mailboxes.append((line_number, mailbox))
+    seen_local_parts.update(mailboxes)
+    return new_mailboxes, errors
+
+
+def _import_batch(mailbox_import, rows, seen_local_parts, user_sub):
+    """
+    Create the valid and new mailboxes of a batch of rows, record the progress of
+    the import and queue the provisioning of the mailboxes created.
+    """
+    domain = mailbox_import.domain
+    new_mailboxes, errors = _get_new_mailboxes(domain, rows, seen_local_parts)
+
+    with transaction.atomic():
+        # A mailbox created meanwhile by another request is skipped: only the rows
+        # actually inserted bear the ids generated here
+        created_ids = set()
+        if new_mailboxes:
+            models.Mailbox.objects.bulk_create(
+                [mailbox for _line_number, mailbox in new_mailboxes],
+                ignore_conflicts=True,
+            )
+            created_ids = set(
+                models.Mailbox.objects.filter(
+                    pk__in=[mailbox.pk for _line_number, mailbox in new_mailboxes]
+                ).values_list("pk", flat=True)
+            )
+        errors += [
+            _get_existing_mailbox_error(line_number)
+            for line_number, mailbox in new_mailboxes
+            if mailbox.pk not in created_ids
+        ]
+
+        mailbox_import.total += len(rows)
+        mailbox_import.created += len(created_ids)
+        mailbox_import.skipped += len(errors)
+        available = MAILBOX_BULK_IMPORT_MAX_ERRORS - len(mailbox_import.errors)
+        mailbox_import.errors += sorted(errors, key=lambda e: e["line"])[
+            : max(available, 0)
+        ]
+        _save_progress(mailbox_import, ["total", "created", "skipped", "errors"])
+
+        if created_ids and domain.status == enums.MailDomainStatusChoices.ENABLED:
+            mailbox_ids = [
+                str(mailbox.pk)
+                for _line_number, mailbox in new_mailboxes
+                if mailbox.pk in created_ids
+            ]
+            transaction.on_commit(
+                lambda: provision_mailboxes.delay(mailbox_ids, user_sub)
+            )
+
+
+def import_mailboxes(mailbox_import, rows, user_sub=None):
+    """
+    Import mailboxes into the domain of an import from an iterable of line numbers
+    and mailbox fields, as read from an upload.
+
+    Rows are consumed by batches of MAILBOX_BULK_IMPORT_BATCH_SIZE, each validated
+    with a query, inserted then selected again with two others, to skip mailboxes
+    created meanwhile by another request, and committed along with the progress
+    of the import, which can be followed while it goes on. Invalid mailboxes,
+    mailboxes imported twice and existing mailboxes are skipped. An upload which
+    cannot be read any further fails the import, the mailboxes already imported
+    being kept.
+    """
+    seen_local_parts = set()
+    rows = iter(rows)
+    try:
+        while batch := list(itertools.islice(rows, MAILBOX_BULK_IMPORT_BATCH_SIZE)):
+            _import_batch(mailbox_import, batch, seen_local_parts, user_sub)
+    except (ValueError, csv.Error, OSError) as error:
+        logger.warning(
+            "Import of mailboxes of domain %s interrupted after %s rows: %s",
+            mailbox_import.domain.name,
+            mailbox_import.total,
+            error,
+        )
+        _fail(mailbox_import, str(_("The upload could not be read: %s")) % error)
+    else:
+        mailbox_import.status = enums.MailboxImportStatusChoices.DONE
+        _save_progress(mailbox_import, ["status"])
+    return mailbox_import
+
+
+def import_upload(mailbox_import, user_sub=None):
+    """
+    Import the mailboxes of the upload of an import, read with the reader of its
+    media type, then delete the upload.
+
+    An unexpected error, of the database or the storage for instance, fails the
+    import before being raised again, so that it does not look running forever.
+    """
+    reader = READERS[mailbox_import.media_type]
+    try:
+        with mailbox_import.upload.open("rb") as upload:
+            lines = codecs.iterdecode(upload, "utf-8-sig")
+            import_mailboxes(mailbox_import, reader(lines), user_sub)
+    except Exception:
+        logger.exception(
+            "Import of mailboxes of domain %s failed after %s rows",
+            mailbox_import.domain.name,
+            mailbox_import.total,
+        )
+        _fail(mailbox_import, str(_("The import failed unexpectedly.")))
+        raise
+    finally:
+        mailbox_import.upload.delete(save=False)
+        _save_progress(mailbox_import, ["upload"])
+    return mailbox_import
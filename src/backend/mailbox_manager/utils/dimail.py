@@ -1,38 +1,209 @@
 """A minimalist client to synchronize with mailbox provisioning API."""
 
-import ast
+import codecs
+import hashlib
+import itertools
 import json
-import smtplib
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from email.errors import HeaderParseError, NonASCIILocalPartDefect
 from email.headerregistry import Address
+from functools import lru_cache
 from logging import getLogger
+from typing import NamedTuple
 
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core import exceptions, mail
-from django.template.loader import render_to_string
+from django.core import exceptions
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+import jwt
 import requests
 from rest_framework import status
 from urllib3.util import Retry
 
+from core.utils.json_stream import iter_json_array
+from core.utils.mail import build_message, render_email
+
 from mailbox_manager import enums, models
 
 logger = getLogger(__name__)
 
-adapter = requests.adapters.HTTPAdapter(
-    max_retries=Retry(
-        total=4,
-        backoff_factor=0.1,
-        status_forcelist=[500, 502],
-        allowed_methods=["PATCH"],
+# Number of mailboxes inserted per query when importing mailboxes from dimail
+MAILBOX_IMPORT_BATCH_SIZE = 1000
+# Number of bytes read at once from the list of mailboxes sent by dimail
+MAILBOX_IMPORT_CHUNK_SIZE = 64 * 1024
+
+
+class DimailTransport:
+    """
+    Pooled keep-alive session to the mail provisioning API.
+
+    Requests are sent with separate connect and read timeouts. Idempotent requests
+    are retried on connection errors and gateway errors, other requests only when
+    they could not be sent. Each request is counted per endpoint in 'stats', slow
+    requests being logged.
+    """
+
+    # ruff: noqa: PLR0913
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    def __init__(
+        self,
+        pool_maxsize=10,
+        connect_timeout=3,
+        read_timeout=10,
+        max_retries=2,
+        slow_request_duration=2,
+    ):
+        """Configure the connection pool, timeouts and retries of the session."""
+        self.timeout = (connect_timeout, read_timeout)
+        self.slow_request_duration = slow_request_duration
+
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=0.1,
+                status_forcelist=[502, 503, 504],
+                # PATCH requests of dimail set absolute values, they are idempotent
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"PATCH"},
+                raise_on_status=False,
+            ),
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._stats = defaultdict(Counter)
+        self._stats_lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """
+        Get the number of requests, errors, total latency and number of responses
+        per status code for each endpoint.
+        """
+        with self._stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+
+    def request(self, endpoint, method, url, **kwargs):
+        """
+        Send a request and record its latency and status under `endpoint`, the path
+        of the url without its parameters (e.g "/domains/{name}/check/").
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        status_code = None
+        start = time.perf_counter()
+        try:
+            response = self._session.request(method, url, **kwargs)
+            status_code = response.status_code
+        finally:
+            duration = time.perf_counter() - start
+            with self._stats_lock:
+                stats = self._stats[endpoint]
+                stats["requests"] += 1
+                stats["errors"] += int(status_code is None or status_code >= 500)
+                stats["duration"] += duration
+                stats[status_code or "no_response"] += 1
+
+            log = (
+                logger.warning
+                if duration >= self.slow_request_duration
+                else logger.debug
+            )
+            log(
+                "[DIMAIL] %s %s: %s in %.3fs",
+                method,
+                endpoint,
+                status_code or "no response",
+                duration,
+            )
+
+        return response
+
+
+@lru_cache(maxsize=1)
+def get_dimail_transport():
+    """
+    Build the transport to the mail provisioning API, once per process.
+
+    The pool should allow a connection per thread of the process: gunicorn threads
+    (GUNICORN_THREADS) or concurrent domain checks (MAIL_DOMAIN_CHECK_MAX_WORKERS).
+    """
+    return DimailTransport(
+        pool_maxsize=settings.MAIL_PROVISIONING_API_POOL_MAXSIZE
+        or max(settings.GUNICORN_THREADS, settings.MAIL_DOMAIN_CHECK_MAX_WORKERS),
+        connect_timeout=settings.MAIL_PROVISIONING_API_CONNECT_TIMEOUT,
+        read_timeout=settings.MAIL_PROVISIONING_API_READ_TIMEOUT,
+        max_retries=settings.MAIL_PROVISIONING_API_MAX_RETRIES,
+        slow_request_duration=settings.MAIL_PROVISIONING_API_SLOW_REQUEST_DURATION,
     )
-)
 
-session = requests.Session()
-session.mount("http://", adapter)
-session.mount("https://", adapter)
+
+@receiver(setting_changed)
+def reset_dimail_transport(setting, **kwargs):  # pylint: disable=unused-argument
+    """Build the transport to dimail again when its settings change (in tests)."""
+    if setting.startswith("MAIL_PROVISIONING_API_") or setting in (
+        "GUNICORN_THREADS",
+        "MAIL_DOMAIN_CHECK_MAX_WORKERS",
+    ):
+        get_dimail_transport.cache_clear()
+
+
+class RateLimiter:
+    """Space out calls made from several threads to at most `rate` per second."""
+
+    def __init__(self, rate):
+        """Allow `rate` calls per second, or any number of calls if it is 0."""
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        """Wait until the next call is allowed."""
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+@lru_cache(maxsize=1)
+def get_domain_check_rate_limiter():
+    """
+    Build the rate limiter of the domain checks, once per process: all of them are
+    sent to the dimail host.
+    """
+    return RateLimiter(settings.MAIL_DOMAIN_CHECK_RATE_LIMIT)
+
+
+@receiver(setting_changed)
+def reset_domain_check_rate_limiter(setting, **kwargs):  # pylint: disable=unused-argument
+    """Build the domain check rate limiter again when its rate changes (in tests)."""
+    if setting == "MAIL_DOMAIN_CHECK_RATE_LIMIT":
+        get_domain_check_rate_limiter.cache_clear()
+
+
+class DomainCheck(NamedTuple):
+    """Result of the check of a mail domain with dimail."""
+
+    domain: models.MailDomain
+    old_status: str
+    response: requests.Response | None
+    error: Exception | None
+    duration: float
 
 
 class DimailAPIClient:
@@ -41,30 +212,78 @@ class DimailAPIClient:
     API_URL = settings.MAIL_PROVISIONING_API_URL
     API_CREDENTIALS = settings.MAIL_PROVISIONING_API_CREDENTIALS
 
-    def get_headers(self, user_sub=None):
+    # Tokens are not used if they expire in less than this many seconds
+    TOKEN_EXPIRATION_MARGIN = 10
+
+    def get_headers(self, user_sub=None, force_refresh=False):
         """
         Build headers dictionary. Requires MAIL_PROVISIONING_API_CREDENTIALS setting,
         to get a token from dimail /token/ endpoint.
         If provided, request user' sub is used for la regie to log in as this user,
         thus allowing for more precise logs.
+
+        Tokens are cached per user until they expire, within the limit of the
+        MAIL_PROVISIONING_API_TOKEN_CACHE_TIMEOUT setting, to save a call to dimail
+        on each request. Use `force_refresh` to get a new token if it was rejected.
         """
         headers = {"Content-Type": "application/json"}
+        cache_key = self._get_token_cache_key(user_sub)
+
+        token = None if force_refresh else cache.get(cache_key)
+        if token is None:
+            token = self._get_token(user_sub)
+            timeout = self._get_token_cache_timeout(token)
+            if timeout > 0:
+                cache.set(cache_key, token, timeout)
+
+        headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    def _get_token_cache_key(self, user_sub):
+        """
+        Build the cache key of the token of a user, bound to the API credentials so
+        that changing them is enough to stop using tokens they granted.
+        """
+        credentials = hashlib.sha256(str(self.API_CREDENTIALS).encode()).hexdigest()
+        return f"dimail_token:{credentials[:16]}:{user_sub or ''}"
+
+    def _get_token_cache_timeout(self, token):
+        """
+        Get how long a token can be cached, in seconds: it must not outlive its
+        expiration time, when it can be read from the token.
+        """
+        timeout = settings.MAIL_PROVISIONING_API_TOKEN_CACHE_TIMEOUT
+        try:
+            expiration = jwt.decode(token, options={"verify_signature": False}).get(
+                "exp"
+            )
+        except jwt.PyJWTError:
+            expiration = None
+
+        if expiration is not None:
+            timeout = min(
+                timeout, int(expiration - time.time()) - self.TOKEN_EXPIRATION_MARGIN
+            )
+        return timeout
+
+    def _get_token(self, user_sub=None):
+        """Get a new token from dimail /token/ endpoint."""
         params = None
 
         if user_sub:
             params = {"username": str(user_sub)}
 
-        response = requests.get(
+        response = get_dimail_transport().request(
+            "/token/",
+            "GET",
             f"{self.API_URL}/token/",
             headers={"Authorization": f"Basic {self.API_CREDENTIALS}"},
             params=params,
-            timeout=20,
         )
 
         if response.status_code == status.HTTP_200_OK:
-            headers["Authorization"] = f"Bearer {response.json()['access_token']}"
             logger.info("Token succesfully granted by mail-provisioning API.")
-            return headers
+            return response.json()["access_token"]
 
         if response.status_code == status.HTTP_403_FORBIDDEN:
             logger.error(
@@ -77,6 +296,27 @@ class DimailAPIClient:
 
         return self.raise_exception_for_unexpected_response(response)
 
+    def _request_with_token(self, endpoint, method, url, user_sub=None, **kwargs):
+        """
+        Send a request to dimail authenticated with a token, getting a new one and
+        sending the request again if the cached token was rejected.
+        """
+        transport = get_dimail_transport()
+        response = transport.request(
+            endpoint, method, url, headers=self.get_headers(user_sub), **kwargs
+        )
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            logger.info("Token rejected by mail-provisioning API, getting a new one.")
+            response.close()
+            response = transport.request(
+                endpoint,
+                method,
+                url,
+                headers=self.get_headers(user_sub, force_refresh=True),
+                **kwargs,
+            )
+        return response
+
     def create_domain(self, domain_name, request_user):
         """Send a domain creation request to dimail API."""
 
@@ -87,12 +327,13 @@ class DimailAPIClient:
             "delivery": "virtual",
         }
         try:
-            response = session.post(
+            response = get_dimail_transport().request(
+                "/domains/",
+                "POST",
                 f"{self.API_URL}/domains/",
                 json=payload,
                 headers={"Authorization": f"Basic {self.API_CREDENTIALS}"},
                 verify=True,
-                timeout=10,
             )
         except requests.exceptions.ConnectionError as error:
             logger.error(
@@ -120,15 +361,14 @@ class DimailAPIClient:
             "surName": mailbox["last_name"],
             "displayName": f"{mailbox['first_name']} {mailbox['last_name']}",
         }
-        headers = self.get_headers(user_sub)
-
         try:
-            response = session.post(
+            response = self._request_with_token(
+                "/domains/{name}/mailboxes/{local_part}",
+                "POST",
                 f"{self.API_URL}/domains/{mailbox['domain']}/mailboxes/{mailbox['local_part']}",
+                user_sub,
                 json=payload,
-                headers=headers,
                 verify=True,
-                timeout=10,
             )
         except requests.exceptions.ConnectionError as error:
             logger.error(
@@ -146,6 +386,14 @@ class DimailAPIClient:
             )
             return response
 
+        if response.status_code == status.HTTP_409_CONFLICT:
+            logger.warning(
+                "[DIMAIL] Attempt to create mailbox %s@%s which already exists.",
+                mailbox["local_part"],
+                str(mailbox["domain"]),
+            )
+            return response
+
         if response.status_code == status.HTTP_403_FORBIDDEN:
             logger.error(
                 "[DIMAIL] 403 Forbidden: you cannot access domain %s",
@@ -163,12 +411,13 @@ class DimailAPIClient:
         payload = {"name": user_sub, "password": "no", "is_admin": "false", "perms": []}
 
         try:
-            response = session.post(
+            response = get_dimail_transport().request(
+                "/users/",
+                "POST",
                 f"{self.API_URL}/users/",
                 headers={"Authorization": f"Basic {self.API_CREDENTIALS}"},
                 json=payload,
                 verify=True,
-                timeout=10,
             )
         except requests.exceptions.ConnectionError as error:
             logger.error(
@@ -203,12 +452,13 @@ class DimailAPIClient:
         }
 
         try:
-            response = session.post(
+            response = get_dimail_transport().request(
+                "/allows/",
+                "POST",
                 f"{self.API_URL}/allows/",
                 headers={"Authorization": f"Basic {self.API_CREDENTIALS}"},
                 json=payload,
                 verify=True,
-                timeout=10,
             )
         except requests.exceptions.ConnectionError as error:
             logger.error(
@@ -253,13 +503,17 @@ class DimailAPIClient:
         )
         raise requests.exceptions.HTTPError(
             f"Unexpected response from dimail: {response.status_code} "
-            f"{error_content.get('detail') or error_content}"
+            f"{error_content.get('detail') or error_content}",
+            response=response,
         )
 
-    def notify_mailbox_creation(self, recipient, mailbox_data):
+    def get_mailbox_creation_message(self, recipient, mailbox_data):
         """
-        Send email to confirm mailbox creation
-        and send new mailbox information.
+        Return the email confirming the creation of a mailbox and holding its
+        information, to send with `send_messages`.
+
+        The email holds the password of the mailbox: it must not go through the
+        mail queue, whose messages are stored by the broker.
         """
 
         template_vars = {
@@ -269,41 +523,34 @@ class DimailAPIClient:
             "mailbox_data": mailbox_data,
         }
 
-        msg_html = render_to_string("mail/html/new_mailbox.html", template_vars)
-        msg_plain = render_to_string("mail/text/new_mailbox.txt", template_vars)
+        msg_html, msg_plain = render_email("new_mailbox", template_vars)
 
-        try:
-            mail.send_mail(
-                template_vars["title"],
-                msg_plain,
-                settings.EMAIL_FROM,
-                [recipient],
-                html_message=msg_html,
-                fail_silently=False,
-            )
-            logger.info(
-                "Information for mailbox %s sent to %s.",
-                mailbox_data["email"],
-                recipient,
-            )
-        except smtplib.SMTPException as exception:
-            logger.error(
-                "Mailbox confirmation email to %s was not sent: %s",
-                recipient,
-                exception,
-            )
+        return build_message(
+            template_vars["title"],
+            msg_plain,
+            settings.EMAIL_FROM,
+            [recipient],
+            html_message=msg_html,
+        )
 
     def import_mailboxes(self, domain):
         """Import mailboxes from dimail - open xchange in our database.
         This is useful in case of acquisition of a pre-existing mail domain.
-        Mailboxes created here are not new mailboxes and will not trigger mail notification."""
+        Mailboxes created here are not new mailboxes and will not trigger mail notification.
+
+        The list of mailboxes is parsed as it is downloaded and imported by chunks of
+        MAILBOX_IMPORT_BATCH_SIZE mailboxes, each committed on its own: memory stays
+        bounded and an interrupted import resumes where it stopped when run again.
+        """
 
         try:
-            response = session.get(
+            response = self._request_with_token(
+                "/domains/{name}/mailboxes/",
+                "GET",
                 f"{self.API_URL}/domains/{domain.name}/mailboxes/",
-                headers=self.get_headers(),
                 verify=True,
-                timeout=10,
+                # the read timeout applies to each read of the stream, not to the download
+                stream=True,
             )
         except requests.exceptions.ConnectionError as error:
             logger.error(
@@ -316,54 +563,114 @@ class DimailAPIClient:
         if response.status_code != status.HTTP_200_OK:
             return self.raise_exception_for_unexpected_response(response)
 
-        dimail_mailboxes = ast.literal_eval(
-            response.content.decode("utf-8")
-        )  # format output str to proper list
-
-        people_mailboxes = models.Mailbox.objects.filter(domain=domain)
         imported_mailboxes = []
-        for dimail_mailbox in dimail_mailboxes:
-            if not dimail_mailbox["email"] in [
-                str(people_mailbox) for people_mailbox in people_mailboxes
-            ]:
-                try:
-                    # sometimes dimail api returns email from another domain,
-                    # so we decide to exclude this kind of email
-                    address = Address(addr_spec=dimail_mailbox["email"])
-                    if address.domain == domain.name:
-                        # creates a mailbox on our end
-                        mailbox = models.Mailbox.objects.create(
-                            first_name=dimail_mailbox["givenName"],
-                            last_name=dimail_mailbox["surName"],
-                            local_part=address.username,
-                            domain=domain,
-                            secondary_email=dimail_mailbox[
-                                "email"
-                            ],  # secondary email is mandatory. Unfortunately, dimail doesn't
-                            # store any. We temporarily give current email as secondary email.
-                        )
-                        imported_mailboxes.append(str(mailbox))
-                    else:
-                        logger.warning(
-                            "Import of email %s failed because of a wrong domain",
-                            dimail_mailbox["email"],
-                        )
-                except (HeaderParseError, NonASCIILocalPartDefect) as err:
-                    logger.warning(
-                        "Import of email %s failed with error %s",
-                        dimail_mailbox["email"],
-                        err,
-                    )
+        with response:
+            dimail_mailboxes = iter_json_array(
+                codecs.iterdecode(
+                    response.iter_content(chunk_size=MAILBOX_IMPORT_CHUNK_SIZE), "utf-8"
+                )
+            )
+            try:
+                while batch := list(
+                    itertools.islice(dimail_mailboxes, MAILBOX_IMPORT_BATCH_SIZE)
+                ):
+                    imported_mailboxes += self._import_mailboxes_batch(domain, batch)
+            except (requests.exceptions.RequestException, ValueError):
+                logger.error(
+                    "Import of mailboxes of domain %s interrupted after %s imports.",
+                    domain.name,
+                    len(imported_mailboxes),
+                )
+                raise
         return imported_mailboxes
 
+    def _import_mailboxes_batch(self, domain, dimail_mailboxes):
+        """Create the mailboxes of a batch of dimail mailboxes missing on our end."""
+        mailboxes = {}
+        for dimail_mailbox in dimail_mailboxes:
+            try:
+                address = Address(addr_spec=dimail_mailbox["email"])
+            except (HeaderParseError, NonASCIILocalPartDefect) as err:
+                logger.warning(
+                    "Import of email %s failed with error %s",
+                    dimail_mailbox["email"],
+                    err,
+                )
+                continue
+
+            # sometimes dimail api returns email from another domain,
+            # so we decide to exclude this kind of email
+            if address.domain != domain.name:
+                logger.warning(
+                    "Import of email %s failed because of a wrong domain",
+                    dimail_mailbox["email"],
+                )
+                continue
+
+            mailboxes.setdefault(address.username, dimail_mailbox)
+
+        # Only local parts are compared: dimail mailboxes of another domain are excluded
+        known_local_parts = set(
+            models.Mailbox.objects.filter(
+                domain=domain, local_part__in=mailboxes
+            ).values_list("local_part", flat=True)
+        )
+        new_mailboxes = []
+        for local_part, dimail_mailbox in mailboxes.items():
+            if local_part in known_local_parts:
+                continue
+
+            mailbox = models.Mailbox(
+                first_name=dimail_mailbox["givenName"],
+                last_name=dimail_mailbox["surName"],
+                local_part=local_part,
+                domain=domain,
+                # secondary email is mandatory. Unfortunately, dimail doesn't
+                # store any. We temporarily give current email as secondary email.
+                secondary_email=dimail_mailbox["email"],
+            )
+            try:
+                # The domain is known to exist and uniqueness is checked above:
+                # validating the fields does not need any query
+                mailbox.full_clean(exclude=["domain"], validate_unique=False)
+            except exceptions.ValidationError as err:
+                logger.warning(
+                    "Import of email %s failed with error %s",
+                    dimail_mailbox["email"],
+                    err,
+                )
+                continue
+            new_mailboxes.append(mailbox)
+
+        if new_mailboxes and domain.status == enums.MailDomainStatusChoices.DISABLED:
+            raise exceptions.ValidationError(
+                _("You can't create or update a mailbox for a disabled domain.")
+            )
+        # Mailboxes created meanwhile on our end are ignored: only the rows actually
+        # inserted bear the ids generated here
+        if not new_mailboxes:
+            return []
+        models.Mailbox.objects.bulk_create(new_mailboxes, ignore_conflicts=True)
+        created_ids = set(
+            models.Mailbox.objects.filter(
+                pk__in=[mailbox.pk for mailbox in new_mailboxes]
+            ).values_list("pk", flat=True)
+        )
+        return [
+            f"{mailbox.local_part}@{domain.name}"
+            for mailbox in new_mailboxes
+            if mailbox.pk in created_ids
+        ]
+
     def disable_mailbox(self, mailbox, user_sub=None):
         """Send a request to disable a mailbox to dimail API"""
-        response = session.patch(
+        response = self._request_with_token(
+            "/domains/{name}/mailboxes/{local_part}",
+            "PATCH",
             f"{self.API_URL}/domains/{mailbox.domain.name}/mailboxes/{mailbox.local_part}",
+            user_sub,
             json={"active": "no"},
-            headers=self.get_headers(user_sub),
             verify=True,
-            timeout=10,
         )
         if response.status_code == status.HTTP_200_OK:
             logger.info(
@@ -377,17 +684,18 @@ class DimailAPIClient:
 
     def enable_mailbox(self, mailbox, user_sub=None):
         """Send a request to enable a mailbox to dimail API"""
-        response = session.patch(
+        response = self._request_with_token(
+            "/domains/{name}/mailboxes/{local_part}",
+            "PATCH",
             f"{self.API_URL}/domains/{mailbox.domain.name}/mailboxes/{mailbox.local_part}",
+            user_sub,
             json={
                 "active": "yes",
                 "givenName": mailbox.first_name,
                 "surName": mailbox.last_name,
                 "displayName": f"{mailbox.first_name} {mailbox.last_name}",
             },
-            headers=self.get_headers(user_sub),
             verify=True,
-            timeout=10,
         )
         if response.status_code == status.HTTP_200_OK:
             logger.info(
@@ -399,27 +707,90 @@ class DimailAPIClient:
             return response
         return self.raise_exception_for_unexpected_response(response)
 
-    def fetch_domain_status(self, domain):
-        """Send a request to check domain and update status of our domain."""
-        response = session.get(
+    def check_domain(self, domain):
+        """Send a request to dimail to check a domain and return its response."""
+        get_domain_check_rate_limiter().wait()
+        response = get_dimail_transport().request(
+            "/domains/{name}/check/",
+            "GET",
             f"{self.API_URL}/domains/{domain.name}/check/",
             headers={"Authorization": f"Basic {self.API_CREDENTIALS}"},
             verify=True,
-            timeout=10,
         )
         if response.status_code == status.HTTP_200_OK:
-            dimail_status = response.json()["state"]
-            if (
-                domain.status != enums.MailDomainStatusChoices.ENABLED
-                and dimail_status == "ok"
-            ):
-                domain.status = enums.MailDomainStatusChoices.ENABLED
-                domain.save()
-            elif (
-                domain.status != enums.MailDomainStatusChoices.FAILED
-                and dimail_status == "broken"
-            ):
-                domain.status = enums.MailDomainStatusChoices.FAILED
-                domain.save()
             return response
         return self.raise_exception_for_unexpected_response(response)
+
+    @staticmethod
+    def get_status_from_check(domain, response):
+        """Return the status of a domain according to its check by dimail."""
+        dimail_status = response.json()["state"]
+        if dimail_status == "ok":
+            return enums.MailDomainStatusChoices.ENABLED
+        if dimail_status == "broken":
+            return enums.MailDomainStatusChoices.FAILED
+        return domain.status
+
+    def fetch_domain_status(self, domain):
+        """Send a request to check domain and update status of our domain."""
+        response = self.check_domain(domain)
+        domain.status = self.get_status_from_check(domain, response)
+        domain.last_checked_at = timezone.now()
+        domain.save()
+        return response
+
+    def fetch_domains_status(self, domains, max_workers=None):
+        """
+        Check domains concurrently with dimail, within the limit of the
+        MAIL_DOMAIN_CHECK_RATE_LIMIT setting, then update their status at once.
+
+        The last check date of domains is updated even when the check failed, so
+        that an unreachable domain does not keep being checked first.
+
+        Return the check of each domain, in the same order as the domains.
+        """
+
+        def check(domain):
+            start = time.monotonic()
+            try:
+                response = self.check_domain(domain)
+            except requests.exceptions.RequestException as error:
+                return DomainCheck(
+                    domain, domain.status, None, error, time.monotonic() - start
+                )
+            return DomainCheck(
+                domain, domain.status, response, None, time.monotonic() - start
+            )
+
+        domains = list(domains)
+        if not domains:
+            return []
+
+        with ThreadPoolExecutor(
+            max_workers=min(
+                len(domains), max_workers or settings.MAIL_DOMAIN_CHECK_MAX_WORKERS
+            )
+        ) as executor:
+            checks = list(executor.map(check, domains))
+
+        now = timezone.now()
+        for index, domain_check in enumerate(checks):
+            domain = domain_check.domain
+            domain.last_checked_at = now
+            if domain_check.response is None:
+                continue
+            try:
+                new_status = self.get_status_from_check(domain, domain_check.response)
+            except (ValueError, KeyError, TypeError) as error:
+                # A malformed response only fails the check of its domain
+                checks[index] = domain_check._replace(error=error)
+                continue
+            if new_status != domain.status:
+                domain.status = new_status
+                domain.updated_at = now
+        models.MailDomain.objects.bulk_update(
+            [domain_check.domain for domain_check in checks],
+            ["status", "updated_at", "last_checked_at"],
+        )
+
+        return checks
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/3.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
+# pylint: disable=too-many-lines
 
 import json
 import os
@@ -175,9 +176,16 @@ class Base(Configuration):
                     "django.template.context_processors.request",
                     "django.template.context_processors.tz",
                 ],
+                # Templates are compiled once per process, and reloaded on changes
+                # in development
                 "loaders": [
-                    "django.template.loaders.filesystem.Loader",
-                    "django.template.loaders.app_directories.Loader",
+                    (
+                        "django.template.loaders.cached.Loader",
+                        [
+                            "django.template.loaders.filesystem.Loader",
+                            "django.template.loaders.app_directories.Loader",
+                        ],
+                    ),
                 ],
             },
         },
@@ -296,6 +304,17 @@ class Base(Configuration):
     EMAIL_USE_TLS = values.BooleanValue(False)
     EMAIL_USE_SSL = values.BooleanValue(False)
     EMAIL_FROM = values.Value("from@example.com")
+    # Number of emails sent by a worker over a single connection to the mail relay
+    EMAIL_BATCH_SIZE = values.PositiveIntegerValue(
+        default=100, environ_name="EMAIL_BATCH_SIZE", environ_prefix=None
+    )
+    EMAIL_MAX_RETRIES = values.PositiveIntegerValue(
+        default=5, environ_name="EMAIL_MAX_RETRIES", environ_prefix=None
+    )
+    # Delay before sending again emails which failed, doubled at each retry, in seconds
+    EMAIL_RETRY_DELAY = values.PositiveIntegerValue(
+        default=60, environ_name="EMAIL_RETRY_DELAY", environ_prefix=None
+    )
     AUTH_USER_MODEL = "core.User"
     INVITATION_VALIDITY_DURATION = 604800  # 7 days, in seconds
 
@@ -318,6 +337,38 @@ class Base(Configuration):
     CELERY_BROKER_URL = values.Value("redis://redis:6379/0")
     CELERY_BROKER_TRANSPORT_OPTIONS = values.DictValue({})
 
+    # Webhooks
+    # Number of webhooks whose pending events are delivered by a worker at a time
+    WEBHOOKS_BATCH_SIZE = values.PositiveIntegerValue(
+        default=100, environ_name="WEBHOOKS_BATCH_SIZE", environ_prefix=None
+    )
+    # Number of seconds for which a worker owns the events it delivers, the events
+    # of a worker lost meanwhile being delivered again once it expires
+    WEBHOOKS_LEASE_DURATION = values.PositiveIntegerValue(
+        default=300, environ_name="WEBHOOKS_LEASE_DURATION", environ_prefix=None
+    )
+    # Number of events of a webhook delivered at most by a worker at a time, so that
+    # their calls end well before their lease expires
+    WEBHOOKS_EVENTS_PER_CLAIM = values.PositiveIntegerValue(
+        default=5, environ_name="WEBHOOKS_EVENTS_PER_CLAIM", environ_prefix=None
+    )
+    WEBHOOKS_MAX_RETRIES = values.PositiveIntegerValue(
+        default=5, environ_name="WEBHOOKS_MAX_RETRIES", environ_prefix=None
+    )
+    # Maximum number of webhooks of a team called at the same time
+    WEBHOOKS_MAX_WORKERS = values.PositiveIntegerValue(
+        default=10, environ_name="WEBHOOKS_MAX_WORKERS", environ_prefix=None
+    )
+    # Delay before retrying a failed webhook call, doubled on each new retry
+    WEBHOOKS_RETRY_DELAY = values.PositiveIntegerValue(
+        default=30, environ_name="WEBHOOKS_RETRY_DELAY", environ_prefix=None
+    )
+    # Number of seconds between two periodic deliveries of the pending events, in
+    # case the delivery scheduled for them was lost
+    WEBHOOKS_DELIVERY_SCHEDULE = values.PositiveIntegerValue(
+        default=300, environ_name="WEBHOOKS_DELIVERY_SCHEDULE", environ_prefix=None
+    )
+
     # Session
     SESSION_ENGINE = "django.contrib.sessions.backends.cache"
     SESSION_CACHE_ALIAS = "default"
@@ -436,6 +487,16 @@ class Base(Configuration):
     OIDC_RS_SCOPES = values.ListValue(
         ["groups"], environ_name="OIDC_RS_SCOPES", environ_prefix=None
     )
+    OIDC_RS_INTROSPECTION_CACHE_TIMEOUT = values.IntegerValue(
+        default=60,
+        environ_name="OIDC_RS_INTROSPECTION_CACHE_TIMEOUT",
+        environ_prefix=None,
+    )
+    OIDC_RS_INTROSPECTION_NEGATIVE_CACHE_TIMEOUT = values.IntegerValue(
+        default=10,
+        environ_name="OIDC_RS_INTROSPECTION_NEGATIVE_CACHE_TIMEOUT",
+        environ_prefix=None,
+    )
     OIDC_PROXY = values.Value(None, environ_name="OIDC_PROXY", environ_prefix=None)
 
     OIDC_VERIFY_SSL = values.BooleanValue(
@@ -443,6 +504,22 @@ class Base(Configuration):
     )
 
     OIDC_TIMEOUT = values.Value(None, environ_name="OIDC_TIMEOUT", environ_prefix=None)
+    OIDC_OP_POOL_MAXSIZE = values.PositiveIntegerValue(
+        default=10, environ_name="OIDC_OP_POOL_MAXSIZE", environ_prefix=None
+    )
+    OIDC_OP_MAX_RETRIES = values.IntegerValue(
+        default=2, environ_name="OIDC_OP_MAX_RETRIES", environ_prefix=None
+    )
+    OIDC_OP_JWKS_CACHE_TIMEOUT = values.PositiveIntegerValue(
+        default=3600, environ_name="OIDC_OP_JWKS_CACHE_TIMEOUT", environ_prefix=None
+    )
+    # Minimum number of seconds between two refreshes of the JWKS forced by tokens
+    # signed with an unknown key
+    OIDC_OP_JWKS_MIN_REFRESH_INTERVAL = values.PositiveIntegerValue(
+        default=60,
+        environ_name="OIDC_OP_JWKS_MIN_REFRESH_INTERVAL",
+        environ_prefix=None,
+    )
     OIDC_FALLBACK_TO_EMAIL_FOR_IDENTIFICATION = values.BooleanValue(
         default=True,
         environ_name="OIDC_FALLBACK_TO_EMAIL_FOR_IDENTIFICATION",
@@ -465,6 +542,104 @@ class Base(Configuration):
         environ_name="MAIL_PROVISIONING_API_CREDENTIALS",
         environ_prefix=None,
     )
+    # Maximum duration of the cache of tokens granted by the mail provisioning API,
+    # also bounded by their expiration time
+    MAIL_PROVISIONING_API_TOKEN_CACHE_TIMEOUT = values.PositiveIntegerValue(
+        default=3600,
+        environ_name="MAIL_PROVISIONING_API_TOKEN_CACHE_TIMEOUT",
+        environ_prefix=None,
+    )
+    # Number of threads of each gunicorn worker, read by the gunicorn configuration
+    GUNICORN_THREADS = values.PositiveIntegerValue(
+        default=1,
+        environ_name="GUNICORN_THREADS",
+        environ_prefix=None,
+    )
+    # Maximum number of connections kept open to the mail provisioning API, 0 to
+    # allow a connection per gunicorn thread or concurrent domain check
+    MAIL_PROVISIONING_API_POOL_MAXSIZE = values.PositiveIntegerValue(
+        default=0,
+        environ_name="MAIL_PROVISIONING_API_POOL_MAXSIZE",
+        environ_prefix=None,
+    )
+    # Number of seconds to wait for a connection to the mail provisioning API
+    MAIL_PROVISIONING_API_CONNECT_TIMEOUT = values.PositiveIntegerValue(
+        default=3,
+        environ_name="MAIL_PROVISIONING_API_CONNECT_TIMEOUT",
+        environ_prefix=None,
+    )
+    # Number of seconds to wait for data from the mail provisioning API
+    MAIL_PROVISIONING_API_READ_TIMEOUT = values.PositiveIntegerValue(
+        default=10,
+        environ_name="MAIL_PROVISIONING_API_READ_TIMEOUT",
+        environ_prefix=None,
+    )
+    # Number of retries of idempotent requests to the mail provisioning API
+    MAIL_PROVISIONING_API_MAX_RETRIES = values.PositiveIntegerValue(
+        default=2,
+        environ_name="MAIL_PROVISIONING_API_MAX_RETRIES",
+        environ_prefix=None,
+    )
+    # Requests to the mail provisioning API lasting longer are logged as warnings
+    MAIL_PROVISIONING_API_SLOW_REQUEST_DURATION = values.PositiveIntegerValue(
+        default=2,
+        environ_name="MAIL_PROVISIONING_API_SLOW_REQUEST_DURATION",
+        environ_prefix=None,
+    )
+    # Number of retries of the provisioning of a mailbox when dimail is unavailable
+    MAILBOX_PROVISIONING_MAX_RETRIES = values.PositiveIntegerValue(
+        default=5,
+        environ_name="MAILBOX_PROVISIONING_MAX_RETRIES",
+        environ_prefix=None,
+    )
+    # Delay before retrying the provisioning of a mailbox, doubled on each new retry
+    MAILBOX_PROVISIONING_RETRY_DELAY = values.PositiveIntegerValue(
+        default=30,
+        environ_name="MAILBOX_PROVISIONING_RETRY_DELAY",
+        environ_prefix=None,
+    )
+    # Maximum number of mail domains checked at the same time with dimail
+    MAIL_DOMAIN_CHECK_MAX_WORKERS = values.PositiveIntegerValue(
+        default=10,
+        environ_name="MAIL_DOMAIN_CHECK_MAX_WORKERS",
+        environ_prefix=None,
+    )
+    # Maximum number of mail domain checks sent to dimail per second, 0 for no limit
+    MAIL_DOMAIN_CHECK_RATE_LIMIT = values.PositiveIntegerValue(
+        default=20,
+        environ_name="MAIL_DOMAIN_CHECK_RATE_LIMIT",
+        environ_prefix=None,
+    )
+    # Number of seconds between two periodic checks of mail domains
+    MAIL_DOMAIN_CHECK_SCHEDULE = values.PositiveIntegerValue(
+        default=300,
+        environ_name="MAIL_DOMAIN_CHECK_SCHEDULE",
+        environ_prefix=None,
+    )
+    # Number of seconds after which an enabled domain is checked again
+    MAIL_DOMAIN_CHECK_INTERVAL = values.PositiveIntegerValue(
+        default=86400,
+        environ_name="MAIL_DOMAIN_CHECK_INTERVAL",
+        environ_prefix=None,
+    )
+    # Number of seconds after which a pending or failed domain is checked again
+    MAIL_DOMAIN_CHECK_UNHEALTHY_INTERVAL = values.PositiveIntegerValue(
+        default=600,
+        environ_name="MAIL_DOMAIN_CHECK_UNHEALTHY_INTERVAL",
+        environ_prefix=None,
+    )
+    # Maximum number of mail domains checked by a periodic check
+    MAIL_DOMAIN_CHECK_BATCH_SIZE = values.PositiveIntegerValue(
+        default=1000,
+        environ_name="MAIL_DOMAIN_CHECK_BATCH_SIZE",
+        environ_prefix=None,
+    )
+    # Number of tasks between which the mail domains of a periodic check are split
+    MAIL_DOMAIN_CHECK_SHARDS = values.PositiveIntegerValue(
+        default=4,
+        environ_name="MAIL_DOMAIN_CHECK_SHARDS",
+        environ_prefix=None,
+    )
 
     # Organizations
     ORGANIZATION_REGISTRATION_ID_VALIDATORS = json.loads(
@@ -539,6 +714,24 @@ class Base(Configuration):
             },
         }
 
+    # pylint: disable=invalid-name
+    @property
+    def CELERY_BEAT_SCHEDULE(self):
+        """
+        Return the periodic tasks run by celery beat.
+        """
+        return {
+            "check-mail-domains": {
+                "task": "mailbox_manager.tasks.check_domains",
+                "schedule": self.MAIL_DOMAIN_CHECK_SCHEDULE,
+            },
+            "deliver-webhook-events": {
+                "task": "core.tasks.deliver_webhook_events",
+                "schedule": self.WEBHOOKS_DELIVERY_SCHEDULE,
+                "kwargs": {"schedule_retries": False},
+            },
+        }
+
     @classmethod
     def post_setup(cls):
         """Post setup configuration.